@@ -0,0 +1,2 @@
+from .benchmark import *
+from .cases import *
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import platform
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+
+from .cases import QUICK_SIZES, get_benchmark_cases
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.25
+
+
+def run_benchmarks(cases: dict, repeat: int = 3, pattern: str = None) -> dict:
+    """Measures the time and the peak memory of every benchmark case.
+
+    The time is the fastest of `repeat` runs. The peak memory is traced in a separate run, so tracing does not slow
+    down the timed runs.
+
+    Args:
+        cases (dict): name -> (setup, run), see `get_benchmark_cases`
+        repeat (int): Number of timed runs per case
+        pattern (str, optional): Only run cases containing `pattern`
+
+    Returns:
+        dict: name -> {"time": seconds, "peak_memory": bytes}
+    """
+    results = {}
+    for name, (setup, run) in cases.items():
+        if pattern is not None and pattern not in name:
+            continue
+
+        times = []
+        for _ in range(repeat):
+            args = setup()
+            start_time = perf_counter()
+            run(args)
+            times.append(perf_counter() - start_time)
+
+        args = setup()
+        tracemalloc.start()
+        run(args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {"time": min(times), "peak_memory": peak_memory}
+    return results
+
+
+def save_baseline(results: dict, path: str = DEFAULT_BASELINE_PATH):
+    baseline = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        f.write(json.dumps(baseline, indent=2))
+
+
+def load_baseline(path: str = DEFAULT_BASELINE_PATH) -> dict:
+    with open(path, "r") as f:
+        return json.loads(f.read())["results"]
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance=DEFAULT_TOLERANCE, memory_tolerance=None) -> list:
+    """Returns the regressions of `results` against `baseline`.
+
+    Args:
+        results (dict): Current results, see `run_benchmarks`
+        baseline (dict): Baseline results
+        tolerance (float): Allowed relative increase of the time
+        memory_tolerance (float, optional): Allowed relative increase of the peak memory, defaults to `tolerance`
+
+    Returns:
+        list: One message per regressed case and metric, empty if nothing regressed
+    """
+    memory_tolerance = tolerance if memory_tolerance is None else memory_tolerance
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, metric_tolerance in [("time", tolerance), ("peak_memory", memory_tolerance)]:
+            ratio = result[metric] / baseline[name][metric] if baseline[name][metric] > 0 else 1.0
+            if ratio > 1 + metric_tolerance:
+                regressions.append(
+                    f"{name}: {metric} {result[metric]:.4g} vs. baseline {baseline[name][metric]:.4g} "
+                    f"(+{(ratio - 1) * 100:.0f}%, tolerance {metric_tolerance * 100:.0f}%)"
+                )
+    return regressions
+
+
+def format_results(results: dict, baseline: dict = None) -> str:
+    width = max(len(name) for name in results.keys())
+    lines = [f"{'case':<{width}}  {'time [ms]':>10}  {'peak [MiB]':>10}  {'vs. baseline':>12}"]
+    for name, result in results.items():
+        line = f"{name:<{width}}  {result['time'] * 1000:>10.2f}  {result['peak_memory'] / 2**20:>10.2f}"
+        if baseline is not None and name in baseline:
+            line += f"  {result['time'] / baseline[name]['time']:>11.2f}x"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of the calculation hot paths")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="path of the baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown")
+    parser.add_argument("--memory-tolerance", type=float, default=None, help="allowed relative memory increase")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="only run the smallest sizes")
+    parser.add_argument("-k", dest="pattern", default=None, help="only run cases containing this string")
+    args = parser.parse_args(argv)
+
+    cases = get_benchmark_cases(QUICK_SIZES if args.quick else None)
+    results = run_benchmarks(cases, args.repeat, args.pattern)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(format_results(results))
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline) if os.path.exists(args.baseline) else None
+    print(format_results(results, baseline))
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+import historical_data_analysis as hda
+import simulation
+
+from .synthetic_data import get_synthetic_history
+
+REGULAR_INVESTMENTS = {"monthly_money": 100, "quarterly_money": 50, "bi_annual_money": 0, "annual_money": 500}
+
+# regular investments with growing contributions, a pause and a withdrawal
+CASHFLOW_INVESTMENTS = {
+    **REGULAR_INVESTMENTS,
+    "contribution_growth": 0.02,
+    "lump_sums": [{"month": 13, "amount": 5000}, {"month": 50, "amount": -2000}],
+    "pauses": [{"start": 24, "end": 36}],
+}
+
+# benchmark sizes, the "quick" sizes run in the test suite
+SIZES = {
+    "months": [60, 240, 600],
+    "loop_months": [60, 240],
+    "symbols": [2, 20, 100],
+    "dataframe_iterations": [10, 50],
+    "iterations": [1_000, 100_000],
+}
+QUICK_SIZES = {
+    "months": [60],
+    "loop_months": [24],
+    "symbols": [2],
+    "dataframe_iterations": [5],
+    "iterations": [1_000],
+}
+
+
+def get_benchmark_history(number_of_months: int, seed: int = 0) -> pd.DataFrame:
+    # cleaned monthly series with a fixed end, filtered like in `past_stock_investment_outcome` (adds month numbers)
+    df = get_synthetic_history(number_of_months, seed, end="2024-12-31")
+    return hda.filter_data(df, {"start_date": "1900-01"})
+
+
+def get_stock_config(number_of_months: int) -> dict:
+    return {
+        "symbol": "SYN",
+        "investment_time": number_of_months // 12,
+        "initial_investment": 1000,
+        "monthly_investment": 100,
+        "quarter_investment": 50,
+        "bi_annual_investment": 0,
+        "annual_investment": 500,
+    }
+
+
+def get_benchmark_cases(sizes: dict = None) -> dict:
+    """Returns the benchmark cases of the calculation hot paths.
+
+    Every case is a `setup` function returning the inputs and a `run` function taking them, so only `run` is measured.
+
+    Args:
+        sizes (dict, optional): Sizes per parameter, defaults to `SIZES`
+
+    Returns:
+        dict: name -> (setup, run)
+    """
+    sizes = SIZES if sizes is None else sizes
+    cases = {}
+
+    for months in sizes["months"]:
+        cases[f"calculate_returns[vectorized,months={months}]"] = (
+            lambda months=months: get_benchmark_history(months),
+            lambda df: hda.calculate_returns(df, 1000, REGULAR_INVESTMENTS, True),
+        )
+        cases[f"calculate_cashflows[months={months}]"] = (
+            lambda months=months: months,
+            lambda months: hda.calculate_cashflows(CASHFLOW_INVESTMENTS, months, 1000),
+        )
+    for months in sizes["loop_months"]:
+        cases[f"calculate_returns[loop,months={months}]"] = (
+            lambda months=months: get_benchmark_history(months),
+            lambda df: hda.calculate_returns(df, 1000, REGULAR_INVESTMENTS, True, engine="loop"),
+        )
+
+    for symbols in sizes["symbols"]:
+        cases[f"combine_data[symbols={symbols},months=240]"] = (
+            lambda symbols=symbols: get_symbol_data(symbols, 240),
+            hda.combine_data,
+        )
+
+    # DataFrame reference simulation, split into its stages
+    for iterations in sizes["dataframe_iterations"]:
+        cases[f"simulate_data[iterations={iterations},months=60]"] = (
+            lambda iterations=iterations: (get_stock_config(60), 0.006, 0.04, 60, iterations),
+            lambda args: simulation.simulate_data(*args),
+        )
+        cases[f"calculate_outcome[iterations={iterations},months=60]"] = (
+            lambda iterations=iterations: get_simulated_data(iterations, 60),
+            lambda args: simulation.calculate_outcome(args[0], 60, args[1]),
+        )
+        cases[f"summarize_simulation_outcome[iterations={iterations},months=60]"] = (
+            lambda iterations=iterations: get_calculated_outcome(iterations, 60),
+            lambda args: simulation.summarize_simulation_outcome(args[0], args[1], 60, args[2]),
+        )
+
+    for iterations in sizes["iterations"]:
+        cases[f"simulate_outcome[array,iterations={iterations},months=240]"] = (
+            lambda iterations=iterations: iterations,
+            lambda iterations: simulation.simulate_outcome(get_stock_config(240), 0.006, 0.04, iterations, seed=0),
+        )
+        cases[f"calculate_rebalanced_outcome[threshold,iterations={iterations},months=240]"] = (
+            lambda iterations=iterations: get_rebalancing_inputs(iterations, 240),
+            lambda args: simulation.calculate_rebalanced_outcome(*args, "threshold", band=0.05),
+        )
+        for return_model in simulation.RETURN_MODELS:
+            cases[f"simulate_changes[{return_model},iterations={iterations},months=240]"] = (
+                lambda iterations=iterations, return_model=return_model: (get_return_model(return_model), iterations),
+                lambda args: simulation.simulate_changes(0.006, 0.04, 240, args[1], np.random.default_rng(0), args[0]),
+            )
+
+    return cases
+
+
+def get_symbol_data(number_of_symbols: int, number_of_months: int) -> dict:
+    data = {}
+    for i in range(number_of_symbols):
+        # symbols start in different months, like portfolios mixing older and younger funds
+        df = get_benchmark_history(number_of_months - i % 24, seed=i)
+        data[f"SYN{i}"] = hda.calculate_returns(df, 1000, REGULAR_INVESTMENTS, True)
+    return data
+
+
+def get_simulated_data(iterations: int, number_of_months: int) -> tuple:
+    np.random.seed(0)
+    stock_config = get_stock_config(number_of_months)
+    return simulation.simulate_data(stock_config, 0.006, 0.04, number_of_months, iterations), iterations
+
+
+def get_calculated_outcome(iterations: int, number_of_months: int) -> tuple:
+    df_dict_simulated, _ = get_simulated_data(iterations, number_of_months)
+    df_dict_calc = simulation.calculate_outcome(df_dict_simulated, number_of_months, iterations)
+    return df_dict_simulated, df_dict_calc, iterations
+
+
+def get_return_model(return_model: str):
+    # fitted to the synthetic history, only the generation of the changes is measured
+    return simulation.get_return_model(return_model, get_benchmark_history(240)["change"].to_numpy())
+
+
+def get_rebalancing_inputs(iterations: int, number_of_months: int) -> tuple:
+    rng = np.random.default_rng(0)
+    changes = simulation.simulate_correlated_changes(
+        np.array([0.008, 0.004]), np.array([[0.0025, 0.001], [0.001, 0.0016]]), number_of_months, iterations, rng
+    )
+    flow = np.full(number_of_months, 100.0)
+    flow[0] = 1000
+    return changes, flow, [0.7, 0.3]
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from historical_data_analysis import clean_data
+
+
+def get_synthetic_time_series(number_of_months: int = 90, seed: int = 0, start: str = "2010-01-31") -> dict:
+    # mimics the "Monthly Adjusted Time Series" entry of the Alpha Vantage response
+    rng = np.random.default_rng(seed)
+    # drawn month by month, so a longer series extends a shorter one with the same seed
+    noise = rng.normal(size=(number_of_months, 2))
+    close = 50 * np.cumprod(1 + 0.006 + 0.045 * noise[:, 0])
+    open_ = close / (1 + 0.01 * noise[:, 1])
+    dividend_amount = np.where(np.arange(number_of_months) % 3 == 2, close * 0.004, 0.0)
+    dates = pd.date_range(start, periods=number_of_months, freq="ME").strftime("%Y-%m-%d")
+    time_series = {
+        date: {
+            "1. open": f"{open_[i]:.4f}",
+            "2. high": f"{max(open_[i], close[i]) * 1.02:.4f}",
+            "3. low": f"{min(open_[i], close[i]) * 0.98:.4f}",
+            "4. close": f"{close[i]:.4f}",
+            "5. adjusted close": f"{close[i]:.4f}",
+            "6. volume": str(1000 + i),
+            "7. dividend amount": f"{dividend_amount[i]:.4f}",
+        }
+        for i, date in enumerate(dates)
+    }
+    return dict(reversed(list(time_series.items())))
+
+
+def get_synthetic_raw_data(number_of_months: int = 90, seed: int = 0, start: str = "2010-01-31") -> pd.DataFrame:
+    # mimics the frame returned by `get_raw_data` (newest month first, values as strings)
+    return pd.DataFrame.from_dict(get_synthetic_time_series(number_of_months, seed, start), orient="index")
+
+
+def get_synthetic_history(number_of_months: int = 240, seed: int = 0, end: str = None) -> pd.DataFrame:
+    # cleaned monthly series ending in `end`, defaults to the current month so stored copies count as up to date
+    rng = np.random.default_rng(seed)
+    close = 50 * np.cumprod(1 + rng.normal(0.006, 0.045, number_of_months))
+    open_ = close / (1 + rng.normal(0.0, 0.01, number_of_months))
+    end = pd.Timestamp.now() + pd.offsets.MonthEnd(0) if end is None else end
+    dates = pd.date_range(end=end, periods=number_of_months, freq="ME")
+    df_raw = pd.DataFrame(
+        {
+            "1. open": open_,
+            "2. high": np.maximum(open_, close) * 1.02,
+            "3. low": np.minimum(open_, close) * 0.98,
+            "4. close": close,
+            "5. adjusted close": close,
+            "6. volume": np.arange(number_of_months) + 1000,
+            "7. dividend amount": np.where(np.arange(number_of_months) % 3 == 2, close * 0.004, 0.0),
+        },
+        index=dates.strftime("%Y-%m-%d"),
+    )
+    return clean_data(df_raw)
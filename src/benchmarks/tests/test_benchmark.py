@@ -0,0 +1,40 @@
+import benchmarks
+
+
+def test_quick_benchmarks_record_time_and_memory():
+    results = benchmarks.run_benchmarks(benchmarks.get_benchmark_cases(benchmarks.QUICK_SIZES), repeat=1)
+
+    assert "combine_data[symbols=2,months=240]" in results
+    assert "calculate_returns[loop,months=24]" in results
+    for result in results.values():
+        assert result["time"] > 0
+        assert result["peak_memory"] > 0
+
+
+def test_regressions_beyond_tolerance(tmp_path):
+    baseline = {"a": {"time": 1.0, "peak_memory": 100}, "b": {"time": 1.0, "peak_memory": 100}}
+    path = str(tmp_path / "baseline.json")
+    benchmarks.save_baseline(baseline, path)
+    assert benchmarks.load_baseline(path) == baseline
+
+    results = {
+        "a": {"time": 1.2, "peak_memory": 100},
+        "b": {"time": 0.5, "peak_memory": 200},
+        "c": {"time": 9, "peak_memory": 9},
+    }
+    assert benchmarks.compare_to_baseline(results, baseline, tolerance=0.25) == [
+        "b: peak_memory 200 vs. baseline 100 (+100%, tolerance 25%)"
+    ]
+    regressions = benchmarks.compare_to_baseline(results, baseline, tolerance=0.1, memory_tolerance=1.5)
+    assert len(regressions) == 1 and regressions[0].startswith("a: time")
+
+
+def test_main_fails_on_regression(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    args = ["--quick", "--repeat", "1", "-k", "calculate_cashflows", "--baseline", path]
+    assert benchmarks.main(args + ["--save-baseline"]) == 0
+    assert benchmarks.main(args + ["--tolerance", "1000"]) == 0
+
+    baseline = benchmarks.load_baseline(path)
+    benchmarks.save_baseline({name: {"time": 1e-9, "peak_memory": 1} for name in baseline}, path)
+    assert benchmarks.main(args) == 1
@@ -1 +1,3 @@
+from .batch import *
 from .calculator import *
+from .plotting import *
@@ -0,0 +1,205 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import pandas as pd
+
+from historical_data_analysis import (
+    AlphaVantageDownloader,
+    BacktestCheckpointStore,
+    MarketDataStore,
+    load_market_data,
+)
+from simulation import get_simulation_cache
+
+from .calculator import (
+    get_analysis_options,
+    get_project_dir,
+    load_portfolio,
+    run_portfolio_analysis,
+    save_portfolio_results,
+)
+from .plotting import get_plot_tasks, render_plots
+
+
+def analyze_all_portfolios(
+    portfolio_names: list = None,
+    project_dir: str = None,
+    market_data=None,
+    offline: bool = False,
+    iterations: int = 100,
+    simulation_mode: str = "independent",
+    engine: str = "array",
+    seed: int = None,
+    workers: int = None,
+    cache=None,
+    return_model: str = "normal",
+    plots: bool = True,
+) -> dict:
+    """Analyzes several portfolios in one run.
+
+    Every symbol is fetched and cleaned once for all portfolios, then the backtests and simulations of the portfolios
+    run concurrently in a process pool. The usual `data/results/<name>/` artifacts are written for every portfolio,
+    together with a cross-portfolio comparison table in `data/results/`.
+
+    Args:
+        portfolio_names (list, optional): Portfolios to analyze, defaults to all configs in `data/portfolios`
+        project_dir (str, optional): Project directory, resolved from the package location if not given
+        market_data (MarketDataStore | dict, optional): Source of cleaned series, defaults to `data/market_data`
+        offline (bool): Only use stored market data
+        iterations (int): Number of simulated paths
+        simulation_mode (str): "independent" or "joint"
+        engine (str): Simulation engine of the independent simulations
+        seed (int, optional): Root seed of all simulations
+        workers (int, optional): Number of portfolios analyzed in parallel, defaults to the number of CPUs
+        cache (SimulationCache, optional): Cache of simulation results, defaults to `data/cache/simulation`
+        return_model (str): Model of the monthly returns, one of `RETURN_MODELS`
+        plots (bool): Whether to render the plots of every portfolio
+
+    Returns:
+        dict: Outcome per portfolio, the comparison table and the timing of the run. The sequential time and the
+            time saved are upper-bound estimates summed from the parallel run (where contention slows every task
+            down), not measured one after another
+    """
+    start_time = perf_counter()
+    options = get_analysis_options(
+        {
+            "iterations": iterations,
+            "simulation_mode": simulation_mode,
+            "engine": engine,
+            "seed": seed,
+            "workers": 1,
+            "return_model": return_model,
+        }
+    )
+
+    # get paths
+    project_dir = get_project_dir() if project_dir is None else project_dir
+    result_root_dir = os.path.join(project_dir, "data", "results")
+    if portfolio_names is None:
+        portfolio_dir = os.path.join(project_dir, "data", "portfolios")
+        portfolio_names = sorted(os.path.splitext(f)[0] for f in os.listdir(portfolio_dir) if f.endswith(".json"))
+    if market_data is None:
+        market_data = MarketDataStore(
+            os.path.join(project_dir, "data", "market_data"), offline=offline, downloader=AlphaVantageDownloader()
+        )
+    if cache is None:
+        cache = get_simulation_cache(os.path.join(project_dir, "data", "cache", "simulation"))
+
+    portfolio_configs = {name: load_portfolio(name, project_dir) for name in portfolio_names}
+    portfolios = {name: portfolio_config["portfolio"] for name, portfolio_config in portfolio_configs.items()}
+
+    # fetch and clean every symbol once
+    symbols = sorted({params["symbol"] for portfolio in portfolios.values() for params in portfolio})
+    histories = {}
+    fetch_times = {}
+    prefetch_start_time = perf_counter()
+    if hasattr(market_data, "prefetch"):
+        market_data.prefetch(symbols)
+    prefetch_time = perf_counter() - prefetch_start_time
+    for symbol in symbols:
+        fetch_start_time = perf_counter()
+        histories[symbol] = load_market_data(symbol, market_data)
+        fetch_times[symbol] = perf_counter() - fetch_start_time
+
+    # backtests and simulations of all portfolios run concurrently, every simulation in a single process
+    tasks = {
+        name: {
+            "portfolio": portfolio,
+            "result_dir": os.path.join(result_root_dir, name),
+            "market_data": histories,
+            "options": {**options, "rebalancing": portfolio_configs[name].get("rebalancing")},
+            "cache": cache,
+            "checkpoints": BacktestCheckpointStore(os.path.join(project_dir, "data", "cache", "backtest", name)),
+        }
+        for name, portfolio in portfolios.items()
+    }
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        results = {name: run_timed_portfolio_analysis(task) for name, task in tasks.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = {name: pool.submit(run_timed_portfolio_analysis, task) for name, task in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+
+    # summaries are written from the main process, the plots of all portfolios are rendered in one pool
+    portfolio_outcomes = {}
+    analysis_times = {}
+    plot_tasks = []
+    for name, (portfolio_outcome, analysis_time) in results.items():
+        save_start_time = perf_counter()
+        save_portfolio_results(portfolio_outcome, os.path.join(result_root_dir, name), plots=False)
+        portfolio_outcomes[name] = portfolio_outcome
+        analysis_times[name] = analysis_time + perf_counter() - save_start_time
+        if plots:
+            plot_tasks += get_plot_tasks(portfolio_outcome, os.path.join(result_root_dir, name))
+    plot_start_time = perf_counter()
+    render_plots(plot_tasks, workers)
+    plot_time = perf_counter() - plot_start_time
+
+    df_comparison = get_portfolio_comparison(portfolio_outcomes)
+    df_comparison.to_csv(os.path.join(result_root_dir, "portfolio_comparison.csv"))
+    with open(os.path.join(result_root_dir, "portfolio_comparison.txt"), "w") as f:
+        f.write(df_comparison.to_string())
+
+    # upper bound of a run one after another, every portfolio would fetch its own symbols again and the analysis
+    # times measured under contention of the pool are summed
+    wall_time = perf_counter() - start_time
+    sequential_time = (
+        prefetch_time
+        + plot_time
+        + sum(
+            analysis_times[name] + sum(fetch_times[params["symbol"]] for params in portfolio)
+            for name, portfolio in portfolios.items()
+        )
+    )
+    timing = {
+        "wall_time": wall_time,
+        "sequential_time_upper_bound": sequential_time,
+        "time_saved_upper_bound": sequential_time - wall_time,
+        "prefetch_time": prefetch_time,
+        "fetch_times": fetch_times,
+        "analysis_times": analysis_times,
+        "plot_time": plot_time,
+    }
+    print(
+        f"Analyzed {len(portfolios)} portfolios with {len(symbols)} symbols in {wall_time:.2f}s "
+        f"(one after another up to {sequential_time:.2f}s, saved up to {sequential_time - wall_time:.2f}s, estimated)"
+    )
+
+    return {"portfolios": portfolio_outcomes, "comparison": df_comparison, "timing": timing}
+
+
+def run_timed_portfolio_analysis(task: dict) -> tuple:
+    start_time = perf_counter()
+    portfolio_outcome = run_portfolio_analysis(**task)
+    return portfolio_outcome, perf_counter() - start_time
+
+
+def get_portfolio_comparison(portfolio_outcomes: dict) -> pd.DataFrame:
+    rows = {}
+    for name, portfolio_outcome in portfolio_outcomes.items():
+        combined = portfolio_outcome["summary"]["combined"]
+        row = {
+            "symbols": ", ".join(symbol for symbol in portfolio_outcome["summary"].keys() if symbol != "combined"),
+            "investment_time": combined["investment_time"],
+            "input_amount": combined["input_amount"],
+            "final_amount": combined["final_amount"],
+            "total_yield_percent": combined["total_yield_percent"],
+            "annual_return": combined["annual_return"],
+        }
+
+        # simulated distribution of the whole portfolio (joint simulation or single symbol portfolios)
+        simulation = portfolio_outcome["simulation"]
+        simulated_symbols = [name for name in simulation.keys() if name != "seed"]
+        simulation_combined = simulation.get("combined")
+        if simulation_combined is None and len(simulated_symbols) == 1:
+            simulation_combined = simulation[simulated_symbols[0]]
+        if simulation_combined is not None:
+            for stat in ["mean", "quantile_25", "quantile_50", "quantile_75"]:
+                row[f"simulated_final_amount_{stat}"] = simulation_combined["final_amount"][stat]
+            row["simulated_annual_return_quantile_50"] = simulation_combined["annual_return"]["quantile_50"]
+
+        rows[name] = row
+
+    return pd.DataFrame.from_dict(rows, orient="index").round(2)
@@ -1,63 +1,436 @@
 import json
 import os
 
-import matplotlib.pyplot as plt
+import numpy as np
 
 import project_helpers as hp
-from historical_data_analysis import portfolio_past_outcome, save_summary
-from simulation import simulate_outcome
+from historical_data_analysis import (
+    AlphaVantageDownloader,
+    BacktestCheckpointStore,
+    MarketDataStore,
+    get_regular_investments,
+    portfolio_past_outcome,
+    rolling_window_outcome,
+    save_summary,
+)
+from simulation import (
+    PATH_DTYPES,
+    RETURN_MODELS,
+    estimate_return_parameters,
+    get_aligned_returns,
+    get_return_model,
+    get_simulation_cache,
+    get_simulation_key,
+    get_symbol_seed,
+    get_withdrawal,
+    rebalanced_past_outcome,
+    simulate_decumulation,
+    simulate_outcome,
+    simulate_paths,
+    simulate_portfolio,
+    simulate_rebalanced_portfolio,
+)
 
+from .plotting import get_plot_tasks, render_plots
+
+SIMULATION_MODES = ["independent", "joint"]
+
+# options of the simulations of a portfolio analysis, see `get_analysis_options`
+DEFAULT_ANALYSIS_OPTIONS = {
+    "iterations": 100,
+    "simulation_mode": "independent",
+    "engine": "array",
+    "seed": None,
+    "workers": None,
+    "return_model": "normal",
+    "save_paths": None,
+    "rebalancing": None,
+}
+
+
+def analyze_portfolio(
+    portfolio_name: str,
+    market_data=None,
+    offline: bool = False,
+    options: dict = None,
+    cache=None,
+    checkpoints=None,
+    trace: str = None,
+    plots: bool = True,
+    project_dir: str = None,
+    result_dir: str = None,
+) -> dict:
+    """Backtest, simulations, summaries and plots of a portfolio config in `data/portfolios`.
+
+    Args:
+        portfolio_name (str): Name of the portfolio config, see `load_portfolio`
+        market_data (MarketDataStore | dict, optional): Source of cleaned series, defaults to `data/market_data`
+        offline (bool): Only use stored market data
+        options (dict, optional): Options of the simulations, see `get_analysis_options`. Without "rebalancing", the
+            section of the portfolio config is used
+        cache (SimulationCache, optional): Cache of simulation results, defaults to `data/cache/simulation`
+        checkpoints (BacktestCheckpointStore, optional): Backtest checkpoints, defaults to `data/cache/backtest`
+        trace (str, optional): Save a trace of all stages in one of `hp.TRACE_FORMATS`
+        plots (bool): Whether to render the plots
+        project_dir (str, optional): Project directory, resolved from the package location if not given
+        result_dir (str, optional): Result directory, defaults to `data/results/<portfolio_name>`
+
+    Returns:
+        dict: Outcome of `run_portfolio_analysis`
+    """
+    options = get_analysis_options(options)
 
-def analyze_portfolio(portfolio_name: str) -> dict:
     # get paths
+    project_abs_path = get_project_dir() if project_dir is None else project_dir
+    if result_dir is None:
+        result_dir = os.path.join(project_abs_path, "data", "results", portfolio_name)
+    if market_data is None:
+        market_data = MarketDataStore(
+            os.path.join(project_abs_path, "data", "market_data"), offline=offline, downloader=AlphaVantageDownloader()
+        )
+    if cache is None:
+        cache = get_simulation_cache(os.path.join(project_abs_path, "data", "cache", "simulation"))
+    if checkpoints is None:
+        checkpoints = BacktestCheckpointStore(
+            os.path.join(project_abs_path, "data", "cache", "backtest", portfolio_name)
+        )
+    if trace is not None and trace not in hp.TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format '{trace}', expected one of {hp.TRACE_FORMATS}")
+
+    # opt-in timing and memory of every stage, saved next to the results
+    with hp.tracing(enabled=trace is not None) as tracer:
+        with hp.span("analyze_portfolio", portfolio=portfolio_name):
+            # get portfolio config
+            with hp.span("load_portfolio", portfolio=portfolio_name):
+                portfolio = load_portfolio(portfolio_name, project_abs_path)
+            if options["rebalancing"] is None:
+                options["rebalancing"] = portfolio.get("rebalancing")
+
+            portfolio_outcome = run_portfolio_analysis(
+                portfolio["portfolio"], result_dir, market_data, options, cache, checkpoints
+            )
+            save_portfolio_results(portfolio_outcome, result_dir, plots, options["workers"])
+
+    if tracer is not None:
+        tracer.save(get_trace_path(result_dir, trace), trace)
+
+    return portfolio_outcome
+
+
+def get_analysis_options(options: dict = None) -> dict:
+    """Returns the complete options of a portfolio analysis.
+
+    Args:
+        options (dict, optional): Number of simulated paths ("iterations"), "simulation_mode" (one of
+            `SIMULATION_MODES`), "engine" of the independent simulations, root "seed", "workers" of the simulation and
+            the plots, "return_model" (one of `RETURN_MODELS`), dtype of the stored paths ("save_paths", one of
+            `PATH_DTYPES`) and the "rebalancing" section of the portfolio
+
+    Returns:
+        dict: `DEFAULT_ANALYSIS_OPTIONS` updated with `options`
+    """
+    options = {**DEFAULT_ANALYSIS_OPTIONS, **(options or {})}
+    unknown_options = sorted(set(options) - set(DEFAULT_ANALYSIS_OPTIONS))
+    if len(unknown_options) > 0:
+        raise ValueError(
+            f"Unknown analysis options {unknown_options}, expected some of {list(DEFAULT_ANALYSIS_OPTIONS)}"
+        )
+    if options["simulation_mode"] not in SIMULATION_MODES:
+        raise ValueError(f"Unknown simulation mode '{options['simulation_mode']}', expected one of {SIMULATION_MODES}")
+    if options["return_model"] not in RETURN_MODELS:
+        raise ValueError(f"Unknown return model '{options['return_model']}', expected one of {RETURN_MODELS}")
+    if options["save_paths"] is not None and options["save_paths"] not in PATH_DTYPES:
+        raise ValueError(f"Unknown path dtype '{options['save_paths']}', expected one of {PATH_DTYPES}")
+    if options["save_paths"] is not None and options["simulation_mode"] != "independent":
+        raise ValueError("Simulation paths are only stored for independent simulations")
+    return options
+
+
+def get_trace_path(result_dir: str, trace_format: str) -> str:
+    return os.path.join(result_dir, "trace.json" if trace_format == "json" else "trace.chrome.json")
+
+
+def get_project_dir() -> str:
     current_dir_path = os.path.dirname(os.path.abspath(__file__))
-    project_abs_path = hp.get_project_abs_path("investment_calculator", current_dir_path)
-    portfolio_dir = os.path.join(project_abs_path, "data", "portfolios")
-    result_dir = os.path.join(project_abs_path, "data", "results", portfolio_name)
+    return hp.get_project_abs_path("investment_calculator", current_dir_path)
+
+
+def load_portfolio(portfolio_name: str, project_dir: str) -> dict:
+    """Loads the portfolio config `data/portfolios/<portfolio_name>.json`.
+
+    The config holds the stock configs in "portfolio". Two optional sections add analyses to every run:
 
-    # get portfolio config
+    - "withdrawal" in a stock config simulates a withdrawal phase after its accumulation, see `get_withdrawal`
+    - "rebalancing" next to "portfolio" backtests and simulates the whole portfolio with target weights, e.g.
+      `"rebalancing": {"weights": {"URTH": 0.7, "EEM": 0.3}, "policy": "threshold", "band": 0.05}`, see
+      `get_rebalancing`. Its results are saved as rebalanced.csv, rebalanced_simulation_result.json,
+      rebalanced_<name>_summary.txt and plots prefixed with "rebalanced_"
+
+    Args:
+        portfolio_name (str): Name of the portfolio config
+        project_dir (str): Project directory
+
+    Returns:
+        dict: Portfolio config
+    """
+    portfolio_dir = os.path.join(project_dir, "data", "portfolios")
     with open(f"{portfolio_dir}/{portfolio_name}.json", "r") as f:
         portfolio = json.load(f)
+    return portfolio
+
+
+def run_portfolio_analysis(
+    portfolio: list, result_dir: str, market_data=None, options: dict = None, cache=None, checkpoints=None
+) -> dict:
+    """Backtest and simulations of the stock configs of a portfolio, the simulation results are saved as JSON.
+
+    Args:
+        portfolio (list): Stock configs of the portfolio
+        result_dir (str): Directory of the simulation results
+        market_data (MarketDataStore | dict, optional): Source of cleaned series, see `load_market_data`
+        options (dict, optional): Options of the simulations, see `get_analysis_options`
+        cache (SimulationCache, optional): Cache of simulation results
+        checkpoints (BacktestCheckpointStore, optional): Backtest checkpoints of the portfolio
+
+    Returns:
+        dict: Backtest data, summaries, histories, rolling windows and the simulation results
+    """
+    options = get_analysis_options(options)
+    iterations = options["iterations"]
+    return_model = options["return_model"]
 
     # create result path
     if not os.path.exists(result_dir):
         os.makedirs(result_dir)
 
     # get portfolio historical analysis
-    portfolio_outcome = portfolio_past_outcome(portfolio["portfolio"])
-    data = portfolio_outcome["data"]
+    with hp.span("portfolio_past_outcome"):
+        portfolio_outcome = portfolio_past_outcome(portfolio, market_data, checkpoints)
 
-    # simulation based on combined stock parameters
+    # backtest of every start month in the history, symbols with a shorter history are skipped
+    portfolio_outcome["rolling_windows"] = {}
+    for params in portfolio:
+        history = portfolio_outcome["history"][params["symbol"]]
+        if len(history) >= int(params["investment_time"] * 12):
+            with hp.span("rolling_window_outcome", symbol=params["symbol"]):
+                portfolio_outcome["rolling_windows"][params["symbol"]] = rolling_window_outcome(
+                    history,
+                    params["investment_time"],
+                    params["initial_investment"],
+                    get_regular_investments(params),
+                    params.get("dividend_reinvestment", True),
+                )
+
+    # the root seed is recorded with every simulation result, so each run can be reproduced. Without a requested
+    # seed, any cached result of the same simulation is reused.
+    requested_seed = options["seed"]
+    seed = np.random.SeedSequence().entropy if requested_seed is None else requested_seed
+    histories = {params["symbol"]: portfolio_outcome["history"][params["symbol"]] for params in portfolio}
+
+    # joint simulation of all stocks with correlated returns
     portfolio_outcome["simulation"] = {}
-    for stock_name in portfolio_outcome["summary"].keys():
-        if stock_name == "combined":
+    if options["simulation_mode"] == "joint":
+        returns = get_aligned_returns(histories)
+        mean, cov = estimate_return_parameters(returns)
+        model = get_return_model(return_model, returns.to_numpy() + 1)
+        model_params = {**get_model_params(model), "mode": "joint"}
+
+        def simulate():
+            with hp.span("simulate_portfolio", symbols=len(portfolio), iterations=iterations):
+                return simulate_portfolio(portfolio, histories, iterations, np.random.default_rng(seed), model)
+
+        portfolio_outcome["simulation"] = get_cached_simulation(
+            cache,
+            get_simulation_key(portfolio, mean.tolist(), cov.tolist(), iterations, model_params, requested_seed),
+            simulate,
+            f"{result_dir}/joint_simulation_result.json",
+            seed,
+            mode="joint",
+        )
+
+    # simulation based on combined stock parameters
+    for stock_config in portfolio:
+        if options["simulation_mode"] != "independent":
+            break
+        stock_name = stock_config["symbol"]
+        monthly_mean, monthly_std = get_monthly_parameters(portfolio_outcome["summary"][stock_name])
+        model = get_return_model(return_model, histories[stock_name]["change"].to_numpy())
+        model_params = {**get_model_params(model), "engine": options["engine"]}
+        symbol_seed = get_symbol_seed(seed, stock_name)
+
+        def simulate():
+            # stored paths are always simulated, their summary is calculated from the stored matrices
+            if options["save_paths"] is not None:
+                with hp.span("simulate_paths", symbol=stock_name, dtype=options["save_paths"], iterations=iterations):
+                    paths = simulate_paths(
+                        stock_config,
+                        monthly_mean,
+                        monthly_std,
+                        iterations,
+                        f"{result_dir}/{stock_name}_paths",
+                        np.random.default_rng(symbol_seed),
+                        model,
+                        options["save_paths"],
+                    )
+                    return paths.summary()
+            with hp.span("simulate_outcome", symbol=stock_name, engine=options["engine"], iterations=iterations):
+                return simulate_outcome(
+                    stock_config,
+                    monthly_mean,
+                    monthly_std,
+                    iterations,
+                    options["engine"],
+                    symbol_seed,
+                    options["workers"],
+                    model,
+                )
+
+        portfolio_outcome["simulation"][stock_name] = get_cached_simulation(
+            cache if options["save_paths"] is None else None,
+            get_simulation_key(stock_config, monthly_mean, monthly_std, iterations, model_params, requested_seed),
+            simulate,
+            f"{result_dir}/{stock_name}_simulation_result.json",
+            seed,
+            symbol=stock_name,
+        )
+
+    # accumulation followed by a withdrawal phase of every stock config with a "withdrawal" section
+    portfolio_outcome["decumulation"] = {}
+    for stock_config in portfolio:
+        if stock_config.get("withdrawal") is None:
             continue
-        # stock_name = "URTH"
-        stock_config = [p for p in portfolio["portfolio"] if p["symbol"] == stock_name][0]
-        monthly_std = portfolio_outcome["summary"][stock_name]["general"]["volatility_monthly"] / 100
-        monthly_mean = portfolio_outcome["summary"][stock_name]["general"]["mean_return_monthly"] / 100
-
-        # simulation
-        simulation_save_path = f"{result_dir}/{stock_name}_simulation_result.json"
-
-        if os.path.exists(simulation_save_path):
-            with open(simulation_save_path, "r") as f:
-                simulation_result = json.loads(f.read())
-        else:
-            simulation_result = simulate_outcome(stock_config, monthly_mean, monthly_std)
-            with open(simulation_save_path, "w") as f:
-                f.write(json.dumps(simulation_result))
-
-        portfolio_outcome["simulation"][stock_name] = simulation_result
-
-    # save plots in results
-    for stock_name in portfolio_outcome["summary"].keys():
-        data = portfolio_outcome["data"].loc[portfolio_outcome["data"][f"input_{stock_name}"] > 0, :]
-        data.plot(x="date", y=[f"total_{stock_name}", f"input_{stock_name}"])
-        plt.savefig(f"{result_dir}/{stock_name}.png")
+        stock_name = stock_config["symbol"]
+        withdrawal = get_withdrawal(stock_config["withdrawal"])
+        monthly_mean, monthly_std = get_monthly_parameters(portfolio_outcome["summary"][stock_name])
+        model = get_return_model(return_model, histories[stock_name]["change"].to_numpy())
+        model_params = {**get_model_params(model), "mode": "decumulation", "withdrawal": withdrawal}
+
+        def simulate():
+            with hp.span("simulate_decumulation", symbol=stock_name, iterations=iterations):
+                return simulate_decumulation(
+                    stock_config,
+                    monthly_mean,
+                    monthly_std,
+                    withdrawal,
+                    iterations,
+                    np.random.default_rng(get_symbol_seed(seed, stock_name)),
+                    model,
+                )
+
+        portfolio_outcome["decumulation"][stock_name] = get_cached_simulation(
+            cache,
+            get_simulation_key(stock_config, monthly_mean, monthly_std, iterations, model_params, requested_seed),
+            simulate,
+            f"{result_dir}/{stock_name}_decumulation_result.json",
+            seed,
+            symbol=stock_name,
+            mode="decumulation",
+        )
+
+    # backtest and simulation of the whole portfolio with target weights and a rebalancing policy
+    rebalancing = options["rebalancing"]
+    if rebalancing is not None:
+        with hp.span("rebalanced_past_outcome", symbols=len(portfolio)):
+            rebalanced_outcome = rebalanced_past_outcome(portfolio, histories, rebalancing)
+
+        returns = get_aligned_returns(histories)
+        mean, cov = estimate_return_parameters(returns)
+        model = get_return_model(return_model, returns.to_numpy() + 1)
+        model_params = {
+            **get_model_params(model),
+            "mode": "rebalanced",
+            "rebalancing": rebalanced_outcome["rebalancing"],
+        }
+
+        def simulate():
+            with hp.span("simulate_rebalanced_portfolio", symbols=len(portfolio), iterations=iterations):
+                return simulate_rebalanced_portfolio(
+                    portfolio, histories, rebalancing, iterations, np.random.default_rng(seed), model
+                )
+
+        rebalanced_outcome["simulation"] = get_cached_simulation(
+            cache,
+            get_simulation_key(portfolio, mean.tolist(), cov.tolist(), iterations, model_params, requested_seed),
+            simulate,
+            f"{result_dir}/rebalanced_simulation_result.json",
+            seed,
+            mode="rebalanced",
+        )
+        portfolio_outcome["rebalanced"] = rebalanced_outcome
+
+    return portfolio_outcome
+
+
+def get_cached_simulation(cache, key: str, compute, save_path: str, seed: int, **labels) -> dict:
+    """Returns the cached simulation result of `key`, a missing result is computed and cached.
+
+    Args:
+        cache (SimulationCache | None): Cache of simulation results, every result is computed without a cache
+        key (str): Key of the simulation, see `get_simulation_key`
+        compute (callable): Simulation returning the result
+        save_path (str): Path of the JSON copy of the result
+        seed (int): Root seed recorded with a computed result
+        **labels: Labels of the spans, like the symbol
+
+    Returns:
+        dict: Simulation result
+    """
+    with hp.span("simulation_cache_get", **labels):
+        result = None if cache is None else cache.get(key)
+    if result is None:
+        result = compute()
+        result["seed"] = seed
+        if cache is not None:
+            with hp.span("simulation_cache_put", **labels):
+                cache.put(key, result)
+    with hp.span("write_simulation_result", **labels):
+        with open(save_path, "w") as f:
+            f.write(json.dumps(result))
+    return result
+
+
+def get_model_params(model) -> dict:
+    # identifies the return model in the simulation key
+    return {"returns": "normal"} if model is None else model.params
+
+
+def get_monthly_parameters(summary: dict) -> tuple:
+    # mean and standard deviation of the monthly return of a symbol
+    return summary["general"]["mean_return_monthly"] / 100, summary["general"]["volatility_monthly"] / 100
+
+
+def save_portfolio_results(portfolio_outcome: dict, result_dir: str, plots: bool = True, plot_workers: int = None):
+    # render history plots and simulation fan charts in parallel, batch runs may skip them
+    if plots:
+        tasks = get_plot_tasks(portfolio_outcome, result_dir)
+        with hp.span("render_plots", plots=len(tasks)):
+            render_plots(tasks, plot_workers)
 
     # save summaries as .txt files
     for stock_name, stock_summary in portfolio_outcome["summary"].items():
-        save_summary(stock_summary, stock_name, f"{result_dir}/{stock_name}_summary.txt")
+        simulation_summary = portfolio_outcome.get("simulation", {}).get(stock_name)
+        with hp.span("save_summary", symbol=stock_name):
+            save_summary(
+                stock_summary,
+                stock_name,
+                f"{result_dir}/{stock_name}_summary.txt",
+                simulation_summary=simulation_summary,
+            )
 
-    return portfolio_outcome
+    # save summaries and monthly values of the rebalanced portfolio
+    rebalanced_outcome = portfolio_outcome.get("rebalanced")
+    if rebalanced_outcome is not None:
+        for name, rebalanced_summary in rebalanced_outcome["summary"].items():
+            with hp.span("save_summary", symbol=name, mode="rebalanced"):
+                save_summary(
+                    rebalanced_summary,
+                    f"{name} (rebalanced)",
+                    f"{result_dir}/rebalanced_{name}_summary.txt",
+                    simulation_summary=rebalanced_outcome["simulation"].get(name),
+                )
+        rebalanced_outcome["data"].to_csv(f"{result_dir}/rebalanced.csv", index=False)
+
+    # save outcome of all rolling windows as .csv files
+    for stock_name, rolling_outcome in portfolio_outcome.get("rolling_windows", {}).items():
+        with hp.span("save_rolling_windows", symbol=stock_name):
+            rolling_outcome["windows"].to_csv(f"{result_dir}/{stock_name}_rolling_windows.csv", index=False)
@@ -0,0 +1,114 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import project_helpers as hp
+
+FIGURE_SIZE = (6.4, 4.8)
+
+
+def get_plot_tasks(portfolio_outcome: dict, result_dir: str) -> list:
+    """Returns the plots of a portfolio outcome as (kind, path, plot data) tasks for `render_plots`.
+
+    The tasks only hold the arrays drawn in the plot, so they are cheap to send to worker processes.
+
+    Args:
+        portfolio_outcome (dict): Outcome of `run_portfolio_analysis`
+        result_dir (str): Directory of the plots
+
+    Returns:
+        list: History plot of every symbol and the combined portfolio, fan chart of every simulation, the same for
+            the rebalanced portfolio
+    """
+    tasks = get_outcome_plot_tasks(portfolio_outcome, result_dir)
+    rebalanced_outcome = portfolio_outcome.get("rebalanced")
+    if rebalanced_outcome is not None:
+        tasks += get_outcome_plot_tasks(rebalanced_outcome, result_dir, "rebalanced_")
+    return tasks
+
+
+def get_outcome_plot_tasks(outcome: dict, result_dir: str, prefix: str = "") -> list:
+    tasks = []
+    data = outcome["data"]
+    for stock_name in outcome["summary"].keys():
+        invested = data[f"input_{stock_name}"].to_numpy() > 0
+        plot_data = {
+            "name": stock_name,
+            "date": data["date"].to_numpy()[invested],
+            "total": data[f"total_{stock_name}"].to_numpy()[invested],
+            "input": data[f"input_{stock_name}"].to_numpy()[invested],
+        }
+        tasks.append(("history", f"{result_dir}/{prefix}{stock_name}.png", plot_data))
+
+    for name, simulation_summary in outcome.get("simulation", {}).items():
+        if isinstance(simulation_summary, dict) and "fan" in simulation_summary:
+            plot_data = {"name": f"{prefix}{name}", "fan": simulation_summary["fan"]}
+            tasks.append(("fan", f"{result_dir}/{prefix}{name}_simulation_fan.png", plot_data))
+
+    return tasks
+
+
+def render_plots(tasks: list, workers: int = None):
+    """Renders plot tasks in a process pool, or in this process for a single worker or task.
+
+    Args:
+        tasks (list): (kind, path, plot data) tasks, see `get_plot_tasks`
+        workers (int, optional): Number of worker processes, defaults to the number of CPUs
+    """
+    if len(tasks) == 0:
+        return
+    # matplotlib is only imported when plots are rendered, before the pool so forked workers inherit it
+    import matplotlib.backends.backend_agg  # noqa: F401
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            render_plot(task)
+        return
+
+    # spans of the workers are not traced, the pool is recorded as a whole
+    with hp.span("plot_pool", workers=min(workers, len(tasks)), plots=len(tasks)):
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            list(pool.map(render_plot, tasks))
+
+
+def render_plot(task: tuple):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # figures drawn on the Agg canvas are not registered with pyplot, so they are released after saving
+    kind, path, plot_data = task
+    figure = Figure(figsize=FIGURE_SIZE)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    if kind == "history":
+        plot_history(ax, plot_data)
+        figure.autofmt_xdate()
+    elif kind == "fan":
+        plot_fan(ax, plot_data)
+    else:
+        raise ValueError(f"Unknown plot '{kind}'")
+    figure.savefig(path)
+
+
+def plot_history(ax, plot_data: dict):
+    name = plot_data["name"]
+    ax.plot(plot_data["date"], plot_data["total"], label=f"total_{name}")
+    ax.plot(plot_data["date"], plot_data["input"], label=f"input_{name}")
+    ax.set_xlabel("date")
+    ax.legend()
+
+
+def plot_fan(ax, plot_data: dict):
+    # percentile bands of the simulated total value, the fan months are the last month of every year
+    fan = plot_data["fan"]
+    years = (np.asarray(fan["months"]) + 1) / 12
+    ax.fill_between(years, fan["quantile_5"], fan["quantile_95"], color="C0", alpha=0.2, label="5% - 95%")
+    ax.fill_between(years, fan["quantile_25"], fan["quantile_75"], color="C0", alpha=0.4, label="25% - 75%")
+    ax.plot(years, fan["quantile_50"], color="C0", label="median")
+    ax.plot(years, fan["input"], color="C1", label="input")
+    ax.set_title(f"{plot_data['name']} simulation")
+    ax.set_xlabel("years")
+    ax.set_ylabel("total")
+    ax.legend(loc="upper left")
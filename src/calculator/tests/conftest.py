@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from benchmarks.synthetic_data import get_synthetic_history
+
+
+def get_stock_config(symbol: str, initial_investment: float, monthly_investment: float, investment_time=5) -> dict:
+    return {
+        "symbol": symbol,
+        "investment_time": investment_time,
+        "initial_investment": initial_investment,
+        "monthly_investment": monthly_investment,
+        "quarter_investment": 0,
+        "bi_annual_investment": 0,
+        "annual_investment": 0,
+        "dividend_reinvestment": True,
+    }
+
+
+@pytest.fixture
+def market_data() -> dict:
+    return {symbol: get_synthetic_history(seed=i) for i, symbol in enumerate(["URTH", "EEM"])}
+
+
+@pytest.fixture
+def portfolio() -> list:
+    return [get_stock_config("URTH", 700, 70), get_stock_config("EEM", 300, 30)]
+
+
+@pytest.fixture
+def project_dir(tmp_path) -> str:
+    portfolios = {
+        "world": [get_stock_config("URTH", 1000, 100)],
+        "emerging": [get_stock_config("EEM", 1000, 0)],
+        "world_70-30": [get_stock_config("URTH", 700, 70), get_stock_config("EEM", 300, 30)],
+    }
+    portfolio_dir = tmp_path / "data" / "portfolios"
+    portfolio_dir.mkdir(parents=True)
+    for name, portfolio in portfolios.items():
+        with open(portfolio_dir / f"{name}.json", "w") as f:
+            json.dump({"portfolio": portfolio}, f)
+    return str(tmp_path)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from calculator import analyze_all_portfolios
+
+
+class CountingMarketData(dict):
+    def __init__(self, data: dict):
+        super().__init__(data)
+        self.requests = []
+
+    def get(self, symbol):
+        self.requests.append(symbol)
+        return super().get(symbol)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_fetches_every_symbol_once(project_dir, market_data, workers):
+    counting_market_data = CountingMarketData(market_data)
+    batch = analyze_all_portfolios(project_dir=project_dir, market_data=counting_market_data, seed=1, workers=workers)
+
+    assert sorted(counting_market_data.requests) == ["EEM", "URTH"]
+    assert sorted(batch["portfolios"].keys()) == ["emerging", "world", "world_70-30"]
+
+    result_dir = os.path.join(project_dir, "data", "results")
+    for name, symbols in [("world", ["URTH"]), ("emerging", ["EEM"]), ("world_70-30", ["URTH", "EEM"])]:
+        for symbol in symbols:
+            for file_name in [
+                f"{symbol}.png",
+                f"{symbol}_summary.txt",
+                f"{symbol}_simulation_result.json",
+                f"{symbol}_rolling_windows.csv",
+            ]:
+                assert os.path.exists(os.path.join(result_dir, name, file_name))
+        assert os.path.exists(os.path.join(result_dir, name, "combined_summary.txt"))
+    assert os.path.exists(os.path.join(result_dir, "portfolio_comparison.txt"))
+
+    df_comparison = batch["comparison"]
+    assert list(df_comparison.index) == ["emerging", "world", "world_70-30"]
+    assert df_comparison.loc["world_70-30", "input_amount"] == df_comparison.loc["world", "input_amount"]
+    assert batch["timing"]["sequential_time_upper_bound"] > 0
+
+
+def test_batch_matches_single_runs(project_dir, market_data):
+    batch = analyze_all_portfolios(
+        ["world", "world_70-30"], project_dir=project_dir, market_data=market_data, seed=3, workers=1
+    )
+    single = analyze_all_portfolios(["world_70-30"], project_dir=project_dir, market_data=market_data, workers=1)
+
+    assert batch["portfolios"]["world_70-30"]["summary"] == single["portfolios"]["world_70-30"]["summary"]
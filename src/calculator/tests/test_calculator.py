@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+import calculator
+from calculator import run_portfolio_analysis
+from simulation import SimulationCache, SimulationPaths
+
+
+@pytest.mark.parametrize("simulation_mode", ["independent", "joint"])
+def test_simulation_results_are_cached(tmp_path, market_data, portfolio, simulation_mode):
+    cache = SimulationCache(str(tmp_path / "cache"))
+    args = (portfolio, str(tmp_path / "results"), market_data)
+    options = {"iterations": 200, "simulation_mode": simulation_mode}
+
+    first = run_portfolio_analysis(*args, {**options, "seed": 5}, cache)
+    assert cache.stats["misses"] > 0 and cache.hit_rate == 0
+
+    second = run_portfolio_analysis(*args, {**options, "seed": 5}, SimulationCache(str(tmp_path / "cache")))
+    assert second["simulation"] == first["simulation"]
+
+    # a different seed is simulated again
+    other = run_portfolio_analysis(*args, {**options, "seed": 6}, cache)
+    assert other["simulation"] != first["simulation"]
+    assert cache.hit_rate == 0
+
+
+@pytest.mark.parametrize("return_model", ["bootstrap", "student_t", "garch", "regime"])
+@pytest.mark.parametrize("simulation_mode", ["independent", "joint"])
+def test_return_model(tmp_path, market_data, portfolio, simulation_mode, return_model):
+    cache = SimulationCache(str(tmp_path / "cache"))
+    args = (portfolio, str(tmp_path / "results"), market_data)
+    options = {"iterations": 200, "simulation_mode": simulation_mode, "seed": 5}
+
+    normal = run_portfolio_analysis(*args, options, cache)
+    simulated = run_portfolio_analysis(*args, {**options, "return_model": return_model}, cache)
+
+    assert cache.hit_rate == 0
+    assert simulated["simulation"]["URTH"]["final_amount"]["mean"] > 0
+    assert simulated["simulation"]["URTH"] != normal["simulation"]["URTH"]
+    with pytest.raises(ValueError):
+        run_portfolio_analysis(*args, {**options, "return_model": "unknown"}, cache)
+
+
+@pytest.mark.parametrize("trace", ["json", "chrome"])
+def test_analyze_portfolio_trace(monkeypatch, tmp_path, project_dir, market_data, trace):
+    monkeypatch.setattr("calculator.calculator.get_project_dir", lambda: project_dir)
+    cache = SimulationCache(str(tmp_path / "cache"))
+    options = {"iterations": 20, "seed": 1}
+    calculator.analyze_portfolio("world_70-30", market_data, options=options, cache=cache, trace=trace)
+
+    result_dir = os.path.join(project_dir, "data", "results", "world_70-30")
+    with open(calculator.get_trace_path(result_dir, trace), "r") as f:
+        trace_data = json.load(f)
+    if trace == "json":
+        stages = {(record["name"], record["labels"].get("symbol")) for record in trace_data["spans"]}
+    else:
+        stages = {(event["name"], event["args"].get("symbol")) for event in trace_data["traceEvents"]}
+    for symbol in ["URTH", "EEM"]:
+        for name in ["calculate_returns", "simulate_outcome", "save_summary"]:
+            assert (name, symbol) in stages
+    assert ("analyze_portfolio", None) in stages
+    assert ("render_plots", None) in stages
+
+
+def test_invalid_analysis_options():
+    with pytest.raises(ValueError):
+        calculator.get_analysis_options({"iteration": 100})
+    with pytest.raises(ValueError):
+        calculator.get_analysis_options({"simulation_mode": "shared"})
+    assert calculator.get_analysis_options({"seed": 3})["iterations"] == 100
+
+
+def test_simulation_paths_are_stored(tmp_path, market_data, portfolio):
+    result_dir = str(tmp_path / "results")
+    options = {"iterations": 50, "seed": 2}
+    portfolio_outcome = run_portfolio_analysis(portfolio, result_dir, market_data, {**options, "save_paths": "float64"})
+    reference = run_portfolio_analysis(portfolio, str(tmp_path / "reference"), market_data, options)
+
+    paths = SimulationPaths(os.path.join(result_dir, "URTH_paths"))
+    assert paths.total.shape == (50, 60)
+    assert portfolio_outcome["simulation"]["URTH"] == reference["simulation"]["URTH"]
+
+    with pytest.raises(ValueError):
+        run_portfolio_analysis(
+            portfolio, result_dir, market_data, {"simulation_mode": "joint", "save_paths": "float32"}
+        )
+
+
+def test_rebalanced_portfolio(tmp_path, market_data, portfolio):
+    result_dir = str(tmp_path / "results")
+    cache = SimulationCache(str(tmp_path / "cache"))
+    rebalancing = {"weights": {"URTH": 0.7, "EEM": 0.3}, "policy": "threshold", "band": 0.05}
+    options = {"iterations": 100, "seed": 1, "rebalancing": rebalancing}
+    portfolio_outcome = run_portfolio_analysis(portfolio, result_dir, market_data, options, cache)
+
+    rebalanced = portfolio_outcome["rebalanced"]
+    assert rebalanced["rebalancing"]["policy"] == "threshold"
+    assert set(rebalanced["summary"].keys()) == {"URTH", "EEM", "combined"}
+    assert (
+        rebalanced["simulation"]["combined"]["input_amount"]["mean"]
+        == rebalanced["summary"]["combined"]["input_amount"]
+    )
+
+    calculator.save_portfolio_results(portfolio_outcome, result_dir, plots=False)
+    assert os.path.exists(os.path.join(result_dir, "rebalanced_combined_summary.txt"))
+    assert os.path.exists(os.path.join(result_dir, "rebalanced.csv"))
+    plot_paths = [path for _, path, _ in calculator.get_plot_tasks(portfolio_outcome, result_dir)]
+    assert f"{result_dir}/rebalanced_combined_simulation_fan.png" in plot_paths
+
+    # another policy is a different simulation
+    options["rebalancing"] = {**rebalancing, "policy": "none"}
+    other = run_portfolio_analysis(portfolio, result_dir, market_data, options, cache)
+    assert other["rebalanced"]["simulation"] != rebalanced["simulation"]
+
+
+def test_decumulation(tmp_path, market_data, portfolio):
+    result_dir = str(tmp_path / "results")
+    cache = SimulationCache(str(tmp_path / "cache"))
+    portfolio[0]["withdrawal"] = {"rule": "guardrails", "years": 20, "rate": 0.05}
+    options = {"iterations": 100, "seed": 2}
+    portfolio_outcome = run_portfolio_analysis(portfolio, result_dir, market_data, options, cache)
+
+    assert list(portfolio_outcome["decumulation"].keys()) == ["URTH"]
+    decumulation = portfolio_outcome["decumulation"]["URTH"]
+    assert decumulation["decumulation"]["withdrawal"]["rule"] == "guardrails"
+    assert decumulation["fan"]["months"][-1] == 12 * (5 + 20) - 1
+    with open(os.path.join(result_dir, "URTH_decumulation_result.json"), "r") as f:
+        assert json.loads(f.read()) == decumulation
+
+    again = run_portfolio_analysis(portfolio, result_dir, market_data, options, cache)
+    assert again["decumulation"] == portfolio_outcome["decumulation"]
+    assert cache.stats["memory_hits"] > 0
@@ -0,0 +1,38 @@
+import os
+
+import matplotlib.pyplot as plt
+import pytest
+
+from calculator import get_plot_tasks, run_portfolio_analysis, save_portfolio_results
+
+
+@pytest.mark.parametrize("simulation_mode", ["independent", "joint"])
+def test_plots_are_rendered_in_workers(tmp_path, market_data, portfolio, simulation_mode):
+    result_dir = str(tmp_path / "results")
+    portfolio_outcome = run_portfolio_analysis(
+        portfolio, result_dir, market_data, {"iterations": 50, "simulation_mode": simulation_mode, "seed": 1}
+    )
+    figures = plt.get_fignums()
+    save_portfolio_results(portfolio_outcome, result_dir, plot_workers=2)
+
+    file_names = ["URTH.png", "EEM.png", "combined.png", "URTH_simulation_fan.png", "EEM_simulation_fan.png"]
+    if simulation_mode == "joint":
+        file_names.append("combined_simulation_fan.png")
+    for file_name in file_names:
+        assert os.path.getsize(os.path.join(result_dir, file_name)) > 0
+    # no figures are left open
+    assert plt.get_fignums() == figures
+
+
+def test_plot_tasks_and_skipped_plots(tmp_path, market_data, portfolio):
+    result_dir = str(tmp_path / "results")
+    portfolio_outcome = run_portfolio_analysis(portfolio, result_dir, market_data, {"iterations": 50, "seed": 1})
+
+    tasks = get_plot_tasks(portfolio_outcome, result_dir)
+    assert [kind for kind, _, _ in tasks] == ["history"] * 3 + ["fan"] * 2
+    _, _, plot_data = tasks[-1]
+    assert plot_data["fan"] == portfolio_outcome["simulation"]["EEM"]["fan"]
+
+    save_portfolio_results(portfolio_outcome, result_dir, plots=False)
+    assert not any(file_name.endswith(".png") for file_name in os.listdir(result_dir))
+    assert os.path.exists(os.path.join(result_dir, "EEM_summary.txt"))
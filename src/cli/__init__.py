@@ -0,0 +1 @@
+from .cli import *
@@ -0,0 +1,270 @@
+import argparse
+import os
+import sys
+
+# only the standard library is imported at startup, every subcommand imports the analysis packages it needs
+USAGE = """examples (from the src directory):
+  python -m cli backtest --portfolio MSCI_world
+  python -m cli simulate --portfolio MSCI_world --iterations 10000 --seed 1 --no-plots
+  python -m cli sweep --portfolio MSCI_world --grid investment_time=5,10,20 --grid allocation=0.7/0.3,0.5/0.5
+  python -m cli goal --portfolio MSCI_world --target 100000 --solve-for monthly_investment --confidence 0.75,0.9
+  python -m cli report --portfolio MSCI_world
+"""
+
+
+def main(argv: list = None) -> int:
+    args = get_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except (FileNotFoundError, KeyError, ValueError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Backtests and simulations of the portfolios in data/portfolios",
+        epilog=USAGE,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backtest = subparsers.add_parser("backtest", help="historical outcome of every symbol and the portfolio")
+    add_common_arguments(backtest)
+    backtest.set_defaults(handler=run_backtest)
+
+    simulate = subparsers.add_parser("simulate", help="backtest, simulation, summaries and plots")
+    add_common_arguments(simulate)
+    add_simulation_arguments(simulate, iterations=100)
+    simulate.add_argument("--engine", default="array", help="array, streaming, parallel or dataframe")
+    simulate.add_argument("--mode", default="independent", help="independent or joint simulation of the symbols")
+    simulate.add_argument(
+        "--return-model", default="normal", help="normal, bootstrap, student_t, garch or regime monthly returns"
+    )
+    simulate.add_argument("--workers", type=int, default=None, help="worker processes of simulation and plots")
+    simulate.add_argument("--no-plots", action="store_true", help="skip rendering the plots")
+    simulate.add_argument("--trace", default=None, help="save a json or chrome trace of all stages")
+    simulate.add_argument(
+        "--save-paths",
+        nargs="?",
+        const="float32",
+        default=None,
+        help="store the monthly returns and totals of all paths as float32 (default) or float64 arrays",
+    )
+    simulate.set_defaults(handler=run_simulate)
+
+    sweep = subparsers.add_parser("sweep", help="scenario sweep with common random numbers")
+    add_common_arguments(sweep)
+    add_simulation_arguments(sweep, iterations=1000)
+    sweep.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="PARAMETER=V1,V2",
+        help="values of a scenario parameter, allocation weights are separated by '/'",
+    )
+    sweep.set_defaults(handler=run_sweep)
+
+    goal = subparsers.add_parser("goal", help="amount or investment time reaching a target at a confidence level")
+    add_common_arguments(goal)
+    add_simulation_arguments(goal, iterations=10000)
+    goal.add_argument("--target", type=float, required=True, help="final amount which should be reached")
+    goal.add_argument(
+        "--solve-for",
+        default="monthly_investment",
+        help="initial_investment, monthly_investment or investment_time, amounts are portfolio totals",
+    )
+    goal.add_argument("--confidence", default="0.75,0.9", help="share of the paths reaching the target, e.g. 0.75,0.9")
+    goal.add_argument("--max-years", type=float, default=50, help="longest investment time searched")
+    goal.set_defaults(handler=run_goal)
+
+    report = subparsers.add_parser("report", help="print the saved summaries without recalculating")
+    add_common_arguments(report)
+    report.set_defaults(handler=run_report)
+
+    return parser
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--portfolio", required=True, help="name of the portfolio config in data/portfolios")
+    parser.add_argument("--output", default=None, help="result directory, defaults to data/results/<portfolio>")
+    parser.add_argument("--project-dir", default=None, help="project directory, resolved from the package location")
+    parser.add_argument("--offline", action="store_true", help="only use stored market data")
+
+
+def add_simulation_arguments(parser: argparse.ArgumentParser, iterations: int):
+    parser.add_argument("--iterations", type=int, default=iterations, help="number of simulated paths")
+    parser.add_argument("--seed", type=int, default=None, help="root seed, reproduces a previous run")
+
+
+def get_dirs(args) -> tuple:
+    project_dir = args.project_dir
+    if project_dir is None:
+        import project_helpers as hp
+
+        project_dir = hp.get_project_abs_path("investment_calculator", os.path.dirname(os.path.abspath(__file__)))
+    result_dir = args.output
+    if result_dir is None:
+        result_dir = os.path.join(project_dir, "data", "results", args.portfolio)
+    return project_dir, result_dir
+
+
+def get_market_data(args, project_dir: str):
+    from historical_data_analysis import AlphaVantageDownloader, MarketDataStore
+
+    return MarketDataStore(
+        os.path.join(project_dir, "data", "market_data"), offline=args.offline, downloader=AlphaVantageDownloader()
+    )
+
+
+def run_backtest(args) -> int:
+    from calculator import load_portfolio
+    from historical_data_analysis import portfolio_past_outcome, save_summary
+
+    project_dir, result_dir = get_dirs(args)
+    portfolio = load_portfolio(args.portfolio, project_dir)["portfolio"]
+    portfolio_outcome = portfolio_past_outcome(portfolio, get_market_data(args, project_dir))
+
+    os.makedirs(result_dir, exist_ok=True)
+    for stock_name, stock_summary in portfolio_outcome["summary"].items():
+        save_summary(stock_summary, stock_name, f"{result_dir}/{stock_name}_summary.txt")
+    return 0
+
+
+def run_simulate(args) -> int:
+    from calculator import analyze_portfolio
+
+    project_dir, result_dir = get_dirs(args)
+    options = {
+        "iterations": args.iterations,
+        "simulation_mode": args.mode,
+        "engine": args.engine,
+        "seed": args.seed,
+        "workers": args.workers,
+        "return_model": args.return_model,
+        "save_paths": args.save_paths,
+    }
+    portfolio_outcome = analyze_portfolio(
+        args.portfolio,
+        get_market_data(args, project_dir),
+        options=options,
+        trace=args.trace,
+        plots=not args.no_plots,
+        project_dir=project_dir,
+        result_dir=result_dir,
+    )
+
+    # simulated distribution of the final amount, the joint simulation holds the seed next to the symbols
+    simulation = portfolio_outcome["simulation"]
+    seed = simulation.get("seed")
+    print(f"{'':<10} {'input':>12} {'25%':>12} {'median':>12} {'75%':>12} {'P(loss)':>8}")
+    for name, simulation_summary in simulation.items():
+        if not isinstance(simulation_summary, dict):
+            continue
+        seed = simulation_summary.get("seed", seed)
+        final_amount = simulation_summary["final_amount"]
+        print(
+            f"{name:<10} {simulation_summary['input_amount']['mean']:>12.2f} {final_amount['quantile_25']:>12.2f} "
+            f"{final_amount['quantile_50']:>12.2f} {final_amount['quantile_75']:>12.2f} "
+            f"{simulation_summary['risk']['loss_probability']:>8.1%}"
+        )
+
+    # withdrawal phases after the accumulation
+    for name, decumulation_result in portfolio_outcome.get("decumulation", {}).items():
+        decumulation = decumulation_result["decumulation"]
+        median_years = decumulation["median_years_until_depletion"]
+        print(
+            f"{name:<10} P(depleted) {decumulation['depletion_probability']:.1%}, median years until depletion "
+            f"{'-' if median_years is None else f'{median_years:.1f}'}, sustainable fixed rule withdrawal rate (90%) "
+            f"{decumulation['sustainable_withdrawal_rate_fixed_rule']['90']:.2%}"
+        )
+    print(f"Results saved to {result_dir} (seed {seed})")
+    return 0
+
+
+def run_sweep(args) -> int:
+    import numpy as np
+
+    from calculator import load_portfolio
+    from historical_data_analysis import load_market_data
+    from simulation import sweep_portfolio
+
+    project_dir, result_dir = get_dirs(args)
+    portfolio = load_portfolio(args.portfolio, project_dir)["portfolio"]
+    market_data = get_market_data(args, project_dir)
+    histories = {params["symbol"]: load_market_data(params["symbol"], market_data) for params in portfolio}
+    df_sweep = sweep_portfolio(
+        portfolio, histories, parse_grid(args.grid), args.iterations, np.random.default_rng(args.seed)
+    )
+
+    os.makedirs(result_dir, exist_ok=True)
+    df_sweep.to_csv(os.path.join(result_dir, "sweep.csv"), index=False)
+    print(df_sweep.round(2).to_string(index=False))
+    return 0
+
+
+def parse_grid(grid_arguments: list) -> dict:
+    # ["investment_time=5,10", "allocation=0.7/0.3,0.5/0.5"] -> {"investment_time": [5.0, 10.0], "allocation": ...}
+    grid = {}
+    for grid_argument in grid_arguments:
+        parameter, separator, values = grid_argument.partition("=")
+        if separator == "" or values == "":
+            raise ValueError(f"Expected PARAMETER=V1,V2 instead of '{grid_argument}'")
+        if parameter == "allocation":
+            grid[parameter] = [[float(weight) for weight in value.split("/")] for value in values.split(",")]
+        else:
+            grid[parameter] = [float(value) for value in values.split(",")]
+    return grid
+
+
+def run_goal(args) -> int:
+    import json
+
+    import numpy as np
+
+    from calculator import load_portfolio
+    from historical_data_analysis import load_market_data
+    from simulation import goal_seek_portfolio
+
+    project_dir, result_dir = get_dirs(args)
+    portfolio = load_portfolio(args.portfolio, project_dir)["portfolio"]
+    market_data = get_market_data(args, project_dir)
+    histories = {params["symbol"]: load_market_data(params["symbol"], market_data) for params in portfolio}
+    goal = goal_seek_portfolio(
+        portfolio,
+        histories,
+        args.target,
+        args.solve_for,
+        [float(level) for level in args.confidence.split(",")],
+        args.iterations,
+        np.random.default_rng(args.seed),
+        args.max_years,
+    )
+
+    os.makedirs(result_dir, exist_ok=True)
+    with open(os.path.join(result_dir, "goal_seek.json"), "w") as f:
+        f.write(json.dumps(goal, indent=4))
+    print(f"target {goal['target_amount']:.2f}, reached by {goal['current_confidence']:.1%} of the paths today")
+    print(f"{'confidence':>10} {args.solve_for:>20} {'achieved':>9} {'input':>12} {'median':>12}")
+    for solution in goal["solutions"].values():
+        if solution["value"] is None:
+            print(f"{solution['confidence']:>10.1%} {'not reachable':>20}")
+            continue
+        print(
+            f"{solution['confidence']:>10.1%} {solution['value']:>20.2f} {solution['achieved_confidence']:>9.1%} "
+            f"{solution['input_amount']:>12.2f} {solution['final_amount']['quantile_50']:>12.2f}"
+        )
+    return 0
+
+
+def run_report(args) -> int:
+    _, result_dir = get_dirs(args)
+    if not os.path.isdir(result_dir):
+        raise FileNotFoundError(f"No results at {result_dir}, run the backtest or simulate command first")
+
+    summary_files = sorted(file_name for file_name in os.listdir(result_dir) if file_name.endswith("_summary.txt"))
+    for file_name in summary_files:
+        with open(os.path.join(result_dir, file_name), "r") as f:
+            print(f.read())
+    return 0
@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+import historical_data_analysis as hda
+from benchmarks.synthetic_data import get_synthetic_history
+
+
+@pytest.fixture
+def project_dir(tmp_path) -> str:
+    # portfolio config and stored market data, so the commands run offline
+    portfolio = [
+        {"symbol": symbol, "investment_time": 5, "initial_investment": 1000, "monthly_investment": 100}
+        for symbol in ["URTH", "EEM"]
+    ]
+    portfolio_dir = tmp_path / "data" / "portfolios"
+    portfolio_dir.mkdir(parents=True)
+    with open(portfolio_dir / "world.json", "w") as f:
+        json.dump({"portfolio": portfolio}, f)
+
+    store = hda.MarketDataStore(str(tmp_path / "data" / "market_data"))
+    for i, symbol in enumerate(["URTH", "EEM"]):
+        store.write(symbol, get_synthetic_history(120, seed=i), keep_rows=0)
+    return str(tmp_path)
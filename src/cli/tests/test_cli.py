@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import cli
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEAVY_MODULES = ["matplotlib", "requests", "pandas"]
+
+
+def run_cli(args: list) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-m", "cli"] + args, cwd=SRC_DIR, capture_output=True, text=True)
+
+
+def test_startup_does_not_import_heavy_modules(project_dir):
+    result_dir = os.path.join(project_dir, "data", "results", "world")
+    os.makedirs(result_dir)
+    with open(os.path.join(result_dir, "URTH_summary.txt"), "w") as f:
+        f.write("URTH summary")
+
+    code = (
+        "import sys, cli; "
+        f"code = cli.main(['report', '--portfolio', 'world', '--project-dir', {project_dir!r}]); "
+        f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)); sys.exit(code)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["URTH summary", "[]"]
+
+
+def test_calculator_import_does_not_load_plotting_or_requests():
+    # matplotlib is imported by the plot tasks and requests by the first download
+    code = "import sys, calculator; print(sorted(m for m in ['matplotlib', 'requests'] if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["[]"]
+
+
+def test_cached_simulate_does_not_load_plotting_or_requests(project_dir):
+    # pandas and dotenv are still imported with the analysis packages, a cached simulation without plots skips the rest
+    args = ["simulate", "--portfolio", "world", "--project-dir", project_dir, "--offline", "--seed", "1", "--no-plots"]
+    assert run_cli(args).returncode == 0
+    code = (
+        f"import sys, cli; code = cli.main({args!r}); "
+        "print(sorted(m for m in ['matplotlib', 'requests'] if m in sys.modules)); sys.exit(code)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "[]"
+
+
+def test_backtest_simulate_and_report(project_dir, capsys):
+    args = ["--portfolio", "world", "--project-dir", project_dir, "--offline"]
+    assert cli.main(["backtest"] + args) == 0
+    result_dir = os.path.join(project_dir, "data", "results", "world")
+    assert sorted(os.listdir(result_dir)) == ["EEM_summary.txt", "URTH_summary.txt", "combined_summary.txt"]
+
+    output_dir = os.path.join(project_dir, "output")
+    assert cli.main(["simulate", "--iterations", "50", "--seed", "3", "--no-plots", "--output", output_dir] + args) == 0
+    assert "Results saved to" in capsys.readouterr().out
+    assert os.path.exists(os.path.join(output_dir, "URTH_simulation_result.json"))
+    assert not any(file_name.endswith(".png") for file_name in os.listdir(output_dir))
+
+    assert cli.main(["report", "--output", output_dir] + args) == 0
+    assert "Simulation Risk" in capsys.readouterr().out
+
+
+def test_sweep(project_dir):
+    args = ["sweep", "--portfolio", "world", "--project-dir", project_dir, "--offline", "--iterations", "200"]
+    grid = ["--grid", "investment_time=2,4", "--grid", "allocation=0.7/0.3,0.5/0.5"]
+    assert cli.main(args + grid + ["--seed", "1"]) == 0
+
+    df_sweep = pd.read_csv(os.path.join(project_dir, "data", "results", "world", "sweep.csv"))
+    assert len(df_sweep) == 4
+    assert sorted(df_sweep["allocation_URTH"].unique()) == [0.5, 0.7]
+
+
+def test_goal(project_dir, capsys):
+    args = ["goal", "--portfolio", "world", "--project-dir", project_dir, "--offline", "--iterations", "500"]
+    assert cli.main(args + ["--target", "20000", "--confidence", "0.5,0.9", "--seed", "1"]) == 0
+    assert "achieved" in capsys.readouterr().out
+
+    with open(os.path.join(project_dir, "data", "results", "world", "goal_seek.json"), "r") as f:
+        goal = json.loads(f.read())
+    assert goal["solve_for"] == "monthly_investment"
+    assert goal["solutions"]["90"]["value"] > goal["solutions"]["50"]["value"]
+    assert goal["solutions"]["90"]["achieved_confidence"] >= 0.9
+
+    assert cli.main(args + ["--target", "20000", "--solve-for", "dividend_reinvestment"]) == 1
+
+
+def test_errors(project_dir, capsys):
+    assert cli.main(["report", "--portfolio", "missing", "--project-dir", project_dir]) == 1
+    assert "No results" in capsys.readouterr().err
+    assert cli.main(["sweep", "--portfolio", "world", "--project-dir", project_dir, "--grid", "monthly"]) == 1
+    with pytest.raises(SystemExit):
+        cli.main(["simulate"])
@@ -1,2 +1,7 @@
+from .cashflows import *
+from .checkpoint import *
 from .combined_analysis import *
+from .downloader import *
 from .historical_data_analysis import *
+from .market_data_store import *
+from .rolling_windows import *
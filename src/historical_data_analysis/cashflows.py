@@ -0,0 +1,93 @@
+import functools
+import json
+
+import numpy as np
+
+# regular investment -> interval in months
+INVESTMENT_INTERVALS = {
+    "monthly_money": 1,
+    "quarterly_money": 3,
+    "bi_annual_money": 6,
+    "annual_money": 12,
+}
+
+# money added in each month, the regular investments and one-off lump sums (negative amounts are withdrawals)
+CASHFLOW_COLUMNS = [*INVESTMENT_INTERVALS, "lump_sum"]
+
+# stock config keys of the cashflows beyond the fixed regular investments
+CASHFLOW_EVENTS = ["contribution_growth", "lump_sums", "pauses"]
+
+
+def get_cashflows(regular_investments: dict, number_of_months: int, start_money: float = 0.0) -> dict:
+    """Cashflow schedule of a config, shared by the backtest and the simulations.
+
+    The schedule is calculated once per config and number of months, later calls return the cached arrays. The
+    arrays are read-only, copy them before modifying.
+
+    Args:
+        regular_investments (dict): Regular investments and cashflow events, see `get_regular_investments`
+        number_of_months (int): Length of the schedule
+        start_money (float): Initial investment, added in the first month of `flow` and `input`
+
+    Returns:
+        dict: One array per column of `CASHFLOW_COLUMNS`, "contribution" (their sum), "flow" (money added at the start
+            of each month) and "input" (cumulative flow)
+    """
+    key = json.dumps(regular_investments, sort_keys=True, default=float)
+    return dict(get_cached_cashflows(key, int(number_of_months), float(start_money)))
+
+
+@functools.lru_cache(maxsize=256)
+def get_cached_cashflows(key: str, number_of_months: int, start_money: float) -> dict:
+    cashflows = calculate_cashflows(json.loads(key), number_of_months, start_money)
+    for values in cashflows.values():
+        values.flags.writeable = False
+    return cashflows
+
+
+def calculate_cashflows(regular_investments: dict, number_of_months: int, start_money: float = 0.0) -> dict:
+    """Calculates the schedule of `get_cashflows` without the cache.
+
+    Regular investments are added in the months 1, 1 + interval, ... (the first month only holds the initial
+    investment). They grow by `contribution_growth` once a year and stop during `pauses`, each a dict with the first
+    ("start") and the first month after ("end") the pause. `lump_sums` are one-off amounts ({"month", "amount"}),
+    negative amounts of regular investments and lump sums are withdrawals. Simulations limit withdrawals to the
+    total of each path and report the shortfall, backtests reject withdrawals exceeding the total.
+    """
+    month = np.arange(number_of_months)
+
+    # the regular investments of the first year are not grown
+    growth = float(regular_investments.get("contribution_growth", 0))
+    scale = (1 + growth) ** (np.maximum(month - 1, 0) // 12)
+    active = month > 0
+    for pause in regular_investments.get("pauses", []):
+        if pause["end"] <= pause["start"]:
+            raise ValueError(f"Pause {pause} needs to end after its start")
+        active &= (month < pause["start"]) | (month >= pause["end"])
+
+    cashflows = {}
+    for col, interval in INVESTMENT_INTERVALS.items():
+        amount = regular_investments.get(col, 0)
+        cashflows[col] = np.where(active & ((month - 1) % interval == 0), amount * scale, 0.0)
+
+    lump_sum = np.zeros(number_of_months)
+    for event in regular_investments.get("lump_sums", []):
+        if event["month"] < 1:
+            raise ValueError(f"Lump sum {event} needs a month of at least 1, the first month is the initial investment")
+        if event["month"] < number_of_months:
+            lump_sum[event["month"]] += event["amount"]
+    cashflows["lump_sum"] = lump_sum
+
+    contribution = np.sum([cashflows[col] for col in CASHFLOW_COLUMNS], axis=0)
+    flow = contribution.copy()
+    flow[:1] = start_money
+    cashflows["contribution"] = contribution
+    cashflows["flow"] = flow
+    cashflows["input"] = np.cumsum(flow)
+
+    return cashflows
+
+
+def get_cashflow_events(params: dict) -> dict:
+    # cashflow events of a stock config or regular investments, empty for the fixed regular investments only
+    return {key: params[key] for key in CASHFLOW_EVENTS if params.get(key)}
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cashflows import CASHFLOW_COLUMNS
+from .historical_data_analysis import (
+    backtest_kernel,
+    calculate_returns_vectorized,
+    get_backtest_summary,
+    get_contributions,
+)
+
+CHECKPOINT_VERSION = 2
+
+# market data columns of the backtest, a revision of a checkpointed month invalidates the checkpoint
+CHECKPOINT_INPUT_COLUMNS = ["open", "close", "change", "dividend"]
+
+# columns added by `calculate_returns`
+CHECKPOINT_OUTPUT_COLUMNS = ["money", *CASHFLOW_COLUMNS, "total", "dividend_gain", "return", "input"]
+
+
+class BacktestCheckpointStore:
+    """On-disk backtest checkpoints of the symbols of one portfolio.
+
+    A checkpoint holds the state after the last backtested month (total, cumulative input, dividend sum, product of
+    the monthly returns and number of months) next to the calculated columns. `update` applies only the months which
+    arrived since the checkpoint and recalculates everything if the checkpoint does not match the backtest.
+
+    Args:
+        checkpoint_dir (str): Directory of the checkpoints, one per portfolio
+    """
+
+    def __init__(self, checkpoint_dir: str):
+        self.checkpoint_dir = checkpoint_dir
+
+    def update(
+        self,
+        symbol: str,
+        df_filtered: pd.DataFrame,
+        start_money: float,
+        regular_investments: dict,
+        dividend_reinvestment: bool,
+    ) -> tuple:
+        """Backtest like `calculate_returns` continued from the stored checkpoint of `symbol`.
+
+        Returns:
+            tuple: Backtest frame and the updated checkpoint
+        """
+        df_calc, checkpoint = continue_backtest(
+            df_filtered, start_money, regular_investments, dividend_reinvestment, self.load(symbol)
+        )
+        if checkpoint is not None and checkpoint["meta"]["recalculated_months"] > 0:
+            self.save(symbol, checkpoint)
+        return df_calc, checkpoint
+
+    def load(self, symbol: str) -> dict:
+        meta_path = self.get_path(symbol, "json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.loads(f.read())
+        with np.load(self.get_path(symbol, "npz")) as columns:
+            return {"meta": meta, "columns": {col: columns[col] for col in columns.files}}
+
+    def get_summary(self, checkpoint: dict) -> dict:
+        return get_checkpoint_summary(checkpoint)
+
+    def save(self, symbol: str, checkpoint: dict):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        columns_path = self.get_path(symbol, "npz")
+        np.savez(f"{columns_path}.tmp.npz", **checkpoint["columns"])
+        os.replace(f"{columns_path}.tmp.npz", columns_path)
+
+        # meta data is written last, columns of an interrupted save do not match the previous meta data
+        meta_path = self.get_path(symbol, "json")
+        with open(f"{meta_path}.tmp", "w") as f:
+            f.write(json.dumps(checkpoint["meta"]))
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def get_path(self, symbol: str, extension: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{symbol}.{extension}")
+
+
+def continue_backtest(
+    df_filtered: pd.DataFrame,
+    start_money: float,
+    regular_investments: dict,
+    dividend_reinvestment: bool,
+    checkpoint: dict = None,
+) -> tuple:
+    """Backtest like `calculate_returns`, only the months after a valid checkpoint are calculated.
+
+    The recurrence of the new months starts from the checkpointed total, the dividend sum and the return product are
+    continued in the order of the full backtest, so the summary equals a full recalculation.
+
+    Args:
+        df_filtered (pd.DataFrame): Filtered market data of the backtest
+        start_money (float): Initial investment
+        regular_investments (dict): Regular investments, see `get_regular_investments`
+        dividend_reinvestment (bool): Whether dividends are added to the total
+        checkpoint (dict, optional): Checkpoint of a previous backtest, see `get_checkpoint`
+
+    Returns:
+        tuple: Backtest frame and the new checkpoint, None for backtests shorter than two months
+    """
+    if len(df_filtered) < 2:
+        return calculate_returns_vectorized(df_filtered, start_money, regular_investments, dividend_reinvestment), None
+
+    key = get_backtest_key(start_money, regular_investments, dividend_reinvestment)
+    invalid_reason = "no checkpoint" if checkpoint is None else check_checkpoint(checkpoint, df_filtered, key)
+    if invalid_reason is not None:
+        df_calc = calculate_returns_vectorized(df_filtered, start_money, regular_investments, dividend_reinvestment)
+        columns = {col: df_calc[col].to_numpy(dtype=np.float64) for col in CHECKPOINT_OUTPUT_COLUMNS}
+        contributions = get_contributions(np.arange(len(df_calc)), regular_investments)
+        checkpoint = get_checkpoint(df_calc, columns, key, np.cumsum(sum(contributions.values()))[-1])
+        checkpoint["meta"]["recalculated_months"] = len(df_calc)
+        checkpoint["meta"]["invalid_reason"] = invalid_reason
+        return df_calc, checkpoint
+
+    meta = checkpoint["meta"]
+    columns = checkpoint["columns"]
+    contributed = meta["contributed"]
+    number_of_months = len(df_filtered)
+    if number_of_months > meta["months"]:
+        # the last checkpointed month is the first month of the recurrence, its values are not recalculated
+        anchor_month = meta["months"] - 1
+        df_new = df_filtered.iloc[anchor_month:]
+        contributions = get_contributions(np.arange(anchor_month, number_of_months), regular_investments)
+        close = df_new["close"].to_numpy(dtype=np.float64)
+        new_columns = {"money": close / meta["start_value"] * start_money, **contributions}
+        new_columns["monthly_money"] = (
+            close / df_new["open"].to_numpy(dtype=np.float64) * contributions["monthly_money"]
+        )
+        contribution = np.column_stack([new_columns[col] for col in CASHFLOW_COLUMNS]).sum(axis=1)
+        new_columns["total"], new_columns["dividend_gain"], new_columns["return"] = backtest_kernel(
+            meta["total"],
+            df_new["change"].to_numpy(dtype=np.float64),
+            df_new["dividend"].to_numpy(dtype=np.float64),
+            contribution,
+            dividend_reinvestment,
+        )
+        # the cumulative contributions continue the cumulative sum of `calculate_returns`
+        added = sum(contributions.values())
+        added[0] = contributed
+        cumulative_contributions = np.cumsum(added)
+        contributed = cumulative_contributions[-1]
+        new_columns["input"] = start_money + cumulative_contributions
+        columns = {col: np.concatenate([columns[col], new_columns[col][1:]]) for col in CHECKPOINT_OUTPUT_COLUMNS}
+
+    df_calc = df_filtered.copy()
+    for col in CHECKPOINT_OUTPUT_COLUMNS:
+        df_calc.loc[:, col] = columns[col]
+
+    new_checkpoint = get_checkpoint(df_calc, columns, key, contributed, meta)
+    new_checkpoint["meta"]["recalculated_months"] = number_of_months - meta["months"]
+    new_checkpoint["meta"]["invalid_reason"] = None
+    return df_calc, new_checkpoint
+
+
+def get_checkpoint(df_calc: pd.DataFrame, columns: dict, key: str, contributed: float, meta: dict = None) -> dict:
+    # running sums are continued from the previous checkpoint in the order of `get_summary`
+    if meta is None:
+        dividend_sum = sum(columns["dividend_gain"][1:].tolist())
+        return_product = math.prod(columns["return"][1:].tolist())
+    else:
+        new_months = meta["months"]
+        dividend_sum = sum(columns["dividend_gain"][new_months:].tolist(), meta["dividend_sum"])
+        return_product = math.prod([meta["return_product"]] + columns["return"][new_months:].tolist())
+
+    dates = df_calc["date"]
+    return {
+        "meta": {
+            "version": CHECKPOINT_VERSION,
+            "key": key,
+            "first_date": dates.iloc[0].isoformat(),
+            "last_date": dates.iloc[-1].isoformat(),
+            "months": len(df_calc),
+            "rows_digest": get_rows_digest(df_calc, len(df_calc)),
+            "start_value": float(df_calc["open"].iloc[0]),
+            "total": float(columns["total"][-1]),
+            "input": float(columns["input"][-1]),
+            "contributed": float(contributed),
+            "dividend_sum": float(dividend_sum),
+            "return_product": float(return_product),
+        },
+        "columns": columns,
+    }
+
+
+def check_checkpoint(checkpoint: dict, df_filtered: pd.DataFrame, key: str) -> str:
+    """Returns why `checkpoint` cannot be continued with `df_filtered`, None for a valid checkpoint."""
+    meta = checkpoint["meta"]
+    if meta.get("version") != CHECKPOINT_VERSION:
+        return "checkpoint version changed"
+    if meta["key"] != key:
+        return "investment parameters changed"
+    if pd.Timestamp(meta["first_date"]) != df_filtered["date"].iloc[0]:
+        return "backtest window moved"
+    if len(df_filtered) < meta["months"]:
+        return "market data ends before the checkpoint"
+    if any(len(column) != meta["months"] for column in checkpoint["columns"].values()):
+        return "checkpoint columns are incomplete"
+    if get_rows_digest(df_filtered, meta["months"]) != meta["rows_digest"]:
+        return "market data of checkpointed months changed"
+    return None
+
+
+def get_backtest_key(start_money: float, regular_investments: dict, dividend_reinvestment: bool) -> str:
+    params = {
+        "start_money": start_money,
+        "regular_investments": regular_investments,
+        "dividend_reinvestment": dividend_reinvestment,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=float).encode()).hexdigest()
+
+
+def get_rows_digest(df: pd.DataFrame, rows: int) -> str:
+    # fingerprint of the market data of the first `rows` months
+    digest = hashlib.sha256(df["date"].to_numpy(dtype="datetime64[ns]")[:rows].tobytes())
+    for col in CHECKPOINT_INPUT_COLUMNS:
+        digest.update(np.ascontiguousarray(df[col].to_numpy(dtype=np.float64)[:rows]).tobytes())
+    return digest.hexdigest()
+
+
+def get_checkpoint_summary(checkpoint: dict) -> dict:
+    """Summary of the backtest with the schema of `get_summary`, calculated from the checkpointed state."""
+    meta = checkpoint["meta"]
+    return get_backtest_summary(
+        meta["total"], meta["input"], meta["dividend_sum"], meta["return_product"], meta["months"]
+    )
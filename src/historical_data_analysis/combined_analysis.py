@@ -2,63 +2,66 @@ import math
 
 import pandas as pd
 
+import project_helpers as hp
+
+from .cashflows import CASHFLOW_COLUMNS
 from .historical_data_analysis import past_stock_investment_outcome
 
+# money added per month, lump sums included
+CONTRIBUTION_COLUMNS = CASHFLOW_COLUMNS
+COMBINED_COLUMNS = CONTRIBUTION_COLUMNS + ["total", "input", "dividend_gain"]
+
 
-def collect_data(portfolio: dict) -> dict:
-    portfolio_outcome: dict = {"data": {}, "summary": {}}
+def collect_data(portfolio: dict, market_data=None, checkpoints=None) -> dict:
+    portfolio_outcome: dict = {"data": {}, "summary": {}, "history": {}}
+    # a store with a downloader fetches all stale symbols concurrently before the backtests
+    if hasattr(market_data, "prefetch"):
+        with hp.span("prefetch"):
+            market_data.prefetch([params["symbol"] for params in portfolio])
     for params in portfolio:
-        outcome: dict = past_stock_investment_outcome(params)
+        with hp.span("past_stock_investment_outcome", symbol=params["symbol"]):
+            outcome: dict = past_stock_investment_outcome(params, market_data, checkpoints)
         data: pd.DataFrame = outcome["data"]
         summary: dict = outcome["summary"]
 
         portfolio_outcome["data"][params["symbol"]] = data
         portfolio_outcome["summary"][params["symbol"]] = summary
+        portfolio_outcome["history"][params["symbol"]] = outcome["history"]
 
     return portfolio_outcome
 
 
-def combine_data(data: pd.DataFrame) -> pd.DataFrame:
-    df_combined = pd.DataFrame(columns=list(data.values())[0].columns)
-    for stock_name, stock_df in data.items():
-        df_combined = df_combined.merge(
-            stock_df,
-            left_on="date",
-            right_on="date",
-            suffixes=("", f"_{stock_name}"),
-            how="outer",
-        )
-    stock_names = list(data.keys())
-    df_combined = df_combined[
-        [col for col in df_combined.columns if col.split("_")[-1] in stock_names or col == "date"]
-    ]
-    df_combined.fillna(0, inplace=True)
-
-    col_list = [
-        "monthly_money",
-        "quarterly_money",
-        "bi_annual_money",
-        "annual_money",
-        "total",
-        "input",
-        "dividend_gain",
-    ]
-    for column in col_list:
-        df_combined.loc[:, f"{column}_combined"] = 0
-        for stock_name in stock_names:
-            df_temp = df_combined.copy()
-            df_temp.loc[:, f"{column}_combined"] += df_temp.loc[:, f"{column}_{stock_name}"]
-            df_combined = df_temp
+def combine_data(data: dict) -> pd.DataFrame:
+    panel: pd.DataFrame = get_panel(data)
 
+    # one reduction across the symbol axis per combined column
+    df_combined = pd.DataFrame(
+        {f"{column}_combined": panel.xs(column, axis=1, level=1).sum(axis=1) for column in COMBINED_COLUMNS}
+    )
+    contribution_columns = [f"{column}_combined" for column in CONTRIBUTION_COLUMNS]
     df_combined.loc[:, "return_combined"] = df_combined.loc[:, "total_combined"] / (
-        df_combined.loc[:, "total_combined"].shift(1)
-        + df_combined.loc[:, "monthly_money_combined"]
-        + df_combined.loc[:, "quarterly_money_combined"]
-        + df_combined.loc[:, "bi_annual_money_combined"]
-        + df_combined.loc[:, "annual_money_combined"]
+        df_combined.loc[:, "total_combined"].shift(1) + df_combined.loc[:, contribution_columns].sum(axis=1)
     )
 
-    return df_combined
+    # flat `<column>_<symbol>` columns of all symbols, followed by the combined columns
+    panel.columns = [f"{column}_{stock_name}" for stock_name, column in panel.columns]
+    df_combined = pd.concat([panel, df_combined], axis=1)
+
+    return df_combined.reset_index()
+
+
+def get_panel(data: dict) -> pd.DataFrame:
+    """Aligns the data of all symbols in one step.
+
+    Args:
+        data (dict): Investment outcome DataFrame per symbol
+
+    Returns:
+        pd.DataFrame: Date indexed panel with (symbol, column) columns, months without data of a symbol are 0
+    """
+    panel = pd.concat({stock_name: df.set_index("date") for stock_name, df in data.items()}, axis=1, sort=True)
+    panel.index.name = "date"
+    return panel.fillna(0)
 
 
 def get_combined_summary(df_combined: pd.DataFrame) -> dict:
@@ -81,11 +84,14 @@ def get_combined_summary(df_combined: pd.DataFrame) -> dict:
     return summary
 
 
-def portfolio_past_outcome(portfolio: dict) -> dict:
-    portfolio_outcome: dict = collect_data(portfolio)
-    df_combined: pd.DataFrame = combine_data(portfolio_outcome["data"])
-    summary_combined: dict = get_combined_summary(df_combined)
-    summary_combined["investment_time"] = max([p["investment_time"] for p in portfolio])
+def portfolio_past_outcome(portfolio: dict, market_data=None, checkpoints=None) -> dict:
+    portfolio_outcome: dict = collect_data(portfolio, market_data, checkpoints)
+    with hp.span("combine_data", symbols=len(portfolio)):
+        df_combined: pd.DataFrame = combine_data(portfolio_outcome["data"])
+        summary_combined: dict = get_combined_summary(df_combined)
+    summary_combined["investment_time"] = max(
+        portfolio_outcome["summary"][params["symbol"]]["investment_time"] for params in portfolio
+    )
 
     portfolio_outcome["data"] = df_combined
     portfolio_outcome["summary"]["combined"] = summary_combined
@@ -0,0 +1,227 @@
+import asyncio
+import os
+from time import monotonic
+
+import pandas as pd
+
+import project_helpers as hp
+
+from .historical_data_analysis import ALPHAVANTAGE_URL, API_KEY, clean_data
+
+# free tier quota of Alpha Vantage, override with ALPHAVANTAGE_REQUESTS_PER_MINUTE
+DEFAULT_REQUESTS_PER_MINUTE = float(os.getenv("ALPHAVANTAGE_REQUESTS_PER_MINUTE", 5))
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RETRIES = 4
+DEFAULT_TIMEOUT = 30
+
+# keys of Alpha Vantage responses which signal an exceeded quota instead of data
+THROTTLING_KEYS = ["Note", "Information"]
+
+
+class ThrottledError(Exception):
+    """The request was rejected because of the rate limit, it is retried after a backoff."""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket rate limit shared by asyncio tasks.
+
+    Tokens are refilled at `requests_per_minute / 60` per second up to `burst` tokens, every request takes one token.
+    Waiting tasks are served in the order they arrived.
+
+    Args:
+        requests_per_minute (float): Sustained request rate
+        burst (int, optional): Number of requests which may be sent at once, defaults to one minute of requests
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = None):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1, int(requests_per_minute) if burst is None else burst)
+        self.tokens = float(self.capacity)
+        self.updated = monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        # the lock is created in the running event loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AlphaVantageDownloader:
+    """Concurrent downloader of monthly series within the Alpha Vantage rate limit.
+
+    Requests run in worker threads on one pooled `requests.Session`, so connections are reused. At most
+    `concurrency` requests are in flight, and every request waits for a token of the rate limit. Throttled requests
+    (quota notes, HTTP 429 and 5xx responses, connection errors) are retried with exponential backoff.
+
+    Args:
+        base_url (str, optional): Endpoint, defaults to `ALPHAVANTAGE_URL`
+        api_key (str, optional): API key, defaults to `ALPHAVANTAGE_API_KEY`
+        requests_per_minute (float): Rate limit
+        burst (int, optional): Requests which may be sent at once, see `TokenBucket`
+        concurrency (int): Maximum number of requests in flight
+        retries (int): Retries of a throttled or failed request
+        backoff (float): Delay before the first retry in seconds, doubled with every retry
+        max_backoff (float): Upper bound of the retry delay
+        timeout (float): Timeout of every request in seconds
+    """
+
+    def __init__(
+        self,
+        base_url: str = None,
+        api_key: str = None,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        burst: int = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = 15.0,
+        max_backoff: float = 120.0,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.base_url = ALPHAVANTAGE_URL if base_url is None else base_url
+        self.api_key = API_KEY if api_key is None else api_key
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = None
+
+    def get_session(self):
+        # imported and created on the first request, one pooled connection per concurrent request
+        if self.session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        return self.session
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def fetch(self, symbol: str) -> pd.DataFrame:
+        """Returns the raw frame of one symbol, like `get_raw_data`."""
+        return fetch_raw_data([symbol], self)[symbol]
+
+    def request(self, symbol: str, attempt: int = 0) -> pd.DataFrame:
+        import requests
+
+        # runs in a worker thread, the span is nested in the stack of that thread instead of the event loop
+        params = {"function": "TIME_SERIES_MONTHLY_ADJUSTED", "symbol": symbol, "apikey": self.api_key}
+        try:
+            with hp.span("alpha_vantage_request", symbol=symbol, attempt=attempt):
+                response = self.get_session().get(self.base_url, params=params, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            raise ThrottledError(f"Request of '{symbol}' failed: {error!r}") from error
+
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise ThrottledError(
+                f"Request of '{symbol}' returned HTTP {response.status_code}",
+                None if retry_after is None else float(retry_after),
+            )
+        response.raise_for_status()
+
+        data = response.json()
+        if "Monthly Adjusted Time Series" in data:
+            return pd.DataFrame.from_dict(data["Monthly Adjusted Time Series"], orient="index")
+        for key in THROTTLING_KEYS:
+            if key in data:
+                raise ThrottledError(f"Request of '{symbol}' was throttled: {data[key]}")
+        raise ValueError(f"No monthly data for '{symbol}': {data.get('Error Message', data)}")
+
+    async def fetch_async(self, symbol: str, rate_limit: TokenBucket, semaphore: asyncio.Semaphore) -> pd.DataFrame:
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    # the token is taken right before the request, requests waiting for a slot do not use up tokens
+                    await rate_limit.acquire()
+                    return await asyncio.to_thread(self.request, symbol, attempt)
+            except ThrottledError as error:
+                if attempt == self.retries:
+                    raise error
+                delay = min(self.max_backoff, self.backoff * 2**attempt)
+                await asyncio.sleep(delay if error.retry_after is None else max(delay, error.retry_after))
+
+    async def iter_raw_data(self, symbols: list):
+        """Yields (symbol, raw frame, error) of all symbols in the order the downloads complete."""
+        rate_limit = TokenBucket(self.requests_per_minute, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_symbol(symbol: str) -> tuple:
+            try:
+                return symbol, await self.fetch_async(symbol, rate_limit, semaphore), None
+            except Exception as error:
+                return symbol, None, error
+
+        tasks = [asyncio.ensure_future(fetch_symbol(symbol)) for symbol in symbols]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_raw_data(symbols: list, downloader: AlphaVantageDownloader = None) -> dict:
+    # raw frames of all symbols, raises the first error
+    async def collect() -> dict:
+        raw_data = {}
+        async for symbol, df_raw, error in downloader.iter_raw_data(symbols):
+            if error is not None:
+                raise error
+            raw_data[symbol] = df_raw
+        return raw_data
+
+    downloader = AlphaVantageDownloader() if downloader is None else downloader
+    return asyncio.run(collect())
+
+
+def fetch_market_data(symbols: list, downloader: AlphaVantageDownloader = None, on_result=None) -> tuple:
+    """Downloads and cleans many symbols concurrently.
+
+    Every symbol is cleaned as soon as its download completes, while the other downloads continue.
+
+    Args:
+        symbols (list): Stock symbols
+        downloader (AlphaVantageDownloader, optional): Configured downloader, defaults to the Alpha Vantage limits
+        on_result (callable, optional): Called with (symbol, cleaned frame) for every completed symbol
+
+    Returns:
+        tuple: Cleaned frame per symbol and the error per failed symbol
+    """
+
+    async def collect() -> tuple:
+        results = {}
+        errors = {}
+        async for symbol, df_raw, error in downloader.iter_raw_data(symbols):
+            if error is not None:
+                errors[symbol] = error
+                continue
+            with hp.span("clean_data", symbol=symbol):
+                results[symbol] = clean_data(df_raw)
+            if on_result is not None:
+                on_result(symbol, results[symbol])
+        return results, errors
+
+    downloader = AlphaVantageDownloader() if downloader is None else downloader
+    return asyncio.run(collect())
@@ -2,19 +2,31 @@ import math
 import os
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
-import requests
 from dotenv import load_dotenv
 
+import project_helpers as hp
+
+from .cashflows import CASHFLOW_COLUMNS, get_cashflow_events, get_cashflows
+
 # Load environment variables from the .env file
 load_dotenv()
 API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
+ALPHAVANTAGE_URL = os.getenv("ALPHAVANTAGE_URL", "https://www.alphavantage.co/query")
+
+BACKTEST_ENGINES = ["vectorized", "loop"]
 
 
-def get_raw_data(symbol: str) -> pd.DataFrame:
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_MONTHLY_ADJUSTED&symbol={symbol}&apikey={API_KEY}"
-    response = requests.get(url)
-    data = response.json()
+def get_raw_data(symbol: str, base_url: str = None) -> pd.DataFrame:
+    # imported on the first request, runs on stored market data do not need it
+    import requests
+
+    base_url = ALPHAVANTAGE_URL if base_url is None else base_url
+    url = f"{base_url}?function=TIME_SERIES_MONTHLY_ADJUSTED&symbol={symbol}&apikey={API_KEY}"
+    with hp.span("alpha_vantage_request", symbol=symbol):
+        response = requests.get(url)
+        data = response.json()
     data_for_df = data["Monthly Adjusted Time Series"]
     df = pd.DataFrame.from_dict(data_for_df, orient="index")
     return df
@@ -47,6 +59,29 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def load_market_data(symbol: str, market_data=None) -> pd.DataFrame:
+    """Returns the cleaned monthly series of `symbol`.
+
+    Args:
+        symbol (str): Stock symbol
+        market_data (MarketDataStore | dict, optional): Source of cleaned series with a `get(symbol)` method. The data
+            is requested from Alpha Vantage if not given.
+
+    Returns:
+        pd.DataFrame: Cleaned monthly series
+    """
+    if market_data is None:
+        df_raw = get_raw_data(symbol)
+        with hp.span("clean_data", symbol=symbol):
+            return clean_data(df_raw)
+
+    with hp.span("market_data_store", symbol=symbol):
+        df = market_data.get(symbol)
+    if df is None:
+        raise KeyError(f"No market data available for '{symbol}'")
+    return df
+
+
 def filter_data(df: pd.DataFrame, filter_params: dict) -> pd.DataFrame:
     df_filtered = df.copy()
 
@@ -69,58 +104,41 @@ def filter_data(df: pd.DataFrame, filter_params: dict) -> pd.DataFrame:
 
 
 def calculate_returns(
-    df_filtered: pd.DataFrame, start_money: float, regular_investments: dict, dividend_reinvestment: bool
+    df_filtered: pd.DataFrame,
+    start_money: float,
+    regular_investments: dict,
+    dividend_reinvestment: bool,
+    engine: str = "vectorized",
 ) -> pd.DataFrame:
+    if engine == "vectorized":
+        return calculate_returns_vectorized(df_filtered, start_money, regular_investments, dividend_reinvestment)
+    if engine != "loop":
+        raise ValueError(f"Unknown backtest engine '{engine}', expected one of {BACKTEST_ENGINES}")
+
+    # reference implementation stepping through every month
     df_calc = df_filtered.copy()
 
-    # unpack regular investments
-    monthly_money: float = regular_investments["monthly_money"]
-    quarterly_money: float = regular_investments["quarterly_money"]
-    bi_annual_money: float = regular_investments["bi_annual_money"]
-    annual_money: float = regular_investments["annual_money"]
+    # regular investments and lump sums of every month
+    cashflows: dict = get_cashflows(regular_investments, len(df_calc))
 
     # get initial investment buy value
     earliest_open: datetime = df_calc["date"].min()
     start_val: float = df_calc.loc[df_calc["date"] == earliest_open, "open"].iloc[0]
 
-    # calculate sell values at the end of month
+    # calculate sell values at the end of month, the monthly investment is bought at the open
     df_calc.loc[:, "money"] = df_calc["close"] / start_val * start_money
-    df_calc.loc[:, "monthly_money"] = df_calc["close"] / df_calc["open"] * monthly_money
-    df_calc.loc[0, "monthly_money"] = 0
-    df_calc.loc[:, "quarterly_money"] = df_calc["close"] / df_calc["open"] * quarterly_money
-    df_calc.loc[0, "quarterly_money"] = 0
-    df_calc.loc[:, "bi_annual_money"] = df_calc["close"] / df_calc["open"] * bi_annual_money
-    df_calc.loc[0, "bi_annual_money"] = 0
-    df_calc.loc[:, "annual_money"] = df_calc["close"] / df_calc["open"] * annual_money
-    df_calc.loc[0, "annual_money"] = 0
-    # df_calc.loc[:, "change"] = df_calc["close"] / df_calc["close"].shift(1)
+    df_calc.loc[:, "monthly_money"] = df_calc["close"] / df_calc["open"] * cashflows["monthly_money"]
+    for col in CASHFLOW_COLUMNS[1:]:
+        df_calc.loc[:, col] = cashflows[col]
 
     df_calc.loc[0, "total"] = df_calc.loc[0, "money"]
     for i in range(1, len(df_calc)):
-        # update regular investment amounts
-        current_quarterly_money: float = quarterly_money
-        current_bi_annual_money: float = bi_annual_money
-        current_annual_money: float = annual_money
-
-        if (i - 1) % 3 != 0:
-            current_quarterly_money = 0
-        if (i - 1) % 6 != 0:
-            current_bi_annual_money = 0
-        if (i - 1) % 12 != 0:
-            current_annual_money = 0
-
-        df_calc.loc[i, "annual_money"] = current_annual_money
-        df_calc.loc[i, "bi_annual_money"] = current_bi_annual_money
-        df_calc.loc[i, "quarterly_money"] = current_quarterly_money
-
-        # calculate updated total amount based on value change and monthly investment
-        df_calc.loc[i, "total"] = (
-            df_calc.loc[i - 1, "total"] * df_calc.loc[i, "change"]
-            + df_calc.loc[i, "monthly_money"]
-            + df_calc.loc[i, "quarterly_money"]
-            + df_calc.loc[i, "bi_annual_money"]
-            + df_calc.loc[i, "annual_money"]
-        )
+        contribution: float = sum(df_calc.loc[i, col] for col in CASHFLOW_COLUMNS)
+
+        # calculate updated total amount based on value change and regular investments
+        df_calc.loc[i, "total"] = df_calc.loc[i - 1, "total"] * df_calc.loc[i, "change"] + contribution
+        if df_calc.loc[i, "total"] < 0:
+            raise_uncovered_withdrawal(i, df_calc.loc[i, "total"])
         # calculate divident gain
         dividend_gain: float = df_calc.loc[i, "total"] * df_calc.loc[i, "dividend"]
         df_calc.loc[i, "dividend_gain"] = dividend_gain
@@ -128,44 +146,118 @@ def calculate_returns(
             df_calc.loc[i, "total"] += dividend_gain
 
         # calculate return
-        df_calc.loc[i, "return"] = df_calc.loc[i, "total"] / (
-            df_calc.loc[i - 1, "total"]
-            + df_calc.loc[i, "monthly_money"]
-            + df_calc.loc[i, "quarterly_money"]
-            + df_calc.loc[i, "bi_annual_money"]
-            + df_calc.loc[i, "annual_money"]
-        )
+        df_calc.loc[i, "return"] = df_calc.loc[i, "total"] / (df_calc.loc[i - 1, "total"] + contribution)
 
     # calculate input
-    df_calc.loc[:, "input"] = start_money
-    df_calc = calculate_input_for_interval(df_calc, 12, annual_money, start_money)
-    df_calc = calculate_input_for_interval(df_calc, 6, bi_annual_money, start_money)
-    df_calc = calculate_input_for_interval(df_calc, 3, quarterly_money, start_money)
-    df_calc = calculate_input_for_interval(df_calc, 1, monthly_money, start_money)
+    df_calc.loc[:, "input"] = start_money + np.cumsum(cashflows["contribution"])
 
     return df_calc
 
 
-def calculate_input_for_interval(
-    df_calc: pd.DataFrame, monthly_interval: int, amount: float, start_money: float
+def calculate_returns_vectorized(
+    df_filtered: pd.DataFrame, start_money: float, regular_investments: dict, dividend_reinvestment: bool
 ) -> pd.DataFrame:
-    # add regular amount
-    df_calc.loc[(df_calc["month_number"] - 1) % monthly_interval == 0, "input"] += (
-        (df_calc["month_number"] - 1) / monthly_interval + 1
-    ) * amount
-    # fill non investment months with input above
-    for month in range(1, monthly_interval):
-        df_calc.loc[(df_calc["month_number"] - 1) % monthly_interval == month, "input"] = df_calc["input"].shift(month)
-    df_calc.loc[0, "input"] = start_money
+    df_calc = df_filtered.copy()
+    month_number = np.arange(len(df_calc))
+
+    # get initial investment buy value
+    earliest_open: datetime = df_calc["date"].min()
+    start_val: float = df_calc.loc[df_calc["date"] == earliest_open, "open"].iloc[0]
+
+    # regular investments, the monthly one is bought at the open and sold at the close of the month
+    df_calc.loc[:, "money"] = df_calc["close"] / start_val * start_money
+    contributions: dict = get_contributions(month_number, regular_investments)
+    df_calc.loc[:, "monthly_money"] = (df_calc["close"] / df_calc["open"]).to_numpy() * contributions["monthly_money"]
+    for col in CASHFLOW_COLUMNS[1:]:
+        df_calc.loc[:, col] = contributions[col]
+
+    contribution = df_calc[CASHFLOW_COLUMNS].to_numpy().sum(axis=1)
+    total, dividend_gain, returns = backtest_kernel(
+        df_calc.loc[0, "money"],
+        df_calc["change"].to_numpy(dtype=np.float64),
+        df_calc["dividend"].to_numpy(dtype=np.float64),
+        contribution,
+        dividend_reinvestment,
+    )
+    df_calc.loc[:, "total"] = total
+    if len(df_calc) > 1:
+        df_calc.loc[:, "dividend_gain"] = dividend_gain
+        df_calc.loc[:, "return"] = returns
+
+    # calculate input
+    df_calc.loc[:, "input"] = start_money + np.cumsum(sum(contributions.values()))
 
     return df_calc
 
 
+def get_contributions(month_number: np.ndarray, regular_investments: dict) -> dict:
+    # money added per cashflow column in each month, nothing is added in the first month
+    cashflows = get_cashflows(regular_investments, int(month_number.max(initial=0)) + 1)
+    return {col: cashflows[col][month_number] for col in CASHFLOW_COLUMNS}
+
+
+def backtest_kernel(
+    start_total: float,
+    change: np.ndarray,
+    dividend: np.ndarray,
+    contribution: np.ndarray,
+    dividend_reinvestment: bool,
+) -> tuple:
+    """Solves the monthly backtest recurrence without stepping through the months.
+
+    `total[i] = (total[i - 1] * change[i] + contribution[i]) * (1 + dividend[i])` is a linear recurrence
+    `total[i] = total[i - 1] * g[i] + h[i]`, so with the prefix product `P[i] = g[1] * ... * g[i]` it reduces to
+    `total[i] = P[i] * (total[0] + cumsum(h / P)[i])`. Withdrawals exceeding the total raise a ValueError.
+
+    Args:
+        start_total (float): Total at the first month
+        change (np.ndarray): Monthly change of the close price, the first entry is ignored
+        dividend (np.ndarray): Monthly dividend relative to the close price
+        contribution (np.ndarray): Money added in each month, the first entry is ignored
+        dividend_reinvestment (bool): Whether dividends are added to the total
+
+    Returns:
+        tuple: total, dividend gain and return per month (the first month has no dividend gain and return)
+    """
+    reinvested = 1 + dividend[1:] if dividend_reinvestment else np.ones(len(change) - 1)
+    growth = change[1:] * reinvested
+    added = contribution[1:] * reinvested
+
+    prefix_product = np.cumprod(growth)
+    total = np.empty(len(change))
+    total[0] = start_total
+    total[1:] = prefix_product * (start_total + np.cumsum(added / prefix_product))
+    # totals stay exact up to the first month whose withdrawal exceeds the total
+    uncovered = np.flatnonzero(total[1:] < 0)
+    if len(uncovered) > 0:
+        raise_uncovered_withdrawal(uncovered[0] + 1, total[uncovered[0] + 1])
+
+    dividend_gain = np.full(len(change), np.nan)
+    dividend_gain[1:] = (total[:-1] * change[1:] + contribution[1:]) * dividend[1:]
+
+    returns = np.full(len(change), np.nan)
+    returns[1:] = total[1:] / (total[:-1] + contribution[1:])
+
+    return total, dividend_gain, returns
+
+
+def raise_uncovered_withdrawal(month: int, total: float):
+    # the history is fixed, a withdrawal larger than the total would leave a short position
+    raise ValueError(f"The withdrawal in month {month} exceeds the total by {-total:.2f}, the backtest cannot cover it")
+
+
 def get_summary(df_calc: pd.DataFrame) -> pd.DataFrame:
     final_amount = df_calc.loc[df_calc["date"] == df_calc["date"].max(), "total"].iloc[0]
     input_amount = df_calc.loc[df_calc["date"] == df_calc["date"].max(), "input"].iloc[0]
     total_dividend = sum(df_calc["dividend_gain"].iloc[1:])
-    annual_return = (math.prod(df_calc.loc[1:, "return"].to_list()) ** (12 / (len(df_calc) - 1)) - 1) * 100
+    return_product = math.prod(df_calc.loc[1:, "return"].to_list())
+    return get_backtest_summary(final_amount, input_amount, total_dividend, return_product, len(df_calc))
+
+
+def get_backtest_summary(
+    final_amount: float, input_amount: float, total_dividend: float, return_product: float, number_of_months: int
+) -> dict:
+    annual_return = (return_product ** (12 / (number_of_months - 1)) - 1) * 100
 
     dict_out = {
         "final_amount": round(final_amount, 2),
@@ -201,7 +293,22 @@ def get_general_summary(df):
     return general_summary
 
 
-def past_stock_investment_outcome(params: dict) -> dict:
+def past_stock_investment_outcome(params: dict, market_data=None, checkpoints=None) -> dict:
+    """Backtest of one stock config.
+
+    The backtest covers the last `investment_time` years, or all months since an optional fixed `start_date`
+    ("YYYY-MM"). Only a fixed start keeps the backtest window, so `checkpoints` are only used for configs with a
+    `start_date` and only newly arrived months are calculated. The window of `investment_time` moves by one month
+    every month and is always backtested in full.
+
+    Args:
+        params (dict): Stock config of the portfolio
+        market_data (MarketDataStore | dict, optional): Source of the cleaned series, see `load_market_data`
+        checkpoints (BacktestCheckpointStore, optional): Checkpoints of the portfolio
+
+    Returns:
+        dict: Backtest frame, summary and cleaned history
+    """
     try:
         # start_date_str = params["start_date"]
         time_frame: float = params["investment_time"]
@@ -212,29 +319,53 @@ def past_stock_investment_outcome(params: dict) -> dict:
         print("received payload: ", params)
         raise error
 
-    regular_investments: dict = {
-        "monthly_money": params.get("monthly_investment", 0),
-        "quarterly_money": params.get("quarter_investment", 0),
-        "bi_annual_money": params.get("bi_annual_investment", 0),
-        "annual_money": params.get("annual_investment", 0),
-    }
+    regular_investments: dict = get_regular_investments(params)
     dividend_reinvestment: bool = params.get("dividend_reinvestment", True)
 
-    df: pd.DataFrame = get_raw_data(symbol)
-    df: pd.DataFrame = clean_data(df)
-    df_filtered: pd.DataFrame = filter_data(df, {"time_frame": time_frame})
-    df_calc: pd.DataFrame = calculate_returns(df_filtered, start_money, regular_investments, dividend_reinvestment)
-    summary: dict = get_summary(df_calc)
-    general_summary: dict = get_general_summary(df)
+    with hp.span("load_market_data", symbol=symbol):
+        df: pd.DataFrame = load_market_data(symbol, market_data)
+    filter_params: dict = {"time_frame": time_frame}
+    if params.get("start_date") is not None:
+        filter_params = {"start_date": params["start_date"]}
+    else:
+        # a moving window never matches the first month of a checkpoint
+        checkpoints = None
+    with hp.span("filter_data", symbol=symbol):
+        df_filtered: pd.DataFrame = filter_data(df, filter_params)
+    with hp.span("calculate_returns", symbol=symbol, months=len(df_filtered)):
+        checkpoint: dict = None
+        if checkpoints is None:
+            df_calc = calculate_returns(df_filtered, start_money, regular_investments, dividend_reinvestment)
+        else:
+            df_calc, checkpoint = checkpoints.update(
+                symbol, df_filtered, start_money, regular_investments, dividend_reinvestment
+            )
+    with hp.span("get_summary", symbol=symbol):
+        summary: dict = get_summary(df_calc) if checkpoint is None else checkpoints.get_summary(checkpoint)
+        general_summary: dict = get_general_summary(df)
     summary["general"] = general_summary
-    summary["investment_time"] = time_frame
+    # a fixed start covers all months since `start_date`, not `investment_time`
+    summary["investment_time"] = time_frame if params.get("start_date") is None else round(len(df_calc) / 12, 2)
 
-    outcome: dict = {"data": df_calc, "summary": summary}
+    outcome: dict = {"data": df_calc, "summary": summary, "history": df}
 
     return outcome
 
 
-def save_summary(summary: dict, name: str, save_path: str, print_summary: bool = True, width=40):
+def get_regular_investments(params: dict) -> dict:
+    # stock config keys -> regular investments of the backtest, cashflow events only if the config has them
+    return {
+        "monthly_money": params.get("monthly_investment", 0),
+        "quarterly_money": params.get("quarter_investment", 0),
+        "bi_annual_money": params.get("bi_annual_investment", 0),
+        "annual_money": params.get("annual_investment", 0),
+        **get_cashflow_events(params),
+    }
+
+
+def save_summary(
+    summary: dict, name: str, save_path: str, print_summary: bool = True, width=40, simulation_summary: dict = None
+):
     col_widths = [int(width / 2) - 2, int(width / 2), 2]
 
     summary_lines_header = [
@@ -347,6 +478,8 @@ def save_summary(summary: dict, name: str, save_path: str, print_summary: bool =
     ]
 
     summary_lines = summary_lines_header + summary_lines_general_info + summary_lines_outcome
+    if simulation_summary is not None and simulation_summary.get("risk", None) is not None:
+        summary_lines += get_simulation_risk_lines(simulation_summary, width, col_widths)
 
     if print_summary:
         for line in summary_lines:
@@ -356,6 +489,51 @@ def save_summary(summary: dict, name: str, save_path: str, print_summary: bool =
         outfile.write("\n".join(str(i) for i in summary_lines))
 
 
+def get_simulation_risk_lines(simulation_summary: dict, width: int, col_widths: list) -> list:
+    risk: dict = simulation_summary["risk"]
+    summary_lines = [
+        "".join([" " * int(width / 2 - len("Simulation Risk") / 2), "Simulation Risk"]),
+        write_line("-", width),
+        write_table_line(
+            ["Loss Probability", "{:.2f}".format(risk["loss_probability"] * 100), "%"],
+            width,
+            col_widths=col_widths,
+        ),
+        write_line("- ", width),
+        write_table_line(["Max Drawdown", "", ""], width, col_widths=col_widths),
+        write_table_line(
+            ["   median", "{:.2f}".format(simulation_summary["max_drawdown"]["quantile_50"]), "%"],
+            width,
+            col_widths=col_widths,
+        ),
+        write_table_line(
+            ["   worst", "{:.2f}".format(simulation_summary["max_drawdown"]["max"]), "%"],
+            width,
+            col_widths=col_widths,
+        ),
+        write_table_line(["Months Under Water", "", ""], width, col_widths=col_widths),
+        write_table_line(
+            ["   median", "{:.0f}".format(simulation_summary["time_under_water"]["quantile_50"]), ""],
+            width,
+            col_widths=col_widths,
+        ),
+        write_line("- ", width),
+    ]
+
+    # loss beyond the invested capital per confidence level
+    for title, prefix in [("Value at Risk", "value_at_risk_"), ("Cond. Value at Risk", "conditional_value_at_risk_")]:
+        summary_lines.append(write_table_line([title, "", ""], width, col_widths=col_widths))
+        for key, value in risk.items():
+            if key.startswith(prefix):
+                level = key.split("_")[-1]
+                summary_lines.append(
+                    write_table_line([f"   {level}%", "{:.2f}".format(value), "$"], width, col_widths=col_widths)
+                )
+    summary_lines.append(write_line("-", width))
+
+    return summary_lines
+
+
 def write_line(symbol: str, table_width: int) -> str:
     """
     Return repetition of given `symbol`.
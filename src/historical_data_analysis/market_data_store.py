@@ -0,0 +1,179 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import project_helpers as hp
+
+from .downloader import fetch_market_data
+from .historical_data_analysis import clean_data, get_raw_data
+
+META_FILE = "meta.json"
+
+
+class MarketDataStore:
+    """On-disk store of cleaned monthly series in front of `get_raw_data`.
+
+    Every symbol is stored in its own directory with one raw binary file per column and a `meta.json` holding the
+    number of rows, the column dtypes and the time of the last fetch. Columns are loaded with memory mapping, so a
+    cached symbol is available without any parsing. Columns are never modified in place, loaded frames stay valid
+    across later writes.
+
+    Args:
+        store_dir (str): Directory of the store
+        default_ttl (timedelta): Time after which a stored symbol is refreshed
+        ttl (dict, optional): Symbol specific freshness, overrides `default_ttl`
+        offline (bool): Never request data, only serve stored symbols
+        fetch (callable): Returns the raw frame of a symbol, defaults to `get_raw_data`
+        downloader (AlphaVantageDownloader, optional): Concurrent downloader used by `prefetch`, without it symbols
+            are fetched one at a time on access
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        default_ttl: timedelta = timedelta(days=1),
+        ttl: dict = None,
+        offline: bool = False,
+        fetch=get_raw_data,
+        downloader=None,
+    ):
+        self.store_dir = store_dir
+        self.default_ttl = default_ttl
+        self.ttl = {} if ttl is None else ttl
+        self.offline = offline
+        self.fetch = fetch
+        self.downloader = downloader
+
+    def get(self, symbol: str) -> pd.DataFrame:
+        meta = self.read_meta(symbol)
+        if self.offline:
+            if meta is None:
+                raise KeyError(f"'{symbol}' is not in the market data store at {self.store_dir} (offline mode)")
+            return self.load(symbol)
+
+        if meta is not None and self.is_fresh(symbol):
+            with hp.span("load_stored", symbol=symbol):
+                return self.load(symbol)
+
+        try:
+            return self.refresh(symbol)
+        except Exception as error:
+            if meta is None:
+                raise error
+            print(f"Refreshing '{symbol}' failed, using stored data from {meta['fetched_at']}: {error!r}")
+            return self.load(symbol)
+
+    def is_fresh(self, symbol: str) -> bool:
+        meta = self.read_meta(symbol)
+        if meta is None:
+            return False
+        fetched_at = datetime.fromisoformat(meta["fetched_at"])
+        return datetime.now() - fetched_at < self.ttl.get(symbol, self.default_ttl)
+
+    def prefetch(self, symbols: list) -> list:
+        """Downloads all missing or stale symbols concurrently with the downloader of the store.
+
+        Every symbol is written to the store as soon as it is cleaned. Failed symbols are left to `get`, which falls
+        back to the stored data.
+
+        Returns:
+            list: Symbols which were downloaded
+        """
+        if self.offline or self.downloader is None:
+            return []
+        stale_symbols = [symbol for symbol in dict.fromkeys(symbols) if not self.is_fresh(symbol)]
+        if len(stale_symbols) == 0:
+            return []
+
+        results, errors = fetch_market_data(stale_symbols, self.downloader, on_result=self.update)
+        for symbol, error in errors.items():
+            print(f"Downloading '{symbol}' failed: {error!r}")
+        return list(results.keys())
+
+    def refresh(self, symbol: str) -> pd.DataFrame:
+        df_raw = self.fetch(symbol)
+        with hp.span("clean_data", symbol=symbol):
+            df_fetched = clean_data(df_raw)
+        self.update(symbol, df_fetched)
+        return self.load(symbol)
+
+    def update(self, symbol: str, df_fetched: pd.DataFrame):
+        """Merges a cleaned frame of `symbol` into the store."""
+        meta = self.read_meta(symbol)
+
+        if meta is None or meta["columns"] != {col: df_fetched[col].dtype.str for col in df_fetched.columns}:
+            self.write(symbol, df_fetched, keep_rows=0)
+            return
+
+        # the newest stored month may have been incomplete, it is replaced together with all newer months
+        last_month = pd.Timestamp(meta["last_date"]).to_period("M")
+        df_new = df_fetched.loc[df_fetched["date"].dt.to_period("M") >= last_month, :]
+        if len(df_new) == 0:
+            self.write(symbol, df_new, keep_rows=meta["rows"])
+        else:
+            self.write(symbol, df_new, keep_rows=meta["rows"] - 1)
+
+    def load(self, symbol: str) -> pd.DataFrame:
+        meta = self.read_meta(symbol)
+        if meta is None:
+            raise KeyError(f"'{symbol}' is not in the market data store at {self.store_dir}")
+
+        columns = {}
+        for col, dtype in meta["columns"].items():
+            if meta["rows"] == 0:
+                columns[col] = np.empty(0, dtype=dtype)
+                continue
+            column = np.memmap(self.get_column_path(symbol, col), dtype=dtype, mode="r", shape=(meta["rows"],))
+            columns[col] = column.view(np.ndarray)
+
+        return pd.DataFrame(columns, copy=False)
+
+    def write(self, symbol: str, df: pd.DataFrame, keep_rows: int):
+        """Replaces the stored columns of `symbol` by their first `keep_rows` rows followed by `df`."""
+        symbol_dir = os.path.join(self.store_dir, symbol)
+        if not os.path.exists(symbol_dir):
+            os.makedirs(symbol_dir)
+
+        columns = {col: df[col].dtype.str for col in df.columns}
+        for col, dtype in columns.items():
+            values = np.ascontiguousarray(df[col].to_numpy(dtype=dtype))
+            column_path = self.get_column_path(symbol, col)
+            # the kept rows and the new rows go to a new file which replaces the column, frames loaded before keep
+            # mapping the previous file and never change
+            with open(f"{column_path}.tmp", "wb") as f:
+                if keep_rows > 0:
+                    with open(column_path, "rb") as stored:
+                        f.write(stored.read(keep_rows * values.itemsize))
+                f.write(values.tobytes())
+            os.replace(f"{column_path}.tmp", column_path)
+
+        # meta data is written last, so an interrupted write never exposes partial rows
+        meta = self.read_meta(symbol) or {}
+        rows = keep_rows + len(df)
+        meta.update(
+            {
+                "symbol": symbol,
+                "rows": rows,
+                "columns": columns,
+                "fetched_at": datetime.now().isoformat(),
+            }
+        )
+        if len(df) > 0:
+            meta["last_date"] = df["date"].max().isoformat()
+        meta_path = os.path.join(symbol_dir, META_FILE)
+        with open(f"{meta_path}.tmp", "w") as f:
+            f.write(json.dumps(meta))
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def read_meta(self, symbol: str) -> dict:
+        meta_path = os.path.join(self.store_dir, symbol, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            return json.loads(f.read())
+
+    def get_column_path(self, symbol: str, col: str) -> str:
+        return os.path.join(self.store_dir, symbol, f"{col.replace(' ', '_')}.bin")
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+import project_helpers as hp
+
+from .cashflows import get_cashflows
+from .historical_data_analysis import get_regular_investments, load_market_data
+
+WINDOW_METRICS = [
+    "input_amount",
+    "final_amount",
+    "total_yield_amount",
+    "total_yield_percent",
+    "total_dividends",
+    "annual_return",
+    "max_drawdown",
+]
+
+
+def rolling_stock_investment_outcome(params: dict, market_data=None) -> dict:
+    """Backtests the stock config for every possible start month of the full history.
+
+    Args:
+        params (dict): Stock configuration, like in `past_stock_investment_outcome`
+        market_data (MarketDataStore | dict, optional): Source of cleaned series, see `load_market_data`
+
+    Returns:
+        dict: Outcome per window and its distribution, see `rolling_window_outcome`
+    """
+    df: pd.DataFrame = load_market_data(params["symbol"], market_data)
+    return rolling_window_outcome(
+        df,
+        params["investment_time"],
+        params["initial_investment"],
+        get_regular_investments(params),
+        params.get("dividend_reinvestment", True),
+    )
+
+
+def rolling_window_outcome(
+    df: pd.DataFrame,
+    investment_time: float,
+    start_money: float,
+    regular_investments: dict,
+    dividend_reinvestment: bool = True,
+) -> dict:
+    """Evaluates all windows of `investment_time * 12` consecutive months in one vectorized pass.
+
+    Every window gives the same result as `calculate_returns` on its months. The totals of all windows and months
+    follow from the prefix product of the monthly growth over the full history (see `backtest_kernel`), so no window
+    is stepped through month by month.
+
+    Args:
+        df (pd.DataFrame): Cleaned monthly series
+        investment_time (float): Length of the windows in years
+        start_money (float): Initial investment
+        regular_investments (dict): Regular investments and cashflow events, see `get_regular_investments`
+        dividend_reinvestment (bool): Whether dividends are added to the total
+
+    Returns:
+        dict: One row per window ("windows") and the distribution of every metric across windows ("summary")
+    """
+    number_of_months = int(investment_time * 12)
+    number_of_windows = len(df) - number_of_months + 1
+    if number_of_months < 2 or number_of_windows < 1:
+        raise ValueError(f"{len(df)} months of history do not cover a window of {number_of_months} months")
+
+    open_ = df["open"].to_numpy(dtype=np.float64)
+    close = df["close"].to_numpy(dtype=np.float64)
+    change = df["change"].to_numpy(dtype=np.float64)
+    dividend = df["dividend"].to_numpy(dtype=np.float64)
+
+    # growth of the total in each month, the first month of the history only serves as a start
+    reinvested = 1 + dividend if dividend_reinvestment else np.ones(len(df))
+    growth = change * reinvested
+    growth[0] = 1
+    prefix_product = np.cumprod(growth)
+
+    # (windows x months) index into the history
+    start = np.arange(number_of_windows)
+    month = np.arange(number_of_months)
+    index = start[:, None] + month
+
+    # the monthly investment is bought at the open, all others are added at the close
+    cashflows = get_cashflows(regular_investments, number_of_months)
+    nominal_contribution = cashflows["contribution"]
+    monthly_money = cashflows["monthly_money"]
+    contribution = monthly_money * close[index] / open_[index] + (nominal_contribution - monthly_money)
+
+    # total[i] = P[i] * (total[0] / P[start] + cumsum(h / P)[i]) with the prefix product P of the full history
+    start_total = close[start] / open_[start] * start_money
+    added = contribution * reinvested[index]
+    added[:, 0] = 0
+    total = prefix_product[index] * (
+        (start_total / prefix_product[start])[:, None] + np.cumsum(added / prefix_product[index], axis=1)
+    )
+
+    # like the backtest, windows whose withdrawals exceed the total are rejected
+    uncovered = (total < 0).any(axis=1)
+    if uncovered.any():
+        start_date = pd.Timestamp(df["date"].to_numpy()[start[uncovered][0]])
+        raise ValueError(f"The withdrawals of the window starting {start_date:%Y-%m} exceed its total")
+
+    returns = total[:, 1:] / (total[:, :-1] + contribution[:, 1:])
+    dividend_gain = (total[:, :-1] * change[index[:, 1:]] + contribution[:, 1:]) * dividend[index[:, 1:]]
+
+    # drawdown of the time weighted value, so contributions do not hide losses
+    value = np.cumprod(returns, axis=1)
+    peak = np.maximum(np.maximum.accumulate(value, axis=1), 1)
+    drawdown = np.maximum(1 - value / peak, 0)
+
+    input_amount = start_money + nominal_contribution.sum()
+    final_amount = total[:, -1]
+    df_windows = pd.DataFrame(
+        {
+            "start_date": df["date"].to_numpy()[start],
+            "end_date": df["date"].to_numpy()[start + number_of_months - 1],
+            "input_amount": np.full(number_of_windows, input_amount),
+            "final_amount": final_amount,
+            "total_yield_amount": final_amount - input_amount,
+            "total_yield_percent": 100 * (final_amount - input_amount) / final_amount,
+            "total_dividends": dividend_gain.sum(axis=1),
+            "annual_return": 100 * (np.prod(returns, axis=1) ** (12 / (number_of_months - 1)) - 1),
+            "max_drawdown": 100 * drawdown.max(axis=1),
+        }
+    )
+    summary = {metric: hp.summarize_values(df_windows[metric]) for metric in WINDOW_METRICS}
+
+    return {"windows": df_windows, "summary": summary}
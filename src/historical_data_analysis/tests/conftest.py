@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from benchmarks.synthetic_data import get_synthetic_raw_data
+
+
+@pytest.fixture
+def synthetic_raw_data():
+    return get_synthetic_raw_data
+
+
+class AlphaVantageStandIn:
+    """Local stand-in for the Alpha Vantage endpoint serving `time_series[symbol]`.
+
+    `throttled[symbol]` responses of a symbol are rejected first, with a quota note or `throttle_status`. Every
+    response takes `delay[symbol]` seconds. Connections are kept alive, `connections` holds the client ports.
+    """
+
+    def __init__(self):
+        self.time_series = {}
+        self.requests = []
+        self.request_times = []
+        self.throttled = {}
+        self.throttle_status = 200
+        self.delay = {}
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                symbol = query["symbol"][0]
+                with stand_in.lock:
+                    stand_in.requests.append(symbol)
+                    stand_in.request_times.append(time.monotonic())
+                    stand_in.connections.add(self.client_address[1])
+                    stand_in.active += 1
+                    stand_in.max_active = max(stand_in.max_active, stand_in.active)
+                    throttled = stand_in.throttled.get(symbol, 0) > 0
+                    if throttled:
+                        stand_in.throttled[symbol] -= 1
+                time.sleep(stand_in.delay.get(symbol, 0))
+
+                status = 200
+                if throttled and stand_in.throttle_status != 200:
+                    status = stand_in.throttle_status
+                    body = b"{}"
+                elif throttled:
+                    body = json.dumps({"Note": "Our standard API call frequency is 5 calls per minute."}).encode()
+                elif symbol not in stand_in.time_series:
+                    body = json.dumps({"Error Message": "Invalid API call."}).encode()
+                else:
+                    body = json.dumps(
+                        {
+                            "Meta Data": {"2. Symbol": symbol},
+                            "Monthly Adjusted Time Series": stand_in.time_series[symbol],
+                        }
+                    ).encode()
+                with stand_in.lock:
+                    stand_in.active -= 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/query"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def alpha_vantage():
+    stand_in = AlphaVantageStandIn()
+    yield stand_in
+    stand_in.close()
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import historical_data_analysis as hda
+
+REGULAR_INVESTMENTS = {"monthly_money": 100, "quarterly_money": 0, "bi_annual_money": 0, "annual_money": 1000}
+CASHFLOW_EVENTS = {
+    "contribution_growth": 0.1,
+    "lump_sums": [{"month": 5, "amount": 500}, {"month": 30, "amount": -2000}, {"month": 99, "amount": 1}],
+    "pauses": [{"start": 15, "end": 18}],
+}
+
+
+def test_cashflow_schedule():
+    cashflows = hda.get_cashflows({**REGULAR_INVESTMENTS, **CASHFLOW_EVENTS}, 36, 1000)
+
+    # the regular investments grow by 10% after the first year and stop in the months 15 to 17
+    expected_monthly = np.array([0] + [100] * 12 + [110] * 12 + [121] * 11, dtype=np.float64)
+    expected_monthly[15:18] = 0
+    np.testing.assert_allclose(cashflows["monthly_money"], expected_monthly)
+    np.testing.assert_allclose(np.flatnonzero(cashflows["annual_money"]), [1, 13, 25])
+    np.testing.assert_allclose(cashflows["annual_money"][[1, 13, 25]], [1000, 1100, 1210])
+
+    # lump sums after the end of the schedule are ignored, negative ones are withdrawals
+    np.testing.assert_array_equal(np.flatnonzero(cashflows["lump_sum"]), [5, 30])
+    assert cashflows["lump_sum"].sum() == -1500
+    np.testing.assert_allclose(cashflows["contribution"], sum(cashflows[col] for col in hda.CASHFLOW_COLUMNS))
+    assert cashflows["flow"][0] == 1000
+    np.testing.assert_allclose(cashflows["input"], np.cumsum(cashflows["flow"]))
+
+
+def test_fixed_regular_investments_match_intervals():
+    regular_investments = {"monthly_money": 25.5, "quarterly_money": 300, "bi_annual_money": 120, "annual_money": 1000}
+    cashflows = hda.get_cashflows(regular_investments, 40)
+
+    month = np.arange(40)
+    for col, interval in hda.INVESTMENT_INTERVALS.items():
+        expected = np.where((month > 0) & ((month - 1) % interval == 0), regular_investments[col], 0.0)
+        np.testing.assert_array_equal(cashflows[col], expected)
+    assert not cashflows["lump_sum"].any()
+
+
+def test_cashflows_are_cached_and_read_only():
+    regular_investments = {**REGULAR_INVESTMENTS, **CASHFLOW_EVENTS}
+    cashflows = hda.get_cashflows(regular_investments, 24)
+    assert hda.get_cashflows(dict(regular_investments), 24)["flow"] is cashflows["flow"]
+    assert hda.get_cashflows(regular_investments, 25)["flow"] is not cashflows["flow"]
+
+    with pytest.raises(ValueError):
+        cashflows["flow"][1] = 0
+    # the returned dict is a copy, adding keys does not change the cache
+    cashflows["extra"] = 1
+    assert "extra" not in hda.get_cashflows(regular_investments, 24)
+
+
+@pytest.mark.parametrize(
+    "events",
+    [{"lump_sums": [{"month": 0, "amount": 100}]}, {"pauses": [{"start": 10, "end": 10}]}],
+)
+def test_invalid_cashflow_events(events):
+    with pytest.raises(ValueError):
+        hda.calculate_cashflows({**REGULAR_INVESTMENTS, **events}, 24)
+
+
+def test_stock_config_events_are_backtested(synthetic_raw_data):
+    params = {
+        "symbol": "URTH",
+        "investment_time": 5,
+        "start_date": "2011-02",
+        "initial_investment": 1000,
+        "monthly_investment": 100,
+        "annual_investment": 1000,
+        **CASHFLOW_EVENTS,
+    }
+    regular_investments = hda.get_regular_investments(params)
+    assert hda.get_cashflow_events(regular_investments) == CASHFLOW_EVENTS
+
+    market_data = {"URTH": hda.clean_data(synthetic_raw_data(90))}
+    df_calc = hda.past_stock_investment_outcome(params, market_data)["data"]
+    cashflows = hda.get_cashflows(regular_investments, len(df_calc), 1000)
+    np.testing.assert_allclose(df_calc["input"], cashflows["input"])
+    np.testing.assert_array_equal(df_calc["lump_sum"], cashflows["lump_sum"])
+
+    # the withdrawal lowers the total by its amount, the monthly investment is bought at the open
+    month = 30
+    contribution = df_calc.loc[month, hda.CASHFLOW_COLUMNS].sum()
+    assert df_calc.loc[month, "lump_sum"] == -2000
+    expected = df_calc.loc[month - 1, "total"] * df_calc.loc[month, "change"] + contribution
+    assert df_calc.loc[month, "total"] == pytest.approx(expected * (1 + df_calc.loc[month, "dividend"]))
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "loop"])
+def test_backtest_rejects_uncovered_withdrawals(synthetic_raw_data, engine):
+    df = hda.filter_data(hda.clean_data(synthetic_raw_data(40)), {"start_date": "1900-01"})
+    regular_investments = {**REGULAR_INVESTMENTS, "lump_sums": [{"month": 12, "amount": -50_000}]}
+    with pytest.raises(ValueError, match="month 12"):
+        hda.calculate_returns(df, 1000, regular_investments, True, engine=engine)
+    with pytest.raises(ValueError):
+        hda.rolling_window_outcome(df, 2, 1000, regular_investments, True)
@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+
+import historical_data_analysis as hda
+
+REGULAR_INVESTMENTS = {"monthly_money": 25.5, "quarterly_money": 300, "bi_annual_money": 120, "annual_money": 1000}
+
+
+def get_history(synthetic_raw_data, number_of_months: int) -> pd.DataFrame:
+    # the longer series extends the shorter one by the newly arrived months
+    return hda.clean_data(synthetic_raw_data(number_of_months, seed=3))
+
+
+@pytest.mark.parametrize("dividend_reinvestment", [True, False])
+@pytest.mark.parametrize("new_months", [0, 1, 13])
+def test_incremental_backtest_matches_full_backtest(tmp_path, synthetic_raw_data, dividend_reinvestment, new_months):
+    params = {
+        "symbol": "URTH",
+        "investment_time": 5,
+        "start_date": "2011-02",
+        "initial_investment": 1000,
+        "monthly_investment": 25.5,
+        "quarter_investment": 300,
+        "bi_annual_investment": 120,
+        "annual_investment": 1000,
+        "dividend_reinvestment": dividend_reinvestment,
+    }
+    checkpoints = hda.BacktestCheckpointStore(str(tmp_path))
+    hda.past_stock_investment_outcome(params, {"URTH": get_history(synthetic_raw_data, 80)}, checkpoints)
+
+    market_data = {"URTH": get_history(synthetic_raw_data, 80 + new_months)}
+    incremental = hda.past_stock_investment_outcome(params, market_data, checkpoints)
+    full = hda.past_stock_investment_outcome(params, market_data)
+
+    assert checkpoints.load("URTH")["meta"]["months"] == len(full["data"])
+    assert incremental["summary"] == full["summary"]
+    assert full["summary"]["investment_time"] == round(len(full["data"]) / 12, 2)
+    pd.testing.assert_frame_equal(incremental["data"], full["data"], check_exact=False, rtol=1e-10)
+
+
+def test_moving_window_is_not_checkpointed(tmp_path, synthetic_raw_data):
+    # the window of the last `investment_time` years moves every month and is backtested in full
+    params = {"symbol": "URTH", "investment_time": 5, "initial_investment": 1000, "monthly_investment": 25.5}
+    checkpoints = hda.BacktestCheckpointStore(str(tmp_path))
+    history = hda.clean_data(synthetic_raw_data(90, seed=3, start=str(pd.Timestamp.now() - pd.DateOffset(months=89))))
+    outcome = hda.past_stock_investment_outcome(params, {"URTH": history}, checkpoints)
+
+    assert checkpoints.load("URTH") is None
+    assert outcome["summary"]["investment_time"] == 5
+
+
+def test_only_new_months_are_calculated(synthetic_raw_data):
+    df_filtered = hda.filter_data(get_history(synthetic_raw_data, 90), {"start_date": "2011-02"})
+    _, checkpoint = hda.continue_backtest(df_filtered.iloc[:60], 1000, REGULAR_INVESTMENTS, True)
+    assert checkpoint["meta"]["recalculated_months"] == 60
+    assert checkpoint["meta"]["invalid_reason"] == "no checkpoint"
+
+    df_calc, checkpoint = hda.continue_backtest(df_filtered, 1000, REGULAR_INVESTMENTS, True, checkpoint)
+    assert checkpoint["meta"]["recalculated_months"] == len(df_filtered) - 60
+    assert checkpoint["meta"]["invalid_reason"] is None
+    assert hda.get_checkpoint_summary(checkpoint) == hda.get_summary(df_calc)
+
+
+@pytest.mark.parametrize(
+    "change, reason",
+    [
+        ("parameters", "investment parameters changed"),
+        ("window", "backtest window moved"),
+        ("truncated", "market data ends before the checkpoint"),
+        ("revised", "market data of checkpointed months changed"),
+    ],
+)
+def test_mismatched_checkpoint_is_recalculated(synthetic_raw_data, change, reason):
+    df = get_history(synthetic_raw_data, 90)
+    df_filtered = hda.filter_data(df, {"start_date": "2011-02"})
+    _, checkpoint = hda.continue_backtest(df_filtered.iloc[:60], 1000, REGULAR_INVESTMENTS, True)
+
+    start_money = 1000
+    if change == "parameters":
+        start_money = 2000
+    elif change == "window":
+        df_filtered = hda.filter_data(df, {"start_date": "2011-05"})
+    elif change == "truncated":
+        df_filtered = df_filtered.iloc[:50]
+    elif change == "revised":
+        df.loc[30, "dividend"] += 0.001
+        df_filtered = hda.filter_data(df, {"start_date": "2011-02"})
+
+    assert hda.check_checkpoint(checkpoint, df_filtered, hda.get_backtest_key(start_money, REGULAR_INVESTMENTS, True))
+    df_calc, new_checkpoint = hda.continue_backtest(df_filtered, start_money, REGULAR_INVESTMENTS, True, checkpoint)
+    assert new_checkpoint["meta"]["invalid_reason"] == reason
+    assert new_checkpoint["meta"]["recalculated_months"] == len(df_filtered)
+    pd.testing.assert_frame_equal(df_calc, hda.calculate_returns(df_filtered, start_money, REGULAR_INVESTMENTS, True))
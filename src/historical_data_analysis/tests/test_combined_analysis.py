@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+import historical_data_analysis as hda
+
+REGULAR_INVESTMENTS = {"monthly_money": 100, "quarterly_money": 0, "bi_annual_money": 300, "annual_money": 0}
+
+
+def get_data(synthetic_raw_data, start_dates: dict) -> dict:
+    data = {}
+    for i, (stock_name, start_date) in enumerate(start_dates.items()):
+        df = hda.filter_data(hda.clean_data(synthetic_raw_data(seed=i)), {"start_date": start_date})
+        data[stock_name] = hda.calculate_returns(df, 1000, REGULAR_INVESTMENTS, True)
+    return data
+
+
+def combine_data_by_merging(data: dict) -> pd.DataFrame:
+    # the former implementation, an outer join per symbol, symbol names must not contain underscores
+    df_combined = pd.DataFrame(columns=list(data.values())[0].columns)
+    for stock_name, stock_df in data.items():
+        df_combined = df_combined.merge(stock_df, on="date", suffixes=("", f"_{stock_name}"), how="outer")
+    stock_names = list(data.keys())
+    df_combined = df_combined[
+        [col for col in df_combined.columns if col.split("_")[-1] in stock_names or col == "date"]
+    ]
+    df_combined = df_combined.fillna(0)
+
+    for column in hda.COMBINED_COLUMNS:
+        df_combined.loc[:, f"{column}_combined"] = 0.0
+        for stock_name in stock_names:
+            df_combined.loc[:, f"{column}_combined"] += df_combined.loc[:, f"{column}_{stock_name}"]
+    contribution_columns = [f"{column}_combined" for column in hda.CONTRIBUTION_COLUMNS]
+    df_combined.loc[:, "return_combined"] = df_combined.loc[:, "total_combined"] / (
+        df_combined.loc[:, "total_combined"].shift(1) + df_combined.loc[:, contribution_columns].sum(axis=1)
+    )
+    return df_combined
+
+
+def test_panel_matches_merged_data(synthetic_raw_data):
+    # histories of different lengths, starting and ending in different months
+    histories = {"AAA": (90, "2010-01-31"), "BBB": (50, "2012-05-31"), "CCC": (70, "2009-03-31")}
+    data = {}
+    for i, (stock_name, (number_of_months, start)) in enumerate(histories.items()):
+        df = hda.filter_data(hda.clean_data(synthetic_raw_data(number_of_months, i, start)), {"start_date": "1900-01"})
+        data[stock_name] = hda.calculate_returns(df, 1000, REGULAR_INVESTMENTS, True)
+
+    df_combined = hda.combine_data(data)
+    df_merged = combine_data_by_merging(data)
+    assert len(df_combined) > max(len(df) for df in data.values())
+    pd.testing.assert_frame_equal(df_combined, df_merged, check_dtype=False)
+    assert hda.get_combined_summary(df_combined) == hda.get_combined_summary(df_merged)
+
+
+def test_combined_columns_are_sums_over_symbols(synthetic_raw_data):
+    data = get_data(synthetic_raw_data, {"AAA": "2011-02", "BBB": "2013-06", "C_C": "2015-01"})
+    df_combined = hda.combine_data(data)
+
+    assert df_combined["date"].is_monotonic_increasing
+    assert len(df_combined) == len(data["AAA"])
+    symbol_columns = [f"{col}_AAA" for col in data["AAA"].columns if col != "date"]
+    assert df_combined.columns[1] == "month_number_AAA"
+    assert all(col in df_combined.columns for col in symbol_columns)
+
+    # symbols without data in a month contribute 0
+    assert (df_combined.loc[df_combined["date"] < data["BBB"]["date"].min(), "total_BBB"] == 0).all()
+    for column in hda.COMBINED_COLUMNS:
+        expected = sum(df_combined[f"{column}_{stock_name}"] for stock_name in data.keys())
+        np.testing.assert_allclose(df_combined[f"{column}_combined"], expected)
+
+
+def test_single_symbol_summary_matches_symbol_summary(synthetic_raw_data):
+    data = get_data(synthetic_raw_data, {"AAA": "2011-02"})
+    df_combined = hda.combine_data(data)
+
+    pd.testing.assert_series_equal(
+        df_combined["total_combined"], data["AAA"]["total"], check_names=False, check_index=False
+    )
+    summary = hda.get_summary(data["AAA"])
+    combined_summary = hda.get_combined_summary(df_combined)
+    for key in ["final_amount", "input_amount", "total_yield_amount"]:
+        assert combined_summary[key] == summary[key]
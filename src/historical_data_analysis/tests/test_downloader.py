@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+import historical_data_analysis.downloader as downloader_module
+from benchmarks.synthetic_data import get_synthetic_time_series
+from historical_data_analysis import (
+    AlphaVantageDownloader,
+    MarketDataStore,
+    ThrottledError,
+    TokenBucket,
+    clean_data,
+    fetch_market_data,
+    get_raw_data,
+)
+
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF"]
+
+
+def get_downloader(url: str, **kwargs) -> AlphaVantageDownloader:
+    params = {"requests_per_minute": 60000, "concurrency": 3, "retries": 2, "backoff": 0.01, "timeout": 5}
+    return AlphaVantageDownloader(base_url=url, api_key="test", **{**params, **kwargs})
+
+
+@pytest.fixture
+def stand_in(alpha_vantage):
+    for seed, symbol in enumerate(SYMBOLS):
+        alpha_vantage.time_series[symbol] = get_synthetic_time_series(36, seed)
+    return alpha_vantage
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    # the rate limit sleeps on a fake clock, which only moves when a task sleeps
+    class FakeClock:
+        now = 0.0
+
+        async def sleep(self, delay: float):
+            self.now += delay
+
+    clock = FakeClock()
+    monkeypatch.setattr(downloader_module, "monotonic", lambda: clock.now)
+    monkeypatch.setattr(downloader_module.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_concurrent_download_reuses_connections(stand_in):
+    for symbol in SYMBOLS:
+        stand_in.delay[symbol] = 0.2
+    downloader = get_downloader(stand_in.url)
+    results, errors = fetch_market_data(SYMBOLS, downloader)
+    downloader.close()
+
+    # three requests in flight on at most three pooled connections
+    assert stand_in.max_active == 3
+    assert len(stand_in.connections) <= 3
+    assert errors == {}
+    assert sorted(results.keys()) == SYMBOLS
+    assert results["CCC"].equals(clean_data(get_raw_data("CCC", stand_in.url)))
+
+
+def test_results_are_cleaned_as_they_complete(stand_in):
+    stand_in.delay["AAA"] = 0.3
+    completed = []
+    fetch_market_data(["AAA", "BBB", "CCC"], get_downloader(stand_in.url), on_result=lambda s, df: completed.append(s))
+
+    assert completed[-1] == "AAA"
+
+
+def test_token_bucket_limits_rate(stand_in):
+    # 600 requests per minute, one request every 0.1s after the burst of two
+    fetch_market_data(SYMBOLS[:5], get_downloader(stand_in.url, requests_per_minute=600, burst=2))
+
+    request_times = sorted(stand_in.request_times)
+    assert request_times[-1] - request_times[0] >= 0.25
+
+
+def test_token_bucket_burst(fake_clock):
+    async def acquire_all(bucket: TokenBucket, n: int) -> float:
+        start_time = fake_clock.now
+        for _ in range(n):
+            await bucket.acquire()
+        return fake_clock.now - start_time
+
+    assert asyncio.run(acquire_all(TokenBucket(60, burst=3), 3)) == 0
+    # 20 requests per second, the two requests after the burst wait 0.05s each
+    assert asyncio.run(acquire_all(TokenBucket(1200, burst=1), 3)) == pytest.approx(0.1)
+
+
+def test_tokens_are_taken_by_requests_in_flight(stand_in, monkeypatch):
+    # a token is taken once a request has a slot, so requests waiting for a slot do not use up the quota
+    buckets = []
+
+    class RecordingBucket(TokenBucket):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.acquired = 0
+            buckets.append(self)
+
+        async def acquire(self):
+            await super().acquire()
+            self.acquired += 1
+
+    unsent_tokens = []
+    downloader = get_downloader(stand_in.url, concurrency=2)
+    request = downloader.request
+
+    def recording_request(symbol: str, attempt: int = 0):
+        unsent_tokens.append(buckets[0].acquired - len(unsent_tokens))
+        return request(symbol, attempt)
+
+    monkeypatch.setattr(downloader_module, "TokenBucket", RecordingBucket)
+    monkeypatch.setattr(downloader, "request", recording_request)
+    for symbol in SYMBOLS:
+        stand_in.delay[symbol] = 0.05
+    results, errors = fetch_market_data(SYMBOLS, downloader)
+
+    assert errors == {}
+    assert max(unsent_tokens) <= 2
+
+
+@pytest.mark.parametrize("throttle_status", [200, 429, 503])
+def test_throttled_requests_are_retried(stand_in, throttle_status):
+    stand_in.throttle_status = throttle_status
+    stand_in.throttled["AAA"] = 2
+    results, errors = fetch_market_data(["AAA", "BBB"], get_downloader(stand_in.url))
+
+    assert errors == {}
+    assert sorted(results.keys()) == ["AAA", "BBB"]
+    assert stand_in.requests.count("AAA") == 3
+    assert stand_in.requests.count("BBB") == 1
+
+
+def test_retries_are_exhausted(stand_in):
+    stand_in.throttled["AAA"] = 5
+    results, errors = fetch_market_data(["AAA", "BBB"], get_downloader(stand_in.url, retries=1))
+
+    assert list(results.keys()) == ["BBB"]
+    assert isinstance(errors["AAA"], ThrottledError)
+    assert stand_in.requests.count("AAA") == 2
+
+
+def test_unknown_symbol_is_not_retried(stand_in):
+    downloader = get_downloader(stand_in.url)
+    with pytest.raises(ValueError, match="Invalid API call"):
+        downloader.fetch("ZZZ")
+
+    assert stand_in.requests == ["ZZZ"]
+
+
+def test_store_prefetch(stand_in, tmp_path):
+    store = MarketDataStore(str(tmp_path), fetch=None, downloader=get_downloader(stand_in.url))
+    assert sorted(store.prefetch(SYMBOLS[:3] + ["ZZZ"])) == SYMBOLS[:3]
+    # fresh symbols are served from the store without another request
+    assert store.prefetch(SYMBOLS[:3]) == []
+    assert store.get("AAA").equals(clean_data(get_raw_data("AAA", stand_in.url)))
+    assert sorted(stand_in.requests) == ["AAA", "AAA", "BBB", "CCC", "ZZZ"]
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+import historical_data_analysis as hda
+
+
+@pytest.fixture
+def df_filtered(synthetic_raw_data) -> pd.DataFrame:
+    df = hda.clean_data(synthetic_raw_data())
+    return hda.filter_data(df, {"start_date": "2011-02"})
+
+
+@pytest.mark.parametrize("dividend_reinvestment", [True, False])
+@pytest.mark.parametrize(
+    "regular_investments",
+    [
+        {"monthly_money": 0, "quarterly_money": 0, "bi_annual_money": 0, "annual_money": 0},
+        {"monthly_money": 100, "quarterly_money": 0, "bi_annual_money": 0, "annual_money": 0},
+        {"monthly_money": 25.5, "quarterly_money": 300, "bi_annual_money": 120, "annual_money": 1000},
+        {
+            "monthly_money": 50,
+            "quarterly_money": 0,
+            "bi_annual_money": 0,
+            "annual_money": 500,
+            "contribution_growth": 0.03,
+            "lump_sums": [{"month": 7, "amount": 2000}, {"month": 40, "amount": -1500}],
+            "pauses": [{"start": 20, "end": 26}],
+        },
+    ],
+)
+def test_vectorized_returns_match_loop(df_filtered, regular_investments, dividend_reinvestment):
+    df_loop = hda.calculate_returns(df_filtered, 1000, regular_investments, dividend_reinvestment, engine="loop")
+    df_vectorized = hda.calculate_returns(df_filtered, 1000, regular_investments, dividend_reinvestment)
+
+    pd.testing.assert_frame_equal(df_vectorized, df_loop, check_exact=False, rtol=1e-10)
+    assert hda.get_summary(df_vectorized) == hda.get_summary(df_loop)
+
+
+def test_unknown_backtest_engine(df_filtered):
+    regular_investments = {"monthly_money": 0, "quarterly_money": 0, "bi_annual_money": 0, "annual_money": 0}
+    with pytest.raises(ValueError):
+        hda.calculate_returns(df_filtered, 1000, regular_investments, True, engine="unknown")
+
+
+def test_summary_with_simulation_risk(tmp_path):
+    summary = {
+        "input_amount": 1000,
+        "final_amount": 1200,
+        "total_yield_amount": 200,
+        "total_yield_percent": 16.67,
+        "total_dividends": 10,
+        "annual_return": 3.5,
+        "investment_time": 5,
+    }
+    stats = {"quantile_50": 12.0, "max": 30.0}
+    simulation_summary = {
+        "max_drawdown": stats,
+        "time_under_water": stats,
+        "risk": {
+            "loss_probability": 0.1,
+            "value_at_risk_95": 150.0,
+            "conditional_value_at_risk_95": 250.0,
+        },
+    }
+    hda.save_summary(summary, "URTH", tmp_path / "summary.txt", False, simulation_summary=simulation_summary)
+
+    text = (tmp_path / "summary.txt").read_text()
+    assert "Simulation Risk" in text
+    assert "10.00" in text
+    assert "250.00" in text
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import historical_data_analysis as hda
+from benchmarks.synthetic_data import get_synthetic_time_series
+
+
+@pytest.fixture
+def store(tmp_path, alpha_vantage):
+    alpha_vantage.time_series["AAA"] = get_synthetic_time_series(60, seed=1)
+    alpha_vantage.time_series["BBB"] = get_synthetic_time_series(40, seed=2)
+    return hda.MarketDataStore(str(tmp_path), fetch=partial(hda.get_raw_data, base_url=alpha_vantage.url))
+
+
+def test_store_serves_cleaned_data_from_disk(store, alpha_vantage):
+    df_live = hda.clean_data(hda.get_raw_data("AAA", base_url=alpha_vantage.url))
+
+    df_first = store.get("AAA")
+    df_second = store.get("AAA")
+
+    assert alpha_vantage.requests == ["AAA", "AAA"]  # one live request above, one from the store
+    pd.testing.assert_frame_equal(df_first, df_live)
+    pd.testing.assert_frame_equal(df_second, df_live)
+
+
+def test_refresh_appends_new_months(store, alpha_vantage):
+    store.get("AAA")
+    column_path = store.get_column_path("AAA", "close")
+    with open(column_path, "rb") as f:
+        stored_before = f.read()
+
+    # the stand-in now also knows two newer months
+    alpha_vantage.time_series["AAA"] = get_synthetic_time_series(62, seed=1)
+    store.ttl["AAA"] = timedelta(0)
+    df = store.get("AAA")
+
+    assert len(df) == 62
+    pd.testing.assert_frame_equal(df, hda.clean_data(hda.get_raw_data("AAA", base_url=alpha_vantage.url)))
+    with open(column_path, "rb") as f:
+        stored_after = f.read()
+    # all months before the previously newest one are untouched
+    assert stored_after[: len(stored_before) - 8] == stored_before[:-8]
+
+
+def test_loaded_frame_is_unchanged_by_refresh(store, alpha_vantage):
+    df_loaded = store.get("AAA")
+    df_expected = df_loaded.copy()
+
+    # the refresh replaces the newest stored month and shortens the series
+    alpha_vantage.time_series["AAA"] = get_synthetic_time_series(62, seed=5)
+    store.write("AAA", hda.clean_data(hda.get_raw_data("AAA", base_url=alpha_vantage.url)).iloc[40:], keep_rows=21)
+
+    pd.testing.assert_frame_equal(df_loaded, df_expected)
+    assert len(store.load("AAA")) == 21 + 22
+
+
+def test_per_symbol_ttl(store, alpha_vantage):
+    store.ttl["BBB"] = timedelta(0)
+    for _ in range(3):
+        store.get("AAA")
+        store.get("BBB")
+
+    assert alpha_vantage.requests.count("AAA") == 1
+    assert alpha_vantage.requests.count("BBB") == 3
+    assert store.is_fresh("AAA")
+    assert not store.is_fresh("BBB")
+
+
+def test_offline_mode(store, alpha_vantage):
+    store.get("AAA")
+    offline_store = hda.MarketDataStore(store.store_dir, default_ttl=timedelta(0), offline=True)
+
+    df = offline_store.get("AAA")
+    assert len(df) == 60
+    assert np.isnan(df.loc[0, "change"])
+    with pytest.raises(KeyError):
+        offline_store.get("BBB")
+    assert alpha_vantage.requests == ["AAA"]
+
+
+def test_stored_data_is_used_when_refresh_fails(store, alpha_vantage):
+    store.get("AAA")
+    store.ttl["AAA"] = timedelta(0)
+    del alpha_vantage.time_series["AAA"]
+
+    assert len(store.get("AAA")) == 60
+
+
+def test_past_outcome_from_store(store, alpha_vantage):
+    start = (pd.Timestamp.now() - pd.DateOffset(months=59)).strftime("%Y-%m-%d")
+    alpha_vantage.time_series["AAA"] = get_synthetic_time_series(60, seed=1, start=start)
+    params = {"symbol": "AAA", "investment_time": 2, "initial_investment": 1000, "monthly_investment": 50}
+    outcome = hda.past_stock_investment_outcome(params, market_data={"AAA": store.get("AAA")})
+
+    assert outcome["summary"]["general"]["existent_years"] == 5
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import historical_data_analysis as hda
+
+REGULAR_INVESTMENTS = {"monthly_money": 100, "quarterly_money": 50, "bi_annual_money": 0, "annual_money": 500}
+
+
+@pytest.mark.parametrize("dividend_reinvestment", [True, False])
+def test_windows_match_backtest(synthetic_raw_data, dividend_reinvestment):
+    df = hda.clean_data(synthetic_raw_data(120))
+    outcome = hda.rolling_window_outcome(df, 3, 1000, REGULAR_INVESTMENTS, dividend_reinvestment)
+    df_windows = outcome["windows"]
+
+    assert len(df_windows) == 120 - 36 + 1
+    for start in [0, 1, 17, 84]:
+        end = start + 36
+        df_window = df.iloc[start:end].reset_index(drop=True)
+        df_calc = hda.calculate_returns(df_window, 1000, REGULAR_INVESTMENTS, dividend_reinvestment)
+        summary = hda.get_summary(df_calc)
+
+        window = df_windows.iloc[start]
+        assert window["start_date"] == df_window["date"].min()
+        assert window["end_date"] == df_window["date"].max()
+        assert window["final_amount"] == pytest.approx(df_calc["total"].iloc[-1], rel=1e-10)
+        assert window["input_amount"] == df_calc["input"].iloc[-1]
+        assert window["total_dividends"] == pytest.approx(df_calc["dividend_gain"].iloc[1:].sum(), rel=1e-10)
+        assert round(window["annual_return"], 2) == summary["annual_return"]
+
+        value = np.cumprod(df_calc["return"].iloc[1:])
+        expected_drawdown = 100 * (1 - value / np.maximum(np.maximum.accumulate(value), 1)).max()
+        assert window["max_drawdown"] == pytest.approx(expected_drawdown)
+
+    assert outcome["summary"]["final_amount"]["max"] == df_windows["final_amount"].max()
+
+
+def test_history_shorter_than_window(synthetic_raw_data):
+    df = hda.clean_data(synthetic_raw_data(20))
+    with pytest.raises(ValueError):
+        hda.rolling_window_outcome(df, 2, 1000, REGULAR_INVESTMENTS)
+
+
+def test_windows_with_cashflow_events(synthetic_raw_data):
+    df = hda.clean_data(synthetic_raw_data(60))
+    regular_investments = {
+        **REGULAR_INVESTMENTS,
+        "contribution_growth": 0.05,
+        "lump_sums": [{"month": 6, "amount": 3000}, {"month": 20, "amount": -1000}],
+        "pauses": [{"start": 10, "end": 14}],
+    }
+    df_windows = hda.rolling_window_outcome(df, 2, 1000, regular_investments)["windows"]
+
+    for start in [0, 36]:
+        end = start + 24
+        df_window = df.iloc[start:end].reset_index(drop=True)
+        df_calc = hda.calculate_returns(df_window, 1000, regular_investments, True)
+        assert df_windows["final_amount"].iloc[start] == pytest.approx(df_calc["total"].iloc[-1], rel=1e-10)
+        assert df_windows["input_amount"].iloc[start] == pytest.approx(df_calc["input"].iloc[-1])
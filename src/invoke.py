@@ -5,6 +5,10 @@ portfolio_name = "MSCI_world_70-30_10yrs"
 # portfolio_name = "MSCI_world_EM"
 
 portfolio_outcome = analyze_portfolio(portfolio_name)
+# command line: cd src && python -m cli simulate --portfolio MSCI_world_70-30_10yrs --seed 1
+# all portfolios in data/portfolios with shared symbol fetches
+# from calculator import analyze_all_portfolios
+# batch_outcome = analyze_all_portfolios()
 
 
 # TODO: plot whole timeline for all etfs
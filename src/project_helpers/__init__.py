@@ -1 +1,3 @@
 from .helpers import *
+from .instrumentation import *
+from .statistics import *
@@ -0,0 +1,174 @@
+import itertools
+import json
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from time import perf_counter, process_time
+
+TRACE_FORMATS = ["json", "chrome"]
+
+# shared no-op span, returned while no tracer is active
+NULL_SPAN = nullcontext()
+
+# active tracer of this process
+_tracer = None
+
+
+def span(name: str, **labels):
+    """Returns a context manager recording the enclosed block as a span of the active tracer.
+
+    Without an active tracer (see `tracing`), a shared no-op context is returned, so instrumented code costs one
+    function call per span.
+
+    Args:
+        name (str): Name of the stage
+        **labels: Labels of the span, like the symbol
+
+    Returns:
+        context manager
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, labels)
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextmanager
+def tracing(enabled: bool = True, memory: bool = True):
+    """Activates a tracer for the enclosed block.
+
+    The tracer records the spans of this process. Worker processes (the pools of the parallel engine and of the
+    plots) are not traced, every pool is recorded as one span in this process with the wall time of all its tasks.
+
+    Args:
+        enabled (bool): Whether to trace, yields None otherwise
+        memory (bool): Record the peak allocation of every span with `tracemalloc`, which slows down allocations
+
+    Yields:
+        Tracer | None: Tracer holding the recorded spans
+    """
+    global _tracer
+    if not enabled:
+        yield None
+        return
+
+    previous_tracer = _tracer
+    _tracer = Tracer(memory)
+    start_memory_tracing = memory and not tracemalloc.is_tracing()
+    if start_memory_tracing:
+        tracemalloc.start()
+    try:
+        yield _tracer
+    finally:
+        if start_memory_tracing:
+            tracemalloc.stop()
+        _tracer = previous_tracer
+
+
+class Tracer:
+    """Collects nested spans with wall time, CPU time and peak allocation.
+
+    Spans are nested per thread. The CPU time is the CPU time of the whole process during the span. The peak memory
+    of a span is its highest traced allocation above the allocation at its start, including all nested spans.
+
+    Args:
+        memory (bool): Record the peak allocation, requires `tracemalloc` to be tracing
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.start_time = perf_counter()
+        self.spans = []
+        self.ids = itertools.count()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def get_stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def get_memory(self, stack: list) -> int:
+        # folds the peak since the last reset into the innermost span and returns the current allocation
+        current, peak = tracemalloc.get_traced_memory()
+        if len(stack) > 0:
+            stack[-1]["memory_peak"] = max(stack[-1]["memory_peak"], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def add(self, record: dict):
+        with self.lock:
+            self.spans.append(record)
+
+    def to_json(self) -> dict:
+        return {"spans": sorted(self.spans, key=lambda record: record["start"])}
+
+    def to_chrome(self) -> dict:
+        # complete events ("X") of the Chrome trace event format, loadable in chrome://tracing and Perfetto
+        events = [
+            {
+                "name": record["name"],
+                "cat": "stage",
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["wall_time"] * 1e6,
+                "pid": os.getpid(),
+                "tid": record["thread"],
+                "args": {**record["labels"], "cpu_time": record["cpu_time"], "peak_memory": record["peak_memory"]},
+            }
+            for record in self.spans
+        ]
+        return {"traceEvents": sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+
+    def save(self, path: str, trace_format: str = "json"):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format '{trace_format}', expected one of {TRACE_FORMATS}")
+        trace = self.to_json() if trace_format == "json" else self.to_chrome()
+        with open(path, "w") as f:
+            f.write(json.dumps(trace, default=str))
+
+
+class Span:
+    def __init__(self, tracer: Tracer, name: str, labels: dict):
+        self.tracer = tracer
+        self.record = {"name": name, "labels": labels}
+
+    def __enter__(self):
+        stack = self.tracer.get_stack()
+        record = self.record
+        record["id"] = next(self.tracer.ids)
+        record["parent"] = stack[-1]["record"]["id"] if len(stack) > 0 else None
+        record["depth"] = len(stack)
+        record["thread"] = threading.get_ident()
+        entry = {"record": record, "memory_start": 0, "memory_peak": 0}
+        if self.tracer.memory and tracemalloc.is_tracing():
+            entry["memory_start"] = entry["memory_peak"] = self.tracer.get_memory(stack)
+        stack.append(entry)
+
+        self.cpu_start_time = process_time()
+        self.start_time = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall_time = perf_counter() - self.start_time
+        cpu_time = process_time() - self.cpu_start_time
+
+        stack = self.tracer.get_stack()
+        if self.tracer.memory and tracemalloc.is_tracing():
+            self.tracer.get_memory(stack)
+        entry = stack.pop()
+        if len(stack) > 0:
+            stack[-1]["memory_peak"] = max(stack[-1]["memory_peak"], entry["memory_peak"])
+
+        record = self.record
+        record["start"] = self.start_time - self.tracer.start_time
+        record["wall_time"] = wall_time
+        record["cpu_time"] = cpu_time
+        record["peak_memory"] = entry["memory_peak"] - entry["memory_start"]
+        record["error"] = None if exc_info[0] is None else exc_info[0].__name__
+        self.tracer.add(record)
+        return False
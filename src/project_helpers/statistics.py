@@ -0,0 +1,51 @@
+import numpy as np
+
+SUMMARY_QUANTILES = {
+    "quantile_25": 0.25,
+    "quantile_50": 0.5,
+    "quantile_75": 0.75,
+}
+
+
+def summarize_values(values: np.ndarray) -> dict:
+    """Returns the distribution statistics used throughout the simulation summaries.
+
+    Args:
+        values (np.ndarray): One value per iteration / window
+
+    Returns:
+        dict: mean, std, quartiles, min and max of `values`
+    """
+    values = np.asarray(values, dtype=np.float64)
+    quantiles = np.quantile(values, list(SUMMARY_QUANTILES.values()))
+
+    summary = {"mean": float(values.mean())}
+    summary["std"] = float(values.std(ddof=1)) if values.size > 1 else float("nan")
+    for name, quantile in zip(SUMMARY_QUANTILES.keys(), quantiles):
+        summary[name] = float(quantile)
+    summary["min"] = float(values.min())
+    summary["max"] = float(values.max())
+
+    return summary
+
+
+def summarize_columns(values: np.ndarray) -> dict:
+    """Column-wise counterpart of `summarize_values`.
+
+    Args:
+        values (np.ndarray): One row per iteration and one column per scenario
+
+    Returns:
+        dict: mean, std, quartiles, min and max of every column as arrays
+    """
+    values = np.asarray(values, dtype=np.float64)
+    quantiles = np.quantile(values, list(SUMMARY_QUANTILES.values()), axis=0)
+
+    summary = {"mean": values.mean(axis=0)}
+    summary["std"] = values.std(axis=0, ddof=1) if values.shape[0] > 1 else np.full(values.shape[1], np.nan)
+    for name, quantile in zip(SUMMARY_QUANTILES.keys(), quantiles):
+        summary[name] = quantile
+    summary["min"] = values.min(axis=0)
+    summary["max"] = values.max(axis=0)
+
+    return summary
@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pytest
+
+import project_helpers as hp
+
+
+def test_spans_are_noops_without_tracer():
+    assert hp.get_tracer() is None
+    assert hp.span("stage", symbol="URTH") is hp.NULL_SPAN
+    with hp.tracing(enabled=False) as tracer:
+        assert tracer is None
+        assert hp.span("stage") is hp.NULL_SPAN
+
+
+def test_nested_spans_record_time_and_memory():
+    with hp.tracing() as tracer:
+        with hp.span("outer", portfolio="world"):
+            with hp.span("inner", symbol="URTH"):
+                values = np.ones(2**20)
+            del values
+            with pytest.raises(KeyError):
+                with hp.span("failing"):
+                    raise KeyError("URTH")
+    assert hp.get_tracer() is None
+
+    spans = {record["name"]: record for record in tracer.to_json()["spans"]}
+    assert spans["inner"]["labels"] == {"symbol": "URTH"}
+    assert spans["inner"]["parent"] == spans["outer"]["id"]
+    assert spans["inner"]["depth"] == 1 and spans["outer"]["parent"] is None
+    assert spans["failing"]["error"] == "KeyError"
+    assert spans["outer"]["wall_time"] >= spans["inner"]["wall_time"] > 0
+    # 8 MiB array in the inner span, also counted in the outer span's peak
+    assert spans["inner"]["peak_memory"] >= 8 * 2**20
+    assert spans["outer"]["peak_memory"] >= spans["inner"]["peak_memory"]
+    assert spans["failing"]["peak_memory"] < 2**20
+
+
+def test_chrome_trace_export(tmp_path):
+    with hp.tracing(memory=False) as tracer:
+        with hp.span("stage", symbol="URTH"):
+            pass
+    tracer.save(str(tmp_path / "trace.json"), "chrome")
+
+    with open(tmp_path / "trace.json", "r") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == 1
+    assert events[0]["ph"] == "X" and events[0]["name"] == "stage"
+    assert events[0]["args"]["symbol"] == "URTH" and events[0]["args"]["peak_memory"] == 0
+    with pytest.raises(ValueError):
+        tracer.save(str(tmp_path / "trace.txt"), "text")
@@ -1 +1,12 @@
+from .array_simulation import *
+from .cache import *
+from .decumulation import *
+from .goal_seek import *
+from .parallel import *
+from .path_store import *
+from .portfolio_simulation import *
+from .rebalancing import *
+from .return_models import *
 from .simulation import *
+from .streaming import *
+from .sweep import *
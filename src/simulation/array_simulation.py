@@ -0,0 +1,274 @@
+import numpy as np
+
+import historical_data_analysis as hda
+import project_helpers as hp
+
+# schedule column -> (stock config key, interval in months)
+CONTRIBUTION_INTERVALS = {
+    "monthly_money": ("monthly_investment", 1),
+    "quarterly_money": ("quarter_investment", 3),
+    "bi_annual_money": ("bi_annual_investment", 6),
+    "annual_money": ("annual_investment", 12),
+}
+
+# confidence levels of the value at risk of the final amount
+RISK_LEVELS = [0.95, 0.99]
+
+# percentile bands of the total value over time (fan chart)
+FAN_QUANTILES = {
+    "quantile_5": 0.05,
+    "quantile_25": 0.25,
+    "quantile_50": 0.5,
+    "quantile_75": 0.75,
+    "quantile_95": 0.95,
+}
+
+
+def simulate_outcome_array(
+    stock_config,
+    monthly_change_mean,
+    monthly_change_std,
+    iterations=100,
+    rng=None,
+    return_model=None,
+    risk_levels=RISK_LEVELS,
+):
+    """Array backed counterpart of the DataFrame simulation. Draws the whole (iterations x months) return matrix at
+    once and returns the same summary dict as `summarize_simulation_outcome`.
+
+    Args:
+        stock_config (dict): Stock configuration of the portfolio
+        monthly_change_mean (float): Mean of the monthly return
+        monthly_change_std (float): Standard deviation of the monthly return
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        return_model (ReturnModel, optional): Model of the monthly changes, normal returns if not given
+        risk_levels (list): Confidence levels of the value at risk
+
+    Returns:
+        dict: Summary statistics of all iterations
+    """
+    number_of_months = int(stock_config["investment_time"] * 12)
+
+    schedule = get_contribution_schedule(stock_config, number_of_months)
+    changes = simulate_changes(monthly_change_mean, monthly_change_std, number_of_months, iterations, rng, return_model)
+    drawdown = DrawdownTracker(iterations)
+    shortfall = np.zeros(iterations) if has_withdrawals(schedule["flow"]) else None
+    total, returns = calculate_outcome_array(changes, schedule["flow"], drawdown, shortfall)
+    summary = summarize_outcome_array(
+        schedule, total, returns, drawdown=drawdown, risk_levels=risk_levels, withdrawal_shortfall=shortfall
+    )
+    fan_months = get_fan_months(number_of_months)
+    summary["fan"] = get_fan_summary(total[:, fan_months], fan_months, schedule["input"])
+
+    return summary
+
+
+def get_contribution_schedule(stock_config: dict, number_of_months: int) -> dict:
+    # cached cashflows of the config, regular investments start in the second month, the first month only holds the
+    # initial investment
+    return hda.get_cashflows(
+        hda.get_regular_investments(stock_config), number_of_months, stock_config["initial_investment"]
+    )
+
+
+def simulate_changes(
+    monthly_change_mean, monthly_change_std, number_of_months, iterations, rng=None, return_model=None
+) -> np.ndarray:
+    if return_model is not None:
+        return return_model.simulate(number_of_months, iterations, rng)
+
+    # drawing row by row matches the per iteration draws of `get_simulated_df` for the same global seed
+    if rng is None:
+        rng = np.random
+    random_return_values = rng.normal(monthly_change_mean, monthly_change_std, (iterations, number_of_months))
+    return random_return_values + 1
+
+
+def calculate_outcome_array(changes: np.ndarray, flow: np.ndarray, drawdown=None, shortfall=None) -> tuple:
+    # withdrawals (negative flows) are limited to the total of each path, the part which could not be withdrawn is
+    # added to `shortfall`
+    iterations, number_of_months = changes.shape
+    withdrawals = has_withdrawals(flow)
+    if withdrawals and shortfall is None:
+        shortfall = np.zeros(iterations)
+
+    # column major, so every monthly step works on contiguous memory
+    changes = np.asfortranarray(changes, dtype=np.float64)
+    total = np.empty((iterations, number_of_months), dtype=np.float64, order="F")
+    returns = np.full((iterations, number_of_months), np.nan, order="F")
+    invested = np.empty(iterations)
+    np.multiply(changes[:, 0], flow[0], out=total[:, 0])
+    for month in range(1, number_of_months):
+        np.add(total[:, month - 1], flow[month], out=invested)
+        if withdrawals:
+            limit_withdrawals(invested, shortfall)
+        np.multiply(invested, changes[:, month], out=total[:, month])
+        if withdrawals:
+            # paths without money keep a return of 1
+            returns[:, month] = 1
+            np.divide(total[:, month], invested, out=returns[:, month], where=invested > 0)
+        else:
+            np.divide(total[:, month], invested, out=returns[:, month])
+        if drawdown is not None:
+            drawdown.update(returns[:, month])
+
+    return total, returns
+
+
+def has_withdrawals(flow: np.ndarray) -> bool:
+    # negative flows after the initial investment are withdrawals
+    return bool((np.asarray(flow)[1:] < 0).any())
+
+
+def limit_withdrawals(invested: np.ndarray, shortfall: np.ndarray) -> np.ndarray:
+    # limits the money invested after a withdrawal to 0, the part which could not be withdrawn is added to `shortfall`
+    np.add(shortfall, np.maximum(-invested, 0), out=shortfall)
+    return np.maximum(invested, 0, out=invested)
+
+
+def summarize_outcome_array(
+    schedule: dict,
+    total: np.ndarray,
+    returns: np.ndarray,
+    dividend_gain=None,
+    drawdown=None,
+    risk_levels=RISK_LEVELS,
+    withdrawal_shortfall=None,
+) -> dict:
+    number_of_months = total.shape[1]
+
+    # summarize each iteration
+    total_dividends = None if dividend_gain is None else dividend_gain.sum(axis=1)
+    result = get_iteration_results(
+        schedule["input"][-1],
+        total[:, -1],
+        np.prod(returns[:, 1:], axis=1),
+        number_of_months,
+        total_dividends,
+        None if drawdown is None else drawdown.max_drawdown,
+        None if drawdown is None else drawdown.time_under_water,
+        withdrawal_shortfall,
+    )
+
+    # summarize summary of all iterations
+    summary = {col: hp.summarize_values(values) for col, values in result.items()}
+    if drawdown is not None:
+        summary["risk"] = get_risk_summary(result["total_yield_amount"], risk_levels)
+    return summary
+
+
+def get_risk_summary(total_yield_amount: np.ndarray, risk_levels=RISK_LEVELS) -> dict:
+    """Returns the probability of a loss and the value at risk of the final amount.
+
+    The value at risk at level `a` is the loss relative to the invested capital which is exceeded with probability
+    `1 - a`, the conditional value at risk is the mean loss beyond it (negative values are gains).
+
+    Args:
+        total_yield_amount (np.ndarray): Final amount minus input amount of every iteration
+        risk_levels (list): Confidence levels
+
+    Returns:
+        dict: loss_probability, value_at_risk_<level> and conditional_value_at_risk_<level>
+    """
+    loss = -np.asarray(total_yield_amount, dtype=np.float64)
+    risk = {"loss_probability": float((loss > 0).mean())}
+    for level in risk_levels:
+        value_at_risk = float(np.quantile(loss, level))
+        risk[f"value_at_risk_{get_level_name(level)}"] = value_at_risk
+        risk[f"conditional_value_at_risk_{get_level_name(level)}"] = float(loss[loss >= value_at_risk].mean())
+    return risk
+
+
+def get_fan_months(number_of_months: int) -> np.ndarray:
+    # first month and the end of every year, counted back from the last month
+    return np.concatenate([[0], np.arange(number_of_months - 1, 0, -12)[::-1]]).astype(np.int64)
+
+
+def get_fan_summary(fan_total: np.ndarray, fan_months: np.ndarray, input_amount: np.ndarray) -> dict:
+    """Returns the percentile bands of the total value at the fan chart months.
+
+    Args:
+        fan_total (np.ndarray): (iterations x fan months) total value of every path
+        fan_months (np.ndarray): Months of the fan chart, see `get_fan_months`
+        input_amount (np.ndarray): Cumulative input amount of every month
+
+    Returns:
+        dict: months, input and one list per quantile of `FAN_QUANTILES`
+    """
+    quantiles = np.quantile(fan_total, list(FAN_QUANTILES.values()), axis=0)
+    fan = {"months": fan_months.tolist(), "input": np.asarray(input_amount, dtype=np.float64)[fan_months].tolist()}
+    for name, values in zip(FAN_QUANTILES.keys(), quantiles):
+        fan[name] = values.tolist()
+    return fan
+
+
+def get_level_name(level: float) -> str:
+    # 0.95 -> "95", 0.975 -> "97.5"
+    return f"{level * 100:g}"
+
+
+class DrawdownTracker:
+    """Running drawdown of the time weighted value of every path (and symbol), updated with the return of each
+    month."""
+
+    def __init__(self, shape):
+        self.value = np.ones(shape)
+        self.peak = np.ones(shape)
+        self.max_drawdown = np.zeros(shape)
+        self.months_under_water = np.zeros(shape, dtype=np.int64)
+        self.time_under_water = np.zeros(shape, dtype=np.int64)
+
+    def update(self, monthly_return: np.ndarray):
+        self.value *= monthly_return
+        np.maximum(self.peak, self.value, out=self.peak)
+        np.maximum(self.max_drawdown, 1 - self.value / self.peak, out=self.max_drawdown)
+        # longest stretch of consecutive months below the previous peak
+        under_water = self.value < self.peak
+        self.months_under_water = np.where(under_water, self.months_under_water + 1, 0)
+        np.maximum(self.time_under_water, self.months_under_water, out=self.time_under_water)
+
+
+class FanTracker:
+    """Total value of every path (and symbol) at the months of the fan chart, updated with the total of each
+    month."""
+
+    def __init__(self, number_of_months: int, shape):
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        self.months = get_fan_months(number_of_months)
+        self.index = {month: i for i, month in enumerate(self.months.tolist())}
+        self.total = np.empty((shape[0], len(self.months)) + shape[1:])
+
+    def update(self, month: int, total: np.ndarray):
+        i = self.index.get(month)
+        if i is not None:
+            self.total[:, i] = total
+
+
+def get_iteration_results(
+    input_amount,
+    final_amount,
+    return_product,
+    number_of_months,
+    total_dividends=None,
+    max_drawdown=None,
+    time_under_water=None,
+    withdrawal_shortfall=None,
+) -> dict:
+    # per iteration values of the simulation summary, withdrawals which could not be taken stay part of the input
+    result = {
+        "input_amount": np.full_like(final_amount, input_amount),
+        "final_amount": final_amount,
+    }
+    if withdrawal_shortfall is not None:
+        result["input_amount"] = result["input_amount"] + withdrawal_shortfall
+    result["total_yield_amount"] = result["final_amount"] - result["input_amount"]
+    result["total_yield_percent"] = 100 * result["total_yield_amount"] / result["final_amount"]
+    result["total_dividends"] = np.zeros_like(final_amount) if total_dividends is None else total_dividends
+    result["annual_return"] = 100 * (return_product ** (12 / number_of_months) - 1)
+    if max_drawdown is not None:
+        result["max_drawdown"] = 100 * max_drawdown
+        result["time_under_water"] = np.asarray(time_under_water, dtype=np.float64)
+    if withdrawal_shortfall is not None:
+        result["withdrawal_shortfall"] = np.asarray(withdrawal_shortfall, dtype=np.float64)
+    return result
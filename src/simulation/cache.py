@@ -0,0 +1,215 @@
+import atexit
+import copy
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import historical_data_analysis.cashflows as cashflows
+import historical_data_analysis.historical_data_analysis as historical_data
+import project_helpers.statistics as statistics
+
+
+@lru_cache(maxsize=None)
+def get_code_version() -> str:
+    # hash of the simulation sources, the backtest code they call (cashflows and regular investments) and the
+    # statistics of all summaries, so cached results are invalidated by any change of the simulation code
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    code_hash = hashlib.sha256()
+    shared_paths = [cashflows.__file__, historical_data.__file__, statistics.__file__]
+    for path in sorted(glob.glob(os.path.join(package_dir, "*.py"))) + shared_paths:
+        with open(path, "rb") as f:
+            code_hash.update(f.read())
+    return code_hash.hexdigest()[:16]
+
+
+def get_simulation_key(stock_config, monthly_mean, monthly_std, iterations, model, seed) -> str:
+    """Returns the content address of a simulation result.
+
+    Args:
+        stock_config (dict | list): Stock configuration(s) of the simulation
+        monthly_mean (float | list): Mean monthly return(s)
+        monthly_std (float | list): Standard deviation(s) or covariance matrix of the monthly returns
+        iterations (int): Number of simulated paths
+        model (str | dict): Return model and simulation engine
+        seed (int): Requested seed, `None` if any seed is accepted
+
+    Returns:
+        str: sha256 hex digest of all parameters and the code version
+    """
+    params = {
+        "stock_config": stock_config,
+        "monthly_mean": monthly_mean,
+        "monthly_std": monthly_std,
+        "iterations": iterations,
+        "model": model,
+        "seed": seed,
+        "code_version": get_code_version(),
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_simulation_cache(cache_dir: str) -> "SimulationCache":
+    # one instance per directory, so the in-process tier is shared by all calls of a session
+    return SimulationCache(cache_dir)
+
+
+class SimulationCache:
+    """Two-tier cache of simulation results keyed by `get_simulation_key`.
+
+    Results are kept in an in-process LRU tier and as JSON files in `cache_dir`. The modification time of a file marks
+    its last use; files unused for longer than `max_age` are evicted, and the least recently used files are evicted
+    once there are more than `max_entries` files or they take more than `max_bytes`. Hits of the in-process tier do
+    not touch the disk, their last use is written to the files before every eviction (on `put`) and at exit.
+
+    Args:
+        cache_dir (str): Directory of the on-disk tier
+        max_entries (int): Maximum number of results on disk
+        max_bytes (int, optional): Maximum size of all results on disk
+        max_age (timedelta, optional): Maximum time since the last use of a result
+        memory_entries (int): Maximum number of results in the in-process tier
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_entries: int = 1000,
+        max_bytes: int = None,
+        max_age: timedelta = timedelta(days=90),
+        memory_entries: int = 128,
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        # last use of every in-process result, and the results used since their file was last marked
+        self.last_used = {}
+        self.unflushed = set()
+        atexit.register(self.flush)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str) -> dict:
+        if key in self.memory and self.is_expired_in_memory(key):
+            self.remove_from_memory(key)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.last_used[key] = time.time()
+            self.unflushed.add(key)
+            self.stats["memory_hits"] += 1
+            return copy.deepcopy(self.memory[key])
+
+        path = self.get_path(key)
+        if os.path.exists(path) and not self.is_expired(path):
+            with open(path, "r") as f:
+                result = json.loads(f.read())
+            self.touch(path)
+            self.add_to_memory(key, result)
+            self.stats["disk_hits"] += 1
+            return copy.deepcopy(result)
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, result: dict):
+        self.add_to_memory(key, copy.deepcopy(result))
+
+        # several processes may share the directory, files are written under a unique name and renamed atomically
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.get_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(result))
+        os.replace(tmp_path, path)
+        self.unflushed.discard(key)
+
+        self.evict()
+
+    def get_or_compute(self, key: str, compute) -> dict:
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def flush(self):
+        # marks the last use of the in-process hits for the eviction of every process sharing the directory
+        for key in self.unflushed:
+            self.touch(self.get_path(key), self.last_used[key])
+        self.unflushed.clear()
+
+    def evict(self):
+        self.flush()
+        paths = glob.glob(os.path.join(self.cache_dir, "*.json"))
+
+        # results whose file was evicted by another process are dropped from the in-process tier as well
+        stored_keys = {os.path.splitext(os.path.basename(path))[0] for path in paths}
+        for key in [key for key in self.memory.keys() if key not in stored_keys]:
+            self.remove_from_memory(key)
+
+        entries = sorted(((os.path.getmtime(path), os.path.getsize(path), path) for path in paths), reverse=True)
+
+        # entries are sorted from the most to the least recently used one
+        kept_bytes = 0
+        for i, (_, size, path) in enumerate(entries):
+            kept_bytes += size
+            over_size = self.max_bytes is not None and kept_bytes > self.max_bytes
+            if i >= self.max_entries or over_size or self.is_expired(path):
+                if os.path.exists(path):
+                    os.remove(path)
+                self.remove_from_memory(os.path.splitext(os.path.basename(path))[0])
+                self.stats["evictions"] += 1
+                kept_bytes -= size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+            os.remove(path)
+        self.memory.clear()
+        self.last_used.clear()
+        self.unflushed.clear()
+
+    def add_to_memory(self, key: str, result: dict):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        self.last_used[key] = time.time()
+        while len(self.memory) > self.memory_entries:
+            self.remove_from_memory(next(iter(self.memory)))
+
+    def remove_from_memory(self, key: str):
+        if key in self.unflushed:
+            self.touch(self.get_path(key), self.last_used[key])
+            self.unflushed.discard(key)
+        self.memory.pop(key, None)
+        self.last_used.pop(key, None)
+
+    def touch(self, path: str, last_used: float = None):
+        # another process may have evicted the file in the meantime
+        try:
+            os.utime(path, None if last_used is None else (last_used, last_used))
+        except FileNotFoundError:
+            pass
+
+    def is_expired_in_memory(self, key: str) -> bool:
+        if self.max_age is None:
+            return False
+        return datetime.now() - datetime.fromtimestamp(self.last_used[key]) > self.max_age
+
+    def is_expired(self, path: str) -> bool:
+        if self.max_age is None:
+            return False
+        return datetime.now() - datetime.fromtimestamp(os.path.getmtime(path)) > self.max_age
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        requests = hits + self.stats["misses"]
+        return hits / requests if requests > 0 else 0.0
@@ -0,0 +1,272 @@
+import numpy as np
+
+import project_helpers as hp
+
+from .array_simulation import (
+    RISK_LEVELS,
+    DrawdownTracker,
+    FanTracker,
+    get_contribution_schedule,
+    get_fan_summary,
+    get_iteration_results,
+    get_level_name,
+    get_risk_summary,
+    has_withdrawals,
+    limit_withdrawals,
+    simulate_changes,
+)
+
+WITHDRAWAL_RULES = ["fixed", "percentage", "guardrails"]
+
+# 4% of the wealth at retirement per year over 30 years, the guardrails adjust the withdrawal by 10% once its rate
+# leaves the band of +-20% around the initial rate
+DEFAULT_WITHDRAWAL = {
+    "rule": "fixed",
+    "years": 30,
+    "rate": 0.04,
+    "amount": None,
+    "inflation": 0.0,
+    "band": 0.2,
+    "adjustment": 0.1,
+}
+
+# success probabilities of the sustainable withdrawal rate of the fixed rule
+SUCCESS_LEVELS = [0.9, 0.95]
+
+
+def get_withdrawal(withdrawal: dict = None) -> dict:
+    """Returns the complete withdrawal config.
+
+    Args:
+        withdrawal (dict, optional): "rule" (one of `WITHDRAWAL_RULES`), "years" of withdrawals, annual "rate" of the
+            wealth at retirement (of the current wealth for the percentage rule) or a fixed annual "amount", yearly
+            "inflation" of the withdrawals and the guardrail "band" and "adjustment"
+
+    Returns:
+        dict: `DEFAULT_WITHDRAWAL` updated with `withdrawal`
+    """
+    withdrawal = {**DEFAULT_WITHDRAWAL, **(withdrawal or {})}
+    if withdrawal["rule"] not in WITHDRAWAL_RULES:
+        raise ValueError(f"Unknown withdrawal rule '{withdrawal['rule']}', expected one of {WITHDRAWAL_RULES}")
+    if int(withdrawal["years"] * 12) < 1:
+        raise ValueError(f"Withdrawals need to last at least one month, got {withdrawal['years']} years")
+    if withdrawal["amount"] is not None and withdrawal["rule"] != "fixed":
+        raise ValueError("A fixed withdrawal amount is only supported by the fixed rule")
+    if withdrawal["rate"] < 0 or not 0 <= withdrawal["adjustment"] < 1 or withdrawal["band"] < 0:
+        raise ValueError(f"Invalid withdrawal rate, band or adjustment in {withdrawal}")
+    return withdrawal
+
+
+def simulate_decumulation(
+    stock_config,
+    monthly_change_mean,
+    monthly_change_std,
+    withdrawal: dict = None,
+    iterations=1000,
+    rng=None,
+    return_model=None,
+    risk_levels=RISK_LEVELS,
+    success_levels=SUCCESS_LEVELS,
+) -> dict:
+    """Simulates the accumulation over `investment_time` followed by a withdrawal phase.
+
+    Both phases are one (iterations x months) return matrix which is stepped through once for all paths, like the
+    array simulation.
+
+    Args:
+        stock_config (dict): Stock configuration of the accumulation
+        monthly_change_mean (float): Mean of the monthly return
+        monthly_change_std (float): Standard deviation of the monthly return
+        withdrawal (dict, optional): Withdrawal phase, see `get_withdrawal`
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        return_model (ReturnModel, optional): Model of the monthly changes, normal returns if not given
+        risk_levels (list): Confidence levels of the value at risk at retirement
+        success_levels (list): Success probabilities of the sustainable withdrawal rates of the fixed rule
+
+    Returns:
+        dict: Summary of the accumulation ("accumulation"), of the withdrawal phase ("decumulation") and the fan chart
+            of both phases ("fan")
+    """
+    withdrawal = get_withdrawal(withdrawal)
+    accumulation_months = int(stock_config["investment_time"] * 12)
+    withdrawal_months = int(withdrawal["years"] * 12)
+
+    schedule = get_contribution_schedule(stock_config, accumulation_months)
+    changes = simulate_changes(
+        monthly_change_mean, monthly_change_std, accumulation_months + withdrawal_months, iterations, rng, return_model
+    )
+    outcome = calculate_decumulation_outcome(changes, schedule["flow"], withdrawal)
+    return summarize_decumulation_outcome(schedule, outcome, withdrawal, risk_levels, success_levels)
+
+
+def calculate_decumulation_outcome(changes: np.ndarray, flow: np.ndarray, withdrawal: dict) -> dict:
+    """Steps all paths through the accumulation (`flow`) and the following withdrawal months.
+
+    Withdrawals are taken at the start of a month, like contributions. A path is depleted in the first month its
+    wealth does not cover the withdrawal, the rest is withdrawn and nothing is left afterwards.
+
+    Args:
+        changes (np.ndarray): (iterations x months) monthly changes of both phases
+        flow (np.ndarray): Money added at the start of each accumulation month
+        withdrawal (dict): Withdrawal phase, see `get_withdrawal`
+
+    Returns:
+        dict: Per path values at retirement and at the end, withdrawals, depletion month and the fan chart totals
+    """
+    iterations, number_of_months = changes.shape
+    accumulation_months = len(flow)
+    rule = withdrawal["rule"]
+    rate = withdrawal["rate"]
+
+    drawdown = DrawdownTracker(iterations)
+    fan = FanTracker(number_of_months, iterations)
+    total = flow[0] * changes[:, 0]
+    return_product = np.ones(iterations)
+    withdrawals = has_withdrawals(flow)
+    shortfall = np.zeros(iterations) if withdrawals else None
+    fan.update(0, total)
+    for month in range(1, accumulation_months):
+        previous_total = total + flow[month]
+        if withdrawals:
+            limit_withdrawals(previous_total, shortfall)
+        total = previous_total * changes[:, month]
+        if withdrawals:
+            monthly_return = np.divide(total, previous_total, out=np.ones(iterations), where=previous_total > 0)
+        else:
+            monthly_return = total / previous_total
+        return_product *= monthly_return
+        drawdown.update(monthly_return)
+        fan.update(month, total)
+    retirement_amount = total.copy()
+
+    # annual withdrawal of every path, updated once a year
+    if withdrawal["amount"] is not None:
+        annual_withdrawal = np.full(iterations, float(withdrawal["amount"]))
+    else:
+        annual_withdrawal = rate * retirement_amount
+    total_withdrawn = np.zeros(iterations)
+    depletion_month = np.full(iterations, -1, dtype=np.int64)
+    for month in range(accumulation_months, number_of_months):
+        withdrawal_month = month - accumulation_months
+        if rule != "percentage" and withdrawal_month > 0 and withdrawal_month % 12 == 0:
+            annual_withdrawal = annual_withdrawal * (1 + withdrawal["inflation"])
+            if rule == "guardrails":
+                # the rate of the current wealth decides whether the withdrawal is cut or raised
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    current_rate = annual_withdrawal / total
+                annual_withdrawal = np.where(
+                    current_rate > rate * (1 + withdrawal["band"]),
+                    annual_withdrawal * (1 - withdrawal["adjustment"]),
+                    np.where(
+                        current_rate < rate * (1 - withdrawal["band"]),
+                        annual_withdrawal * (1 + withdrawal["adjustment"]),
+                        annual_withdrawal,
+                    ),
+                )
+
+        requested = rate / 12 * total if rule == "percentage" else annual_withdrawal / 12
+        depleted = (requested > total) & (depletion_month < 0)
+        depletion_month[depleted] = withdrawal_month
+        withdrawn = np.minimum(requested, total)
+        total_withdrawn += withdrawn
+        total = (total - withdrawn) * changes[:, month]
+        fan.update(month, total)
+
+    return {
+        "retirement_amount": retirement_amount,
+        "return_product": return_product,
+        "max_drawdown": drawdown.max_drawdown,
+        "time_under_water": drawdown.time_under_water,
+        "withdrawal_shortfall": shortfall,
+        "terminal_amount": total,
+        "total_withdrawn": total_withdrawn,
+        "depletion_month": depletion_month,
+        "sustainable_rate": get_sustainable_withdrawal_rates(changes[:, accumulation_months:], withdrawal["inflation"]),
+        "fan_total": fan.total,
+        "fan_months": fan.months,
+    }
+
+
+def get_sustainable_withdrawal_rates(changes: np.ndarray, inflation: float = 0.0) -> np.ndarray:
+    """Highest annual withdrawal rate of the wealth at retirement every path sustains, growing with `inflation`.
+
+    With the growth `D[s]` of the wealth before withdrawal month `s` and the withdrawals `w[s] = r * W / 12 * m[s]`
+    (`m[s]` the inflation multiplier), the wealth before month `s` is `D[s] * (W - sum(w[u] / D[u], u < s))`. All
+    withdrawals are covered as long as `W >= sum(w[s] / D[s])`, so the sustainable rate of a path is
+    `12 / sum(m[s] / D[s])` without searching, independent of the wealth at retirement.
+
+    Args:
+        changes (np.ndarray): (iterations x months) monthly changes of the withdrawal phase
+        inflation (float): Yearly growth of the withdrawals
+
+    Returns:
+        np.ndarray: Sustainable annual withdrawal rate per path
+    """
+    growth = np.ones_like(changes, dtype=np.float64)
+    np.cumprod(changes[:, :-1], axis=1, out=growth[:, 1:])
+    multiplier = (1 + inflation) ** (np.arange(changes.shape[1]) // 12)
+    with np.errstate(divide="ignore"):
+        return 12 / (multiplier / growth).sum(axis=1)
+
+
+def get_sustainable_value(sustainable_values: np.ndarray, success_probability: float) -> float:
+    # highest value which at least `success_probability` of the paths sustain, the k-th highest value of the paths
+    number_of_paths = int(np.ceil(round(success_probability * sustainable_values.size, 9)))
+    return float(-np.partition(-sustainable_values, number_of_paths - 1)[number_of_paths - 1])
+
+
+def summarize_decumulation_outcome(
+    schedule: dict, outcome: dict, withdrawal: dict, risk_levels=RISK_LEVELS, success_levels=SUCCESS_LEVELS
+) -> dict:
+    accumulation_months = len(schedule["flow"])
+    result = get_iteration_results(
+        schedule["input"][-1],
+        outcome["retirement_amount"],
+        outcome["return_product"],
+        accumulation_months,
+        max_drawdown=outcome["max_drawdown"],
+        time_under_water=outcome["time_under_water"],
+        withdrawal_shortfall=outcome["withdrawal_shortfall"],
+    )
+    accumulation = {col: hp.summarize_values(values) for col, values in result.items()}
+    accumulation["risk"] = get_risk_summary(result["total_yield_amount"], risk_levels)
+
+    depleted = outcome["depletion_month"] >= 0
+    years_until_depletion = outcome["depletion_month"][depleted] / 12
+
+    # median over all paths, paths which are not depleted last beyond the horizon, so there is no median depletion
+    # unless more than half of the paths are depleted
+    median_years_until_depletion = np.median(np.where(depleted, outcome["depletion_month"] / 12, np.inf))
+
+    # the sustainable rates are those of the fixed rule (a constant share of the wealth at retirement, growing with
+    # the inflation), whichever rule is simulated
+    sustainable_rate = outcome["sustainable_rate"]
+    decumulation = {
+        "withdrawal": withdrawal,
+        "depletion_probability": float(depleted.mean()),
+        "median_years_until_depletion": (
+            float(median_years_until_depletion) if np.isfinite(median_years_until_depletion) else None
+        ),
+        "years_until_depletion_of_depleted_paths": (
+            hp.summarize_values(years_until_depletion) if depleted.any() else None
+        ),
+        "terminal_amount": hp.summarize_values(outcome["terminal_amount"]),
+        "total_withdrawn": hp.summarize_values(outcome["total_withdrawn"]),
+        "sustainable_withdrawal_rate_fixed_rule": {
+            get_level_name(level): get_sustainable_value(sustainable_rate, level) for level in success_levels
+        },
+        "sustainable_withdrawal_amount_fixed_rule": {
+            get_level_name(level): get_sustainable_value(sustainable_rate * outcome["retirement_amount"], level)
+            for level in success_levels
+        },
+    }
+
+    # contributions stop at retirement, the last fan chart month is the last month of the withdrawals
+    withdrawal_months = outcome["fan_months"][-1] + 1 - accumulation_months
+    input_amount = np.concatenate([schedule["input"], np.full(withdrawal_months, schedule["input"][-1])])
+    return {
+        "accumulation": accumulation,
+        "decumulation": decumulation,
+        "fan": get_fan_summary(outcome["fan_total"], outcome["fan_months"], input_amount),
+    }
@@ -0,0 +1,244 @@
+import numpy as np
+
+import project_helpers as hp
+
+from .array_simulation import get_contribution_schedule, get_level_name
+from .portfolio_simulation import (
+    estimate_return_parameters,
+    get_aligned_returns,
+    simulate_correlated_changes,
+)
+from .sweep import (
+    SCENARIO_AMOUNTS,
+    get_contribution_counts,
+    get_growth_factors,
+    get_scenarios,
+)
+
+# parameters which can be solved for, amounts are portfolio totals like in the scenario sweep
+GOAL_PARAMETERS = ["initial_investment", "monthly_investment", "investment_time"]
+DEFAULT_CONFIDENCE_LEVELS = [0.75, 0.9]
+DEFAULT_MAX_INVESTMENT_TIME = 50
+
+
+def goal_seek_portfolio(
+    stock_configs: list,
+    histories: dict,
+    target_amount: float,
+    solve_for: str = "monthly_investment",
+    confidence_levels=DEFAULT_CONFIDENCE_LEVELS,
+    iterations=1000,
+    rng=None,
+    max_investment_time=DEFAULT_MAX_INVESTMENT_TIME,
+) -> dict:
+    """Goal seek with the return parameters estimated from the aligned historical returns, like `sweep_portfolio`.
+
+    Args:
+        stock_configs (list): Stock configurations of the portfolio
+        histories (dict): Cleaned monthly series per symbol
+        target_amount (float): Final amount which should be reached
+        solve_for (str): One of `GOAL_PARAMETERS`
+        confidence_levels (list): Share of the paths which should reach the target
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        max_investment_time (float): Longest investment time in years searched by the `investment_time` solver
+
+    Returns:
+        dict: See `solve_goal`
+    """
+    symbols = [stock_config["symbol"] for stock_config in stock_configs]
+    mean, cov = estimate_return_parameters(get_aligned_returns({symbol: histories[symbol] for symbol in symbols}))
+    return goal_seek(
+        stock_configs, mean, cov, target_amount, solve_for, confidence_levels, iterations, rng, max_investment_time
+    )
+
+
+def goal_seek(
+    stock_configs,
+    mean,
+    cov,
+    target_amount: float,
+    solve_for: str = "monthly_investment",
+    confidence_levels=DEFAULT_CONFIDENCE_LEVELS,
+    iterations=1000,
+    rng=None,
+    max_investment_time=DEFAULT_MAX_INVESTMENT_TIME,
+) -> dict:
+    """Solves for the amount or investment time which reaches `target_amount` at the given confidence levels.
+
+    The portfolio is the default scenario of `sweep_scenarios`: the summed amounts of the stock configs, split
+    between the symbols by their share of the input. All other parameters keep their values.
+
+    Args:
+        stock_configs (list | dict): Stock configuration(s) of the portfolio
+        mean (float | np.ndarray): Mean monthly return per symbol
+        cov (float | np.ndarray): Covariance matrix of the monthly returns (the variance for a single symbol)
+        target_amount (float): Final amount which should be reached
+        solve_for (str): One of `GOAL_PARAMETERS`
+        confidence_levels (list): Share of the paths which should reach the target
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        max_investment_time (float): Longest investment time in years searched by the `investment_time` solver
+
+    Returns:
+        dict: See `solve_goal`
+    """
+    stock_configs = [stock_configs] if isinstance(stock_configs, dict) else stock_configs
+    mean = np.atleast_1d(np.asarray(mean, dtype=np.float64))
+    scenario = get_scenarios(stock_configs, {}).iloc[0].to_dict()
+
+    number_of_months = int(scenario["investment_time"] * 12)
+    if solve_for == "investment_time":
+        number_of_months = max(number_of_months, int(max_investment_time * 12))
+    changes = simulate_correlated_changes(mean, cov, number_of_months, iterations, rng)
+
+    return solve_goal(changes, scenario, target_amount, solve_for, confidence_levels)
+
+
+def solve_goal(
+    changes: np.ndarray,
+    scenario: dict,
+    target_amount: float,
+    solve_for: str = "monthly_investment",
+    confidence_levels=DEFAULT_CONFIDENCE_LEVELS,
+) -> dict:
+    """Solves the goal on a fixed set of return paths without simulating again.
+
+    The final amount of every path is linear in each invested amount, `final = sum(amount * growth factor)`, so the
+    amount a path needs to reach the target is `(target - final of the other amounts) / growth factor`. The amount
+    reaching the target on a share `c` of the paths is the `c` quantile of these per path amounts. The investment
+    time is the first month at which that share of the paths holds the target.
+
+    Args:
+        changes (np.ndarray): (iterations x months x symbols) monthly changes, the longest searched investment time
+            for the `investment_time` solver
+        scenario (dict): investment_time, the amounts of `SCENARIO_AMOUNTS` and the allocation per symbol
+        target_amount (float): Final amount which should be reached
+        solve_for (str): One of `GOAL_PARAMETERS`
+        confidence_levels (list): Share of the paths which should reach the target
+
+    Returns:
+        dict: The scenario, the confidence of the unchanged scenario and one solution per confidence level with the
+            solved value (None if it is not reachable), the achieved confidence, the investment time, the input
+            amount and the distribution of the final amount
+    """
+    if solve_for not in GOAL_PARAMETERS:
+        raise ValueError(f"Cannot solve for '{solve_for}', expected one of {GOAL_PARAMETERS}")
+    for level in confidence_levels:
+        if not 0 < level < 1:
+            raise ValueError(f"Confidence level {level} is not between 0 and 1")
+
+    changes = changes[:, :, None] if changes.ndim == 2 else changes
+    scenario = {**scenario, "allocation": [float(weight) for weight in scenario["allocation"]]}
+    amounts = np.array([scenario[amount] for amount in SCENARIO_AMOUNTS], dtype=np.float64)
+    allocation = np.array(scenario["allocation"], dtype=np.float64)
+
+    if solve_for == "investment_time":
+        solutions, current_confidence = solve_investment_time(
+            changes, scenario, amounts, allocation, target_amount, confidence_levels
+        )
+    else:
+        solutions, current_confidence = solve_amount(
+            changes, scenario, amounts, allocation, target_amount, SCENARIO_AMOUNTS.index(solve_for), confidence_levels
+        )
+
+    return {
+        "solve_for": solve_for,
+        "target_amount": float(target_amount),
+        "iterations": changes.shape[0],
+        "scenario": scenario,
+        "current_confidence": current_confidence,
+        "solutions": solutions,
+    }
+
+
+def solve_amount(
+    changes: np.ndarray,
+    scenario: dict,
+    amounts: np.ndarray,
+    allocation: np.ndarray,
+    target_amount: float,
+    amount_index: int,
+    confidence_levels,
+) -> tuple:
+    number_of_months = int(scenario["investment_time"] * 12)
+    if number_of_months > changes.shape[1]:
+        raise ValueError(f"Investment time of {number_of_months} months exceeds the {changes.shape[1]} simulated")
+
+    # final value of 1 per amount and path, the symbols weighted by the allocation
+    growth = np.cumprod(changes[:, :number_of_months, :], axis=1)
+    factors = np.einsum("isa,s->ia", get_growth_factors(growth, number_of_months), allocation)
+    final_amount = factors @ amounts
+    counts = np.array([1] + list(get_contribution_counts(number_of_months).values()), dtype=np.float64)
+    factor = factors[:, amount_index]
+    other_amount = final_amount - amounts[amount_index] * factor
+
+    # paths which lose all value never reach the target, paths reaching it without the amount need none
+    with np.errstate(divide="ignore", invalid="ignore"):
+        required = (target_amount - other_amount) / factor
+    required = np.where(factor > 0, required, np.where(other_amount >= target_amount, -np.inf, np.inf))
+
+    solutions = {}
+    for level in confidence_levels:
+        value = max(0.0, get_required_value(required, level))
+        solution = {"confidence": level, "value": None, "investment_time": scenario["investment_time"]}
+        if np.isfinite(value):
+            # rounded up to cents, so the rounding does not lower the confidence
+            value = float(np.ceil(value * 100) / 100)
+            solved_amounts = amounts.copy()
+            solved_amounts[amount_index] = value
+            solution["value"] = value
+            solution.update(get_solution_outcome(factors @ solved_amounts, target_amount, solved_amounts @ counts))
+        solutions[get_level_name(level)] = solution
+
+    return solutions, float((final_amount >= target_amount).mean())
+
+
+def solve_investment_time(
+    changes: np.ndarray,
+    scenario: dict,
+    amounts: np.ndarray,
+    allocation: np.ndarray,
+    target_amount: float,
+    confidence_levels,
+) -> tuple:
+    iterations, number_of_months, _ = changes.shape
+    stock_config = dict(zip(SCENARIO_AMOUNTS, amounts), investment_time=number_of_months / 12)
+    flow = get_contribution_schedule(stock_config, number_of_months)["flow"]
+
+    # value of the portfolio at the end of every month, the final amount of an investment time of that many months
+    combined_total = np.empty((iterations, number_of_months))
+    total = flow[0] * allocation * changes[:, 0, :]
+    combined_total[:, 0] = total.sum(axis=1)
+    for month in range(1, number_of_months):
+        total = (total + flow[month] * allocation) * changes[:, month, :]
+        combined_total[:, month] = total.sum(axis=1)
+    reached = (combined_total >= target_amount).mean(axis=0)
+    input_amount = np.cumsum(flow)
+
+    solutions = {}
+    for level in confidence_levels:
+        solution = {"confidence": level, "value": None, "investment_time": None}
+        months = np.flatnonzero(reached >= level)
+        if months.size > 0:
+            month = months[0]
+            solution["value"] = solution["investment_time"] = (month + 1) / 12
+            solution.update(get_solution_outcome(combined_total[:, month], target_amount, input_amount[month]))
+        solutions[get_level_name(level)] = solution
+
+    current_month = min(int(scenario["investment_time"] * 12), number_of_months) - 1
+    return solutions, float(reached[current_month])
+
+
+def get_required_value(required: np.ndarray, level: float) -> float:
+    # smallest value reaching the target on at least `level` of the paths, the k-th smallest per path requirement
+    number_of_paths = int(np.ceil(round(level * required.size, 9)))
+    return float(np.partition(required, number_of_paths - 1)[number_of_paths - 1])
+
+
+def get_solution_outcome(final_amount: np.ndarray, target_amount: float, input_amount: float) -> dict:
+    return {
+        "achieved_confidence": float((final_amount >= target_amount).mean()),
+        "input_amount": float(input_amount),
+        "final_amount": hp.summarize_values(final_amount),
+    }
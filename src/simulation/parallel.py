@@ -0,0 +1,90 @@
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import project_helpers as hp
+
+from .array_simulation import (
+    RISK_LEVELS,
+    FanTracker,
+    get_contribution_schedule,
+    simulate_changes,
+)
+from .streaming import DEFAULT_CHUNK_SIZE, SimulationAccumulator, get_chunk_results
+
+
+def simulate_outcome_parallel(
+    stock_config,
+    monthly_change_mean,
+    monthly_change_std,
+    iterations=100,
+    seed=None,
+    workers=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    return_model=None,
+    risk_levels=RISK_LEVELS,
+):
+    """Streaming simulation split across a process pool.
+
+    The iterations are split into chunks of `chunk_size` and every chunk draws from its own child stream spawned
+    from the root `seed`. Partial summaries are merged in chunk order, so for a given seed the result is bit-identical
+    for any number of workers.
+
+    Args:
+        stock_config (dict): Stock configuration of the portfolio
+        monthly_change_mean (float): Mean of the monthly return
+        monthly_change_std (float): Standard deviation of the monthly return
+        iterations (int): Number of simulated paths
+        seed (int | np.random.SeedSequence, optional): Root seed, fresh entropy is used if not given
+        workers (int, optional): Number of worker processes, defaults to the number of CPUs
+        chunk_size (int): Number of paths per chunk
+        return_model (ReturnModel, optional): Model of the monthly changes, normal returns if not given
+        risk_levels (list): Confidence levels of the value at risk
+
+    Returns:
+        dict: Summary statistics of all iterations, same schema as `simulate_outcome`
+    """
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    chunk_sizes = [min(chunk_size, iterations - start) for start in range(0, iterations, chunk_size)]
+    tasks = [
+        (stock_config, monthly_change_mean, monthly_change_std, size, child_seed, return_model)
+        for size, child_seed in zip(chunk_sizes, seed_sequence.spawn(len(chunk_sizes)))
+    ]
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        partial_accumulators = [simulate_chunk(task) for task in tasks]
+    else:
+        # spans of the workers are not traced, the pool is recorded as a whole
+        with hp.span("simulation_pool", workers=min(workers, len(tasks)), chunks=len(tasks)):
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                partial_accumulators = list(pool.map(simulate_chunk, tasks))
+
+    # merging in chunk order keeps the floating point operations independent of the worker count
+    accumulator = SimulationAccumulator()
+    for partial_accumulator in partial_accumulators:
+        accumulator.merge(partial_accumulator)
+
+    return accumulator.summary(risk_levels)
+
+
+def simulate_chunk(task: tuple) -> SimulationAccumulator:
+    stock_config, monthly_change_mean, monthly_change_std, iterations, seed_sequence, return_model = task
+    number_of_months = int(stock_config["investment_time"] * 12)
+    schedule = get_contribution_schedule(stock_config, number_of_months)
+
+    rng = np.random.default_rng(seed_sequence)
+    changes = simulate_changes(monthly_change_mean, monthly_change_std, number_of_months, iterations, rng, return_model)
+
+    accumulator = SimulationAccumulator()
+    fan = FanTracker(number_of_months, iterations)
+    accumulator.update(get_chunk_results(changes, schedule, fan))
+    accumulator.update_fan(fan, schedule["input"])
+    return accumulator
+
+
+def get_symbol_seed(seed: int, symbol: str) -> np.random.SeedSequence:
+    # independent child stream per symbol, so symbols sharing the root seed do not draw the same returns
+    return np.random.SeedSequence(seed, spawn_key=(zlib.crc32(symbol.encode()),))
@@ -0,0 +1,175 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import project_helpers as hp
+
+from .array_simulation import (
+    RISK_LEVELS,
+    DrawdownTracker,
+    calculate_outcome_array,
+    get_contribution_schedule,
+    get_fan_months,
+    get_fan_summary,
+    get_iteration_results,
+    get_risk_summary,
+    has_withdrawals,
+    simulate_changes,
+)
+from .streaming import DEFAULT_CHUNK_SIZE
+
+PATH_DTYPES = ["float32", "float64"]
+PATH_ARRAYS = ["returns", "total"]
+META_FILE = "meta.json"
+
+
+def simulate_paths(
+    stock_config,
+    monthly_change_mean,
+    monthly_change_std,
+    iterations,
+    path_dir,
+    rng=None,
+    return_model=None,
+    dtype="float32",
+    chunk_size=DEFAULT_CHUNK_SIZE,
+) -> "SimulationPaths":
+    """Simulates like the array engine and stores the monthly returns and totals of every path.
+
+    Both (iterations x months) matrices are written chunk by chunk into memory mapped `.npy` files, so they may be
+    larger than the available memory. `meta.json` is written last, an interrupted run is never loaded.
+
+    Args:
+        stock_config (dict): Stock configuration of the portfolio
+        monthly_change_mean (float): Mean of the monthly return
+        monthly_change_std (float): Standard deviation of the monthly return
+        iterations (int): Number of simulated paths
+        path_dir (str): Directory of the stored paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        return_model (ReturnModel, optional): Model of the monthly changes, normal returns if not given
+        dtype (str): "float32" halves the size, "float64" keeps the exact values
+        chunk_size (int): Number of paths simulated at once
+
+    Returns:
+        SimulationPaths: Memory mapped stored paths
+    """
+    if dtype not in PATH_DTYPES:
+        raise ValueError(f"Unknown path dtype '{dtype}', expected one of {PATH_DTYPES}")
+    number_of_months = int(stock_config["investment_time"] * 12)
+    schedule = get_contribution_schedule(stock_config, number_of_months)
+
+    os.makedirs(path_dir, exist_ok=True)
+    meta_path = os.path.join(path_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    arrays = {
+        name: open_memmap(
+            os.path.join(path_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=(iterations, number_of_months)
+        )
+        for name in PATH_ARRAYS
+    }
+    for start in range(0, iterations, chunk_size):
+        stop = min(start + chunk_size, iterations)
+        changes = simulate_changes(
+            monthly_change_mean, monthly_change_std, number_of_months, stop - start, rng, return_model
+        )
+        total, returns = calculate_outcome_array(changes, schedule["flow"])
+        arrays["total"][start:stop] = total
+        arrays["returns"][start:stop] = returns
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    meta = {
+        "iterations": iterations,
+        "number_of_months": number_of_months,
+        "dtype": dtype,
+        "stock_config": stock_config,
+        "monthly_change_mean": monthly_change_mean,
+        "monthly_change_std": monthly_change_std,
+        "model": {"returns": "normal"} if return_model is None else return_model.params,
+        "input": schedule["input"].tolist(),
+        "created": datetime.now().isoformat(),
+    }
+    with open(f"{meta_path}.tmp", "w") as f:
+        f.write(json.dumps(meta, default=float))
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    return SimulationPaths(path_dir)
+
+
+class SimulationPaths:
+    """Stored paths of a simulation, see `simulate_paths`.
+
+    `returns` and `total` are read-only memory maps of the stored matrices, nothing is copied until a slice is used
+    in a calculation. Analyses over all paths should iterate over row blocks (`iter_chunks`) to bound the memory.
+
+    Args:
+        path_dir (str): Directory of the stored paths
+    """
+
+    def __init__(self, path_dir: str):
+        meta_path = os.path.join(path_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No complete simulation paths at {path_dir}")
+        with open(meta_path, "r") as f:
+            self.meta = json.loads(f.read())
+
+        self.path_dir = path_dir
+        self.returns = np.load(os.path.join(path_dir, "returns.npy"), mmap_mode="r")
+        self.total = np.load(os.path.join(path_dir, "total.npy"), mmap_mode="r")
+        self.input = np.asarray(self.meta["input"], dtype=np.float64)
+
+    @property
+    def iterations(self) -> int:
+        return self.total.shape[0]
+
+    @property
+    def number_of_months(self) -> int:
+        return self.total.shape[1]
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        # row blocks of the mapped matrices, only the pages of the current block are read
+        for start in range(0, self.iterations, chunk_size):
+            stop = min(start + chunk_size, self.iterations)
+            yield self.returns[start:stop], self.total[start:stop]
+
+    def summary(self, risk_levels=RISK_LEVELS, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """Summary of the stored paths with the schema of `simulate_outcome`.
+
+        Only the per path values are held in memory, for float64 paths the result equals the summary of the array
+        engine.
+        """
+        number_of_months = self.number_of_months
+        fan_months = get_fan_months(number_of_months)
+        flow = np.diff(self.input, prepend=0)
+        withdrawals = has_withdrawals(flow)
+        results = []
+        fan_totals = []
+        for returns, total in self.iter_chunks(chunk_size):
+            returns = np.asfortranarray(returns, dtype=np.float64)
+            drawdown = DrawdownTracker(len(returns))
+            for month in range(1, number_of_months):
+                drawdown.update(returns[:, month])
+            result = get_iteration_results(
+                self.input[-1],
+                np.asarray(total[:, -1], dtype=np.float64),
+                np.prod(returns[:, 1:], axis=1),
+                number_of_months,
+                max_drawdown=drawdown.max_drawdown,
+                time_under_water=drawdown.time_under_water,
+                # the part of the withdrawals exceeding the total of the previous month was not taken
+                withdrawal_shortfall=(np.maximum(-(total[:, :-1] + flow[1:]), 0).sum(axis=1) if withdrawals else None),
+            )
+            results.append(result)
+            fan_totals.append(np.asarray(total[:, fan_months], dtype=np.float64))
+
+        result = {col: np.concatenate([chunk_result[col] for chunk_result in results]) for col in results[0].keys()}
+        summary = {col: hp.summarize_values(values) for col, values in result.items()}
+        summary["risk"] = get_risk_summary(result["total_yield_amount"], risk_levels)
+        summary["fan"] = get_fan_summary(np.concatenate(fan_totals), fan_months, self.input)
+        return summary
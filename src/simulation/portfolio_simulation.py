@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+import project_helpers as hp
+
+from .array_simulation import (
+    RISK_LEVELS,
+    DrawdownTracker,
+    FanTracker,
+    get_contribution_schedule,
+    get_fan_months,
+    get_fan_summary,
+    get_iteration_results,
+    get_risk_summary,
+    has_withdrawals,
+    limit_withdrawals,
+)
+
+# upper bound of simulated values (iterations x months x symbols) held in memory at once
+MAX_CHUNK_VALUES = 4_000_000
+
+
+def simulate_portfolio(
+    stock_configs: list, histories: dict, iterations=100, rng=None, return_model=None, risk_levels=RISK_LEVELS
+) -> dict:
+    """Simulates all symbols of a portfolio jointly with correlated monthly returns.
+
+    The mean vector and covariance matrix are estimated from the aligned historical returns, so per-symbol and
+    combined results come from the same paths. Symbols with a shorter `investment_time` start later, so all of them
+    end in the last simulated month (like the historical analysis, which ends at the latest date for every symbol).
+
+    Args:
+        stock_configs (list): Stock configurations of the portfolio
+        histories (dict): Cleaned monthly series per symbol
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        return_model (ReturnModel, optional): Model of the aligned monthly changes, correlated normal returns if
+            not given
+        risk_levels (list): Confidence levels of the value at risk
+
+    Returns:
+        dict: Summary statistics per symbol and for the combined portfolio
+    """
+    symbols = [stock_config["symbol"] for stock_config in stock_configs]
+    returns = get_aligned_returns({symbol: histories[symbol] for symbol in symbols})
+    mean, cov = estimate_return_parameters(returns)
+
+    months_per_symbol = np.array([int(stock_config["investment_time"] * 12) for stock_config in stock_configs])
+    number_of_months = int(months_per_symbol.max())
+    flow = get_flow_matrix(stock_configs, number_of_months)
+    start_month = number_of_months - months_per_symbol
+
+    # paths are drawn in chunks to bound the memory of the (iterations x months x symbols) matrix
+    chunk_size = max(1, MAX_CHUNK_VALUES // (number_of_months * len(symbols)))
+    outcomes = []
+    for start in range(0, iterations, chunk_size):
+        size = min(chunk_size, iterations - start)
+        if return_model is None:
+            changes = simulate_correlated_changes(mean, cov, number_of_months, size, rng)
+        else:
+            changes = return_model.simulate(number_of_months, size, rng).reshape(size, number_of_months, -1)
+        outcomes.append(calculate_portfolio_outcome(changes, flow, start_month))
+    outcome = {key: np.concatenate([o[key] for o in outcomes]) for key in outcomes[0].keys()}
+
+    return summarize_portfolio_outcome(symbols, flow, outcome, months_per_symbol, risk_levels)
+
+
+def get_aligned_returns(histories: dict) -> pd.DataFrame:
+    # monthly close returns of every symbol, restricted to the months all symbols have in common
+    returns = {
+        symbol: df.set_index(df["date"].dt.to_period("M"))["close"].pct_change() for symbol, df in histories.items()
+    }
+    return pd.concat(returns, axis=1, join="inner").dropna()
+
+
+def estimate_return_parameters(returns: pd.DataFrame) -> tuple:
+    mean = returns.mean().to_numpy(dtype=np.float64)
+    cov = returns.cov().to_numpy(dtype=np.float64)
+    return mean, cov
+
+
+def get_covariance_factor(cov: np.ndarray) -> np.ndarray:
+    # returns L with L @ L.T == cov, falls back to the eigen decomposition for singular covariance matrices
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+
+def simulate_correlated_changes(mean, cov, number_of_months, iterations, rng=None) -> np.ndarray:
+    if rng is None:
+        rng = np.random
+    factor = get_covariance_factor(np.atleast_2d(cov))
+    standard_normal = rng.standard_normal((iterations, number_of_months, len(mean)))
+    return 1 + mean + standard_normal @ factor.T
+
+
+def get_flow_matrix(stock_configs: list, number_of_months: int) -> np.ndarray:
+    # money flowing into each symbol (columns) at the start of each month (rows)
+    flow = np.zeros((number_of_months, len(stock_configs)))
+    for i, stock_config in enumerate(stock_configs):
+        symbol_months = int(stock_config["investment_time"] * 12)
+        start_month = number_of_months - symbol_months
+        flow[start_month:, i] = get_contribution_schedule(stock_config, symbol_months)["flow"]
+    return flow
+
+
+def calculate_portfolio_outcome(changes: np.ndarray, flow: np.ndarray, start_month=None) -> dict:
+    iterations, number_of_months, number_of_symbols = changes.shape
+    start_month = np.zeros(number_of_symbols, dtype=int) if start_month is None else start_month
+
+    total = flow[0] * changes[:, 0, :]
+    return_product = np.ones((iterations, number_of_symbols))
+    drawdown = DrawdownTracker((iterations, number_of_symbols))
+    combined_total = total.sum(axis=1)
+    combined_return_product = np.ones(iterations)
+    combined_drawdown = DrawdownTracker(iterations)
+    fan = FanTracker(number_of_months, (iterations, number_of_symbols))
+    combined_fan = FanTracker(number_of_months, iterations)
+    withdrawals = has_withdrawals(flow)
+    shortfall = np.zeros((iterations, number_of_symbols))
+    fan.update(0, total)
+    combined_fan.update(0, combined_total)
+    for month in range(1, number_of_months):
+        previous_total = total + flow[month]
+        if withdrawals:
+            limit_withdrawals(previous_total, shortfall)
+        total = previous_total * changes[:, month, :]
+        # symbols which did not start yet or hold no money keep a return of 1
+        active = (start_month < month) & (previous_total > 0) if withdrawals else start_month < month
+        monthly_return = np.where(active, total / np.where(active, previous_total, 1), 1)
+        return_product *= monthly_return
+        drawdown.update(monthly_return)
+
+        if withdrawals:
+            previous_combined_total = previous_total.sum(axis=1)
+        else:
+            previous_combined_total = combined_total + flow[month].sum()
+        combined_total = total.sum(axis=1)
+        if withdrawals:
+            combined_monthly_return = np.divide(
+                combined_total, previous_combined_total, out=np.ones(iterations), where=previous_combined_total > 0
+            )
+        else:
+            combined_monthly_return = combined_total / previous_combined_total
+        combined_return_product *= combined_monthly_return
+        combined_drawdown.update(combined_monthly_return)
+        fan.update(month, total)
+        combined_fan.update(month, combined_total)
+
+    return {
+        "final_amount": total,
+        "return_product": return_product,
+        "max_drawdown": drawdown.max_drawdown,
+        "time_under_water": drawdown.time_under_water,
+        "fan_total": fan.total,
+        "combined_final_amount": combined_total,
+        "combined_return_product": combined_return_product,
+        "combined_max_drawdown": combined_drawdown.max_drawdown,
+        "combined_time_under_water": combined_drawdown.time_under_water,
+        "combined_fan_total": combined_fan.total,
+        "withdrawal_shortfall": shortfall,
+    }
+
+
+def summarize_portfolio_outcome(
+    symbols: list, flow: np.ndarray, outcome: dict, months_per_symbol, risk_levels=RISK_LEVELS
+) -> dict:
+    input_amount = flow.sum(axis=0)
+    number_of_months = flow.shape[0]
+    shortfall = outcome["withdrawal_shortfall"] if has_withdrawals(flow) else None
+
+    results = {}
+    for i, symbol in enumerate(symbols):
+        results[symbol] = get_iteration_results(
+            input_amount[i],
+            outcome["final_amount"][:, i],
+            outcome["return_product"][:, i],
+            months_per_symbol[i],
+            max_drawdown=outcome["max_drawdown"][:, i],
+            time_under_water=outcome["time_under_water"][:, i],
+            withdrawal_shortfall=None if shortfall is None else shortfall[:, i],
+        )
+    results["combined"] = get_iteration_results(
+        input_amount.sum(),
+        outcome["combined_final_amount"],
+        outcome["combined_return_product"],
+        number_of_months,
+        max_drawdown=outcome["combined_max_drawdown"],
+        time_under_water=outcome["combined_time_under_water"],
+        withdrawal_shortfall=None if shortfall is None else shortfall.sum(axis=1),
+    )
+
+    # cumulative input and total value at the fan chart months
+    fan_months = get_fan_months(number_of_months)
+    input_per_month = np.cumsum(flow, axis=0)
+    fan_totals = {symbol: outcome["fan_total"][:, :, i] for i, symbol in enumerate(symbols)}
+    fan_totals["combined"] = outcome["combined_fan_total"]
+    fan_inputs = {symbol: input_per_month[:, i] for i, symbol in enumerate(symbols)}
+    fan_inputs["combined"] = input_per_month.sum(axis=1)
+
+    summary = {}
+    for name, result in results.items():
+        summary[name] = {col: hp.summarize_values(values) for col, values in result.items()}
+        summary[name]["risk"] = get_risk_summary(result["total_yield_amount"], risk_levels)
+        summary[name]["fan"] = get_fan_summary(fan_totals[name], fan_months, fan_inputs[name])
+    return summary
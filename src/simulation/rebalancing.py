@@ -0,0 +1,393 @@
+import numpy as np
+import pandas as pd
+
+import historical_data_analysis as hda
+import project_helpers as hp
+
+from .array_simulation import (
+    RISK_LEVELS,
+    DrawdownTracker,
+    FanTracker,
+    get_contribution_schedule,
+    get_fan_months,
+    get_fan_summary,
+    get_iteration_results,
+    get_risk_summary,
+)
+from .portfolio_simulation import (
+    MAX_CHUNK_VALUES,
+    estimate_return_parameters,
+    get_aligned_returns,
+    simulate_correlated_changes,
+)
+from .sweep import SCENARIO_AMOUNTS, check_regular_investments, get_input_amount
+
+REBALANCING_POLICIES = ["none", "calendar", "threshold", "contributions"]
+
+# calendar rebalancing once a year, threshold rebalancing once a weight drifts by 5 percentage points
+DEFAULT_REBALANCING = {"policy": "calendar", "interval": 12, "band": 0.05}
+
+
+def get_rebalancing(stock_configs: list, rebalancing: dict = None) -> dict:
+    """Returns the complete rebalancing config of a portfolio.
+
+    The `rebalancing` section of a portfolio file may hold the target `weights` per symbol, the `policy` (see
+    `calculate_rebalanced_outcome`), the `interval` of calendar rebalancing in months and the `band` of threshold
+    rebalancing. Missing weights default to the share of each symbol in the total input of the stock configs.
+
+    Args:
+        stock_configs (list): Stock configurations of the portfolio
+        rebalancing (dict, optional): Rebalancing section of the portfolio file
+
+    Returns:
+        dict: policy, interval, band and the weight per symbol
+    """
+    rebalancing = {**DEFAULT_REBALANCING, **({} if rebalancing is None else rebalancing)}
+    if rebalancing["policy"] not in REBALANCING_POLICIES:
+        raise ValueError(
+            f"Unknown rebalancing policy '{rebalancing['policy']}', expected one of {REBALANCING_POLICIES}"
+        )
+    if rebalancing["interval"] < 1 or rebalancing["band"] <= 0:
+        raise ValueError("The rebalancing interval needs to be at least one month and the band positive")
+
+    symbols = [stock_config["symbol"] for stock_config in stock_configs]
+    weights = rebalancing.get("weights")
+    if weights is None:
+        symbol_input = np.array([get_input_amount(stock_config) for stock_config in stock_configs])
+        weights = dict(zip(symbols, (symbol_input / symbol_input.sum()).tolist()))
+    if sorted(weights.keys()) != sorted(symbols):
+        raise ValueError(f"Rebalancing weights {weights} need one weight per symbol of {symbols}")
+    if min(weights.values()) < 0 or not np.isclose(sum(weights.values()), 1):
+        raise ValueError(f"Rebalancing weights {weights} need to be non-negative and sum up to 1")
+
+    return {
+        "policy": rebalancing["policy"],
+        "interval": int(rebalancing["interval"]),
+        "band": float(rebalancing["band"]),
+        "weights": {symbol: float(weights[symbol]) for symbol in symbols},
+    }
+
+
+def get_portfolio_config(stock_configs: list) -> dict:
+    # portfolio level stock config, the amounts of all symbols are invested together over the longest investment time
+    check_regular_investments(stock_configs, "rebalanced portfolio")
+    portfolio_config = {"investment_time": max(stock_config["investment_time"] for stock_config in stock_configs)}
+    for amount in SCENARIO_AMOUNTS:
+        portfolio_config[amount] = sum(stock_config.get(amount, 0) for stock_config in stock_configs)
+    return portfolio_config
+
+
+def calculate_rebalanced_outcome(
+    changes: np.ndarray,
+    flow: np.ndarray,
+    weights: np.ndarray,
+    policy: str = "calendar",
+    interval: int = 12,
+    band: float = 0.05,
+    dividend: np.ndarray = None,
+    dividend_reinvestment=True,
+    keep_paths: bool = False,
+) -> dict:
+    """Invests a portfolio with target weights, all paths and assets are updated at once in every month.
+
+    At the start of every month the contribution is added and the policy is applied before the assets grow:
+
+    - "none": the contribution is split by the target weights, the weights drift
+    - "calendar": like "none", every `interval` months all holdings are reset to the target weights
+    - "threshold": like "none", paths with a weight more than `band` off its target are reset to the target weights
+    - "contributions": the contribution is split in proportion to the shortfall of every asset below its target, so
+      the weights are pulled back without selling
+
+    Args:
+        changes (np.ndarray): (iterations x months x assets) monthly change of the price
+        flow (np.ndarray): Money added to the portfolio at the start of each month
+        weights (np.ndarray): Target weight of every asset
+        policy (str): Rebalancing policy, one of `REBALANCING_POLICIES`
+        interval (int): Months between calendar rebalancing
+        band (float): Maximum deviation of a weight from its target for threshold rebalancing
+        dividend (np.ndarray, optional): Dividend relative to the price with the shape of `changes`
+        dividend_reinvestment (bool | np.ndarray): Whether the dividends of (every) asset are reinvested
+        keep_paths (bool): Also return the total and net invested amount of every month
+
+    Returns:
+        dict: Final amounts, net invested amounts, return products, drawdowns, fan chart values, dividends, turnover
+            and number of rebalancing trades per path (and asset), the combined values per path
+    """
+    if policy not in REBALANCING_POLICIES:
+        raise ValueError(f"Unknown rebalancing policy '{policy}', expected one of {REBALANCING_POLICIES}")
+    iterations, number_of_months, number_of_assets = changes.shape
+    weights = np.asarray(weights, dtype=np.float64)
+    reinvested = np.broadcast_to(np.asarray(dividend_reinvestment, dtype=np.float64), number_of_assets)
+
+    total = np.zeros((iterations, number_of_assets))
+    invested = np.zeros((iterations, number_of_assets))
+    dividends = np.zeros((iterations, number_of_assets))
+    turnover = np.zeros(iterations)
+    rebalances = np.zeros(iterations, dtype=np.int64)
+    return_product = np.ones((iterations, number_of_assets))
+    drawdown = DrawdownTracker((iterations, number_of_assets))
+    combined_return_product = np.ones(iterations)
+    combined_drawdown = DrawdownTracker(iterations)
+    fan = FanTracker(number_of_months, (iterations, number_of_assets))
+    fan_invested = FanTracker(number_of_months, (iterations, number_of_assets))
+    combined_fan = FanTracker(number_of_months, iterations)
+    if keep_paths:
+        total_paths = np.empty((iterations, number_of_months, number_of_assets))
+        invested_paths = np.empty((iterations, number_of_months, number_of_assets))
+
+    for month in range(number_of_months):
+        value = total.sum(axis=1) + flow[month]
+        target = value[:, None] * weights
+        if policy == "contributions":
+            # the shortfalls add up to at least the contribution, so no asset is sold
+            shortfall = np.maximum(target - total, 0)
+            shortfall_sum = shortfall.sum(axis=1, keepdims=True)
+            split = np.divide(shortfall, shortfall_sum, out=np.tile(weights, (iterations, 1)), where=shortfall_sum > 0)
+            holdings = total + flow[month] * split
+        else:
+            holdings = total + flow[month] * weights
+            if policy == "calendar":
+                rebalance = np.full(iterations, month > 0 and month % interval == 0)
+            elif policy == "threshold":
+                drift = np.abs(holdings - target).max(axis=1)
+                rebalance = drift > band * np.maximum(value, 0)
+            else:
+                rebalance = np.zeros(iterations, dtype=bool)
+            holdings = np.where(rebalance[:, None], target, holdings)
+            rebalances += rebalance
+
+        # the trades include the contribution, the turnover is the amount sold to buy other assets
+        trades = holdings - total
+        invested += trades
+        turnover += np.maximum(-trades, 0).sum(axis=1)
+
+        total = holdings * changes[:, month, :]
+        if dividend is not None:
+            dividend_gain = total * dividend[:, month, :]
+            dividends += dividend_gain
+            total = total + dividend_gain * reinvested
+
+        # the first month only holds the initial investment, like `calculate_portfolio_outcome`
+        combined_total = total.sum(axis=1)
+        if month > 0:
+            monthly_return = np.where(holdings > 0, total / np.where(holdings > 0, holdings, 1), 1)
+            return_product *= monthly_return
+            drawdown.update(monthly_return)
+            combined_monthly_return = combined_total / value
+            combined_return_product *= combined_monthly_return
+            combined_drawdown.update(combined_monthly_return)
+        fan.update(month, total)
+        fan_invested.update(month, invested)
+        combined_fan.update(month, combined_total)
+        if keep_paths:
+            total_paths[:, month] = total
+            invested_paths[:, month] = invested
+
+    outcome = {
+        "final_amount": total,
+        "input_amount": invested,
+        "return_product": return_product,
+        "max_drawdown": drawdown.max_drawdown,
+        "time_under_water": drawdown.time_under_water,
+        "total_dividends": dividends,
+        "fan_total": fan.total,
+        "fan_input": fan_invested.total,
+        "combined_final_amount": total.sum(axis=1),
+        "combined_return_product": combined_return_product,
+        "combined_max_drawdown": combined_drawdown.max_drawdown,
+        "combined_time_under_water": combined_drawdown.time_under_water,
+        "combined_total_dividends": dividends.sum(axis=1),
+        "combined_fan_total": combined_fan.total,
+        "turnover": turnover,
+        "rebalances": rebalances,
+    }
+    if keep_paths:
+        outcome["total_paths"] = total_paths
+        outcome["input_paths"] = invested_paths
+    return outcome
+
+
+def simulate_rebalanced_portfolio(
+    stock_configs: list,
+    histories: dict,
+    rebalancing: dict = None,
+    iterations=100,
+    rng=None,
+    return_model=None,
+    risk_levels=RISK_LEVELS,
+) -> dict:
+    """Simulates the portfolio with target weights and a rebalancing policy on correlated return paths.
+
+    The return paths are drawn like in `simulate_portfolio`. The portfolio invests the summed amounts of all stock
+    configs over the longest investment time, see `get_rebalancing` for the weights and policy.
+
+    Args:
+        stock_configs (list): Stock configurations of the portfolio
+        histories (dict): Cleaned monthly series per symbol
+        rebalancing (dict, optional): Rebalancing section of the portfolio file
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        return_model (ReturnModel, optional): Model of the aligned monthly changes, correlated normal returns if
+            not given
+        risk_levels (list): Confidence levels of the value at risk
+
+    Returns:
+        dict: Summary statistics per symbol and for the combined portfolio
+    """
+    rebalancing = get_rebalancing(stock_configs, rebalancing)
+    symbols = list(rebalancing["weights"].keys())
+    mean, cov = estimate_return_parameters(get_aligned_returns({symbol: histories[symbol] for symbol in symbols}))
+
+    portfolio_config = get_portfolio_config(stock_configs)
+    number_of_months = int(portfolio_config["investment_time"] * 12)
+    flow = get_contribution_schedule(portfolio_config, number_of_months)["flow"]
+
+    chunk_size = max(1, MAX_CHUNK_VALUES // (number_of_months * len(symbols)))
+    outcomes = []
+    for start in range(0, iterations, chunk_size):
+        size = min(chunk_size, iterations - start)
+        if return_model is None:
+            changes = simulate_correlated_changes(mean, cov, number_of_months, size, rng)
+        else:
+            changes = return_model.simulate(number_of_months, size, rng).reshape(size, number_of_months, -1)
+        outcomes.append(
+            calculate_rebalanced_outcome(
+                changes,
+                flow,
+                list(rebalancing["weights"].values()),
+                rebalancing["policy"],
+                rebalancing["interval"],
+                rebalancing["band"],
+            )
+        )
+    outcome = {key: np.concatenate([o[key] for o in outcomes]) for key in outcomes[0].keys()}
+
+    return summarize_rebalanced_outcome(symbols, flow, outcome, risk_levels)
+
+
+def summarize_rebalanced_outcome(symbols: list, flow: np.ndarray, outcome: dict, risk_levels=RISK_LEVELS) -> dict:
+    number_of_months = len(flow)
+    results = {}
+    for i, symbol in enumerate(symbols):
+        results[symbol] = get_iteration_results(
+            outcome["input_amount"][:, i],
+            outcome["final_amount"][:, i],
+            outcome["return_product"][:, i],
+            number_of_months,
+            max_drawdown=outcome["max_drawdown"][:, i],
+            time_under_water=outcome["time_under_water"][:, i],
+        )
+    results["combined"] = get_iteration_results(
+        flow.sum(),
+        outcome["combined_final_amount"],
+        outcome["combined_return_product"],
+        number_of_months,
+        max_drawdown=outcome["combined_max_drawdown"],
+        time_under_water=outcome["combined_time_under_water"],
+    )
+
+    # the net invested amount of a symbol depends on the path, its fan chart shows the mean
+    fan_months = get_fan_months(number_of_months)
+    fan_totals = {symbol: outcome["fan_total"][:, :, i] for i, symbol in enumerate(symbols)}
+    fan_totals["combined"] = outcome["combined_fan_total"]
+    fan_inputs = {}
+    for i, symbol in enumerate(symbols):
+        fan_inputs[symbol] = np.zeros(number_of_months)
+        fan_inputs[symbol][fan_months] = outcome["fan_input"][:, :, i].mean(axis=0)
+    fan_inputs["combined"] = np.cumsum(flow)
+
+    summary = {}
+    for name, result in results.items():
+        summary[name] = {col: hp.summarize_values(values) for col, values in result.items()}
+        summary[name]["risk"] = get_risk_summary(result["total_yield_amount"], risk_levels)
+        summary[name]["fan"] = get_fan_summary(fan_totals[name], fan_months, fan_inputs[name])
+    summary["combined"]["turnover"] = hp.summarize_values(outcome["turnover"])
+    summary["combined"]["rebalances"] = hp.summarize_values(outcome["rebalances"].astype(np.float64))
+    return summary
+
+
+def rebalanced_past_outcome(stock_configs: list, histories: dict, rebalancing: dict = None) -> dict:
+    """Backtest of the portfolio with target weights and a rebalancing policy on the aligned history.
+
+    The backtest covers the last `investment_time` years (the longest of the stock configs) which all symbols have in
+    common. Contributions are invested at the start of a month like in the simulation, dividends are reinvested per
+    the stock configs.
+
+    Args:
+        stock_configs (list): Stock configurations of the portfolio
+        histories (dict): Cleaned monthly series per symbol
+        rebalancing (dict, optional): Rebalancing section of the portfolio file
+
+    Returns:
+        dict: Monthly total and net invested amount per symbol and combined, summary per symbol and combined
+    """
+    rebalancing = get_rebalancing(stock_configs, rebalancing)
+    symbols = list(rebalancing["weights"].keys())
+    panel = get_history_panel({symbol: histories[symbol] for symbol in symbols})
+
+    portfolio_config = get_portfolio_config(stock_configs)
+    number_of_months = min(len(panel), int(portfolio_config["investment_time"] * 12))
+    first_month = len(panel) - number_of_months
+    panel = panel.iloc[first_month:]
+    flow = get_contribution_schedule(portfolio_config, number_of_months)["flow"]
+
+    # the first month is bought at the open price
+    close, open_, dividend = (panel[col][symbols].to_numpy(dtype=np.float64) for col in ["close", "open", "dividend"])
+    changes = np.empty_like(close)
+    changes[1:] = close[1:] / close[:-1]
+    changes[0] = close[0] / open_[0]
+    outcome = calculate_rebalanced_outcome(
+        changes[None],
+        flow,
+        list(rebalancing["weights"].values()),
+        rebalancing["policy"],
+        rebalancing["interval"],
+        rebalancing["band"],
+        dividend=dividend[None],
+        dividend_reinvestment=[stock_config.get("dividend_reinvestment", True) for stock_config in stock_configs],
+        keep_paths=True,
+    )
+
+    data = {"date": panel.index.to_timestamp(how="end").normalize()}
+    for i, symbol in enumerate(symbols):
+        data[f"total_{symbol}"] = outcome["total_paths"][0, :, i]
+        data[f"input_{symbol}"] = outcome["input_paths"][0, :, i]
+    data["total_combined"] = outcome["total_paths"][0].sum(axis=1)
+    data["input_combined"] = np.cumsum(flow)
+
+    # schema of the backtest summary of a symbol, with python floats so the summaries are json serializable
+    summary = {}
+    for i, symbol in enumerate(symbols):
+        summary[symbol] = hda.get_backtest_summary(
+            float(outcome["final_amount"][0, i]),
+            float(outcome["input_amount"][0, i]),
+            float(outcome["total_dividends"][0, i]),
+            float(outcome["return_product"][0, i]),
+            number_of_months,
+        )
+    summary["combined"] = hda.get_backtest_summary(
+        float(outcome["combined_final_amount"][0]),
+        float(flow.sum()),
+        float(outcome["combined_total_dividends"][0]),
+        float(outcome["combined_return_product"][0]),
+        number_of_months,
+    )
+    summary["combined"]["turnover"] = round(float(outcome["turnover"][0]), 2)
+    summary["combined"]["rebalances"] = int(outcome["rebalances"][0])
+    for name in summary.keys():
+        summary[name]["investment_time"] = round(number_of_months / 12, 2)
+
+    return {"data": pd.DataFrame(data).reset_index(drop=True), "summary": summary, "rebalancing": rebalancing}
+
+
+def get_history_panel(histories: dict) -> pd.DataFrame:
+    # monthly open, close and dividend of every symbol, restricted to the months all symbols have in common
+    panel = pd.concat(
+        {
+            symbol: df.set_index(df["date"].dt.to_period("M"))[["open", "close", "dividend"]]
+            for symbol, df in histories.items()
+        },
+        axis=1,
+        join="inner",
+    )
+    return panel.swaplevel(axis=1).sort_index()
@@ -0,0 +1,418 @@
+import abc
+import hashlib
+import math
+
+import numpy as np
+
+from .portfolio_simulation import get_aligned_returns, get_covariance_factor
+
+DEFAULT_BLOCK_SIZE = 12
+
+# fitted models need a few years of monthly returns
+MIN_FIT_MONTHS = 24
+
+# Student-t degrees of freedom without excess kurtosis, close to normal returns
+MAX_T_DOF = 100.0
+
+# GARCH(1,1) grid of the likelihood fit, refined once around the best point; alpha + beta stays below the maximum
+# persistence, so the unconditional variance exists
+GARCH_GRID_STEP = 0.02
+GARCH_REFINED_STEP = 0.002
+MAX_GARCH_ALPHA = 0.3
+MAX_GARCH_PERSISTENCE = 0.999
+
+# EM fit of the regime switching model
+REGIME_FIT_ITERATIONS = 200
+REGIME_FIT_TOLERANCE = 1e-6
+
+
+class ReturnModel(abc.ABC):
+    """Base of the models of monthly changes.
+
+    A model is fitted from historical monthly changes (1 + the close returns of `get_general_summary`), one column per
+    symbol, and generates whole (iterations x months) change matrices, (iterations x months x symbols) for several
+    symbols. Months with missing values are dropped.
+
+    Args:
+        changes (np.ndarray): Historical monthly changes (1 + return), one column per symbol
+    """
+
+    name = None
+
+    def __init__(self, changes: np.ndarray):
+        changes = np.asarray(changes, dtype=np.float64)
+        self.changes = changes[~np.isnan(changes).reshape(len(changes), -1).any(axis=1)]
+        if len(self.changes) == 0:
+            raise ValueError(f"The {self.name} model needs at least one month of history")
+
+    @classmethod
+    def from_histories(cls, histories: dict, **kwargs) -> "ReturnModel":
+        # monthly changes of all symbols in the months they have in common
+        return cls(get_aligned_returns(histories).to_numpy() + 1, **kwargs)
+
+    @abc.abstractmethod
+    def simulate(self, number_of_months: int, iterations: int, rng=None) -> np.ndarray:
+        """Returns (iterations x months) changes, or (iterations x months x symbols) for several symbols."""
+
+    @property
+    def params(self) -> dict:
+        # identifies the model in cache keys
+        return {
+            "returns": self.name,
+            **self.get_fitted_params(),
+            "history": hashlib.sha256(self.changes.tobytes()).hexdigest(),
+        }
+
+    def get_fitted_params(self) -> dict:
+        return {}
+
+    def get_fit_returns(self) -> np.ndarray:
+        # (months x symbols) historical returns of the fitted models
+        if len(self.changes) < MIN_FIT_MONTHS:
+            raise ValueError(f"The {self.name} model needs at least {MIN_FIT_MONTHS} months of history")
+        returns = self.changes.reshape(len(self.changes), -1) - 1
+        if (returns.std(axis=0) == 0).any():
+            raise ValueError(f"The {self.name} model needs varying returns of every symbol")
+        return returns
+
+    def get_changes(self, returns: np.ndarray) -> np.ndarray:
+        # simulated (months x iterations x symbols) returns as changes, without the symbol axis for one symbol
+        changes = (returns + 1).transpose(1, 0, 2)
+        return changes if self.changes.ndim > 1 else changes[:, :, 0]
+
+
+class BlockBootstrap(ReturnModel):
+    """Circular moving block bootstrap of historical monthly changes.
+
+    Every path is built from contiguous blocks of `block_size` historical months, so volatility clusters and crashes
+    spanning several months are kept. Blocks wrap around the end of the history, so every month is drawn with the
+    same probability. With one column per symbol, all symbols share the sampled months and keep their correlation.
+    Only the block starts are drawn, the paths are gathered with a single index operation.
+
+    Args:
+        changes (np.ndarray): Historical monthly changes (1 + return), one column per symbol
+        block_size (int): Number of consecutive months per block
+    """
+
+    name = "bootstrap"
+
+    def __init__(self, changes: np.ndarray, block_size: int = DEFAULT_BLOCK_SIZE):
+        super().__init__(changes)
+        self.block_size = min(block_size, len(self.changes))
+
+    def simulate(self, number_of_months: int, iterations: int, rng=None) -> np.ndarray:
+        """Returns (iterations x months) changes, or (iterations x months x symbols) for several symbols."""
+        if rng is None:
+            rng = np.random
+        integers = rng.integers if isinstance(rng, np.random.Generator) else rng.randint
+
+        number_of_blocks = math.ceil(number_of_months / self.block_size)
+        block_starts = integers(0, len(self.changes), (iterations, number_of_blocks))
+        index = (block_starts[:, :, None] + np.arange(self.block_size)).reshape(iterations, -1)[:, :number_of_months]
+        return self.changes[index % len(self.changes)]
+
+    def get_fitted_params(self) -> dict:
+        return {"block_size": self.block_size}
+
+
+class StudentT(ReturnModel):
+    """Student-t monthly returns with fat tails.
+
+    Mean and covariance are the historical ones, the degrees of freedom follow from the mean excess kurtosis of the
+    symbols (`6 / (dof - 4)`) unless given. With several symbols, one chi-square draw per path and month scales all
+    symbols (multivariate t), so extreme months hit them together.
+
+    Args:
+        changes (np.ndarray): Historical monthly changes (1 + return), one column per symbol
+        dof (float, optional): Degrees of freedom, above 2
+    """
+
+    name = "student_t"
+
+    def __init__(self, changes: np.ndarray, dof: float = None):
+        super().__init__(changes)
+        returns = self.get_fit_returns()
+        self.mean = returns.mean(axis=0)
+        self.cov = np.atleast_2d(np.cov(returns, rowvar=False))
+        self.dof = get_t_dof(returns) if dof is None else float(dof)
+        if self.dof <= 2:
+            raise ValueError(f"The Student-t model needs more than 2 degrees of freedom, got {self.dof}")
+
+    def simulate(self, number_of_months: int, iterations: int, rng=None) -> np.ndarray:
+        """Returns (iterations x months) changes, or (iterations x months x symbols) for several symbols."""
+        if rng is None:
+            rng = np.random
+
+        # normal draws with the covariance of the t distribution scaled down, divided by sqrt(chi-square / dof)
+        factor = get_covariance_factor(self.cov * (self.dof - 2) / self.dof)
+        returns = rng.standard_normal((number_of_months, iterations, len(self.mean))) @ factor.T
+        returns *= np.sqrt(self.dof / rng.chisquare(self.dof, (number_of_months, iterations, 1)))
+        returns += self.mean
+        return self.get_changes(returns)
+
+    def get_fitted_params(self) -> dict:
+        return {"dof": self.dof}
+
+
+def get_t_dof(returns: np.ndarray) -> float:
+    # degrees of freedom matching the mean excess kurtosis of the columns, normal returns have none
+    standardized = (returns - returns.mean(axis=0)) / returns.std(axis=0)
+    excess_kurtosis = float(np.mean((standardized**4).mean(axis=0) - 3))
+    if excess_kurtosis <= 6 / (MAX_T_DOF - 4):
+        return MAX_T_DOF
+    return 4 + 6 / excess_kurtosis
+
+
+class Garch(ReturnModel):
+    """GARCH(1,1) monthly returns with volatility clustering.
+
+    The variance of every month follows `omega + alpha * residual ** 2 + beta * variance` of the previous month, with
+    `omega` targeting the historical variance. `alpha` and `beta` maximize the Gaussian likelihood of each symbol.
+    Several symbols keep the correlation of their standardized residuals (constant conditional correlation).
+    Simulated paths start at the historical variance, the recursion runs over the months for all paths at once.
+
+    Args:
+        changes (np.ndarray): Historical monthly changes (1 + return), one column per symbol
+    """
+
+    name = "garch"
+
+    def __init__(self, changes: np.ndarray):
+        super().__init__(changes)
+        returns = self.get_fit_returns()
+        self.mean = returns.mean(axis=0)
+        residuals = returns - self.mean
+        self.variance = residuals.var(axis=0)
+        self.alpha, self.beta = fit_garch(residuals)
+        self.omega = self.variance * (1 - self.alpha - self.beta)
+
+        standardized = residuals / np.sqrt(get_garch_variance(residuals, self.alpha, self.beta))
+        self.correlation = np.atleast_2d(np.corrcoef(standardized, rowvar=False))
+
+    def simulate(self, number_of_months: int, iterations: int, rng=None) -> np.ndarray:
+        """Returns (iterations x months) changes, or (iterations x months x symbols) for several symbols."""
+        if rng is None:
+            rng = np.random
+
+        factor = get_covariance_factor(self.correlation)
+        returns = rng.standard_normal((number_of_months, iterations, len(self.mean))) @ factor.T
+        variance = np.tile(self.variance, (iterations, 1))
+        for month in range(number_of_months):
+            # the innovations of the month become its residuals
+            residual = returns[month]
+            residual *= np.sqrt(variance)
+            variance = self.omega + self.alpha * residual**2 + self.beta * variance
+        returns += self.mean
+        return self.get_changes(returns)
+
+    def get_fitted_params(self) -> dict:
+        return {"alpha": self.alpha.tolist(), "beta": self.beta.tolist()}
+
+
+def get_garch_variance(residuals: np.ndarray, alpha: np.ndarray, beta: np.ndarray) -> np.ndarray:
+    # conditional variance of every month (rows) with variance targeting, starting at the historical variance.
+    # `alpha` and `beta` are one value per column or (candidates x columns), the recursion runs over the months only
+    variance = residuals.var(axis=0)
+    omega = variance * (1 - alpha - beta)
+    conditional_variance = np.empty((len(residuals), *np.shape(alpha)))
+    conditional_variance[0] = variance
+    for month in range(1, len(residuals)):
+        conditional_variance[month] = omega + alpha * residuals[month - 1] ** 2 + beta * conditional_variance[month - 1]
+    return conditional_variance
+
+
+def get_garch_log_likelihood(residuals: np.ndarray, alpha: np.ndarray, beta: np.ndarray) -> np.ndarray:
+    # Gaussian log likelihood without constants of (candidates x columns) parameters, -inf outside the valid range
+    valid = (alpha >= 0) & (beta >= 0) & (alpha + beta < MAX_GARCH_PERSISTENCE)
+    alpha = np.where(valid, alpha, 0.0)
+    beta = np.where(valid, beta, 0.0)
+    conditional_variance = get_garch_variance(residuals, alpha, beta)
+    log_likelihood = -(np.log(conditional_variance) + residuals[:, None, :] ** 2 / conditional_variance).sum(axis=0)
+    return np.where(valid, log_likelihood / 2, -np.inf)
+
+
+def fit_garch(residuals: np.ndarray) -> tuple:
+    """Fits GARCH(1,1) parameters to every column of `residuals` by maximum likelihood.
+
+    All candidates of a grid are evaluated at once, then a finer grid around the best candidate of each column.
+
+    Args:
+        residuals (np.ndarray): (months x symbols) returns minus their mean
+
+    Returns:
+        tuple: `alpha` and `beta` per column
+    """
+    number_of_symbols = residuals.shape[1]
+    alpha, beta = np.meshgrid(
+        np.arange(0, MAX_GARCH_ALPHA + GARCH_GRID_STEP / 2, GARCH_GRID_STEP),
+        np.arange(0, 1, GARCH_GRID_STEP),
+        indexing="ij",
+    )
+    best_alpha, best_beta = get_best_garch_candidate(
+        residuals, np.tile(alpha.reshape(-1, 1), number_of_symbols), np.tile(beta.reshape(-1, 1), number_of_symbols)
+    )
+
+    offsets = np.arange(-GARCH_GRID_STEP, GARCH_GRID_STEP * 1.001, GARCH_REFINED_STEP)
+    alpha_offset, beta_offset = np.meshgrid(offsets, offsets, indexing="ij")
+    return get_best_garch_candidate(
+        residuals, best_alpha + alpha_offset.reshape(-1, 1), best_beta + beta_offset.reshape(-1, 1)
+    )
+
+
+def get_best_garch_candidate(residuals: np.ndarray, alpha: np.ndarray, beta: np.ndarray) -> tuple:
+    # parameters of the (candidates x columns) grid with the highest likelihood of each column
+    best = np.argmax(get_garch_log_likelihood(residuals, alpha, beta), axis=0)
+    columns = np.arange(residuals.shape[1])
+    return alpha[best, columns], beta[best, columns]
+
+
+class RegimeSwitching(ReturnModel):
+    """Two-state Markov regime switching monthly returns.
+
+    Each regime has its own mean and covariance, a calm and a turbulent regime, and the regime of the next month
+    depends on the current one. Both are fitted with the EM algorithm, the calm regime is the one with the lower
+    variance. Simulated paths start in the stationary distribution of the regimes, the regime chain runs over the
+    months for all paths at once and all symbols share it.
+
+    Args:
+        changes (np.ndarray): Historical monthly changes (1 + return), one column per symbol
+    """
+
+    name = "regime"
+
+    def __init__(self, changes: np.ndarray):
+        super().__init__(changes)
+        self.means, self.covs, self.transition = fit_regimes(self.get_fit_returns())
+        # probability of the turbulent regime in the long run
+        switch = self.transition[0, 1] + self.transition[1, 0]
+        self.turbulent_probability = self.transition[0, 1] / switch if switch > 0 else 0.5
+
+    def simulate(self, number_of_months: int, iterations: int, rng=None) -> np.ndarray:
+        """Returns (iterations x months) changes, or (iterations x months x symbols) for several symbols."""
+        if rng is None:
+            rng = np.random
+
+        uniform = rng.random((number_of_months, iterations))
+        returns = rng.standard_normal((number_of_months, iterations, self.means.shape[1]))
+        calm_factor, turbulent_factor = [get_covariance_factor(cov).T for cov in self.covs]
+        turbulent = uniform[0] < self.turbulent_probability
+        for month in range(number_of_months):
+            if month > 0:
+                turbulent = uniform[month] < self.transition[turbulent.astype(np.intp), 1]
+            # the normal draws of the month are scaled by the factor of each path's regime
+            returns[month] = np.where(
+                turbulent[:, None],
+                self.means[1] + returns[month] @ turbulent_factor,
+                self.means[0] + returns[month] @ calm_factor,
+            )
+        return self.get_changes(returns)
+
+    def get_fitted_params(self) -> dict:
+        return {"means": self.means.tolist(), "covs": self.covs.tolist(), "transition": self.transition.tolist()}
+
+
+def get_regime_log_density(returns: np.ndarray, means: np.ndarray, covs: np.ndarray) -> np.ndarray:
+    # (months x regimes) log density of the multivariate normal returns of each regime
+    log_density = np.empty((len(returns), len(means)))
+    for regime, (mean, cov) in enumerate(zip(means, covs)):
+        deviation = returns - mean
+        _, log_determinant = np.linalg.slogdet(cov)
+        distance = np.sum(deviation @ np.linalg.inv(cov) * deviation, axis=1)
+        log_density[:, regime] = -(returns.shape[1] * np.log(2 * np.pi) + log_determinant + distance) / 2
+    return log_density
+
+
+def fit_regimes(returns: np.ndarray) -> tuple:
+    """Fits a two-state Markov regime switching model with the EM (Baum-Welch) algorithm.
+
+    The months with a below median deviation from the mean start in the calm regime, the others in the turbulent one.
+
+    Args:
+        returns (np.ndarray): (months x symbols) historical returns
+
+    Returns:
+        tuple: (regimes x symbols) means, (regimes x symbols x symbols) covariances and the (regimes x regimes)
+            transition matrix, calm regime first
+    """
+    number_of_months, number_of_symbols = returns.shape
+    # keeps the covariances of short regimes positive definite
+    ridge = np.eye(number_of_symbols) * 1e-10 * returns.var(axis=0).mean()
+
+    deviation = ((returns - returns.mean(axis=0)) ** 2).sum(axis=1)
+    turbulent = deviation > np.median(deviation)
+    weights = np.column_stack([~turbulent, turbulent]).astype(np.float64)
+    transition = np.array([[0.9, 0.1], [0.1, 0.9]])
+    initial = np.full(2, 0.5)
+    previous_log_likelihood = -np.inf
+    for _ in range(REGIME_FIT_ITERATIONS):
+        # maximization: weighted moments of every regime
+        regime_weights = weights.sum(axis=0)
+        means = weights.T @ returns / regime_weights[:, None]
+        covs = np.array(
+            [
+                (weights[:, regime, None] * (returns - means[regime])).T
+                @ (returns - means[regime])
+                / regime_weights[regime]
+                + ridge
+                for regime in range(2)
+            ]
+        )
+
+        # expectation: scaled forward backward pass over the months
+        log_density = get_regime_log_density(returns, means, covs)
+        shift = log_density.max(axis=1, keepdims=True)
+        density = np.exp(log_density - shift)
+        forward = np.empty((number_of_months, 2))
+        scale = np.empty(number_of_months)
+        probability = initial
+        for month in range(number_of_months):
+            forward[month] = probability * density[month]
+            scale[month] = forward[month].sum()
+            forward[month] /= scale[month]
+            probability = forward[month] @ transition
+        backward = np.ones((number_of_months, 2))
+        for month in range(number_of_months - 2, -1, -1):
+            backward[month] = transition @ (density[month + 1] * backward[month + 1]) / scale[month + 1]
+
+        weights = forward * backward
+        weights /= weights.sum(axis=1, keepdims=True)
+        # expected number of switches between the regimes
+        switches = transition * (forward[:-1].T @ (density[1:] * backward[1:] / scale[1:, None]))
+        transition = switches / switches.sum(axis=1, keepdims=True)
+        initial = weights[0]
+
+        log_likelihood = float(np.log(scale).sum() + shift.sum())
+        if log_likelihood - previous_log_likelihood < REGIME_FIT_TOLERANCE:
+            break
+        previous_log_likelihood = log_likelihood
+
+    # the calm regime has the lower variance
+    order = np.argsort([np.trace(cov) for cov in covs])
+    return means[order], covs[order], transition[np.ix_(order, order)]
+
+
+# model name -> class, normal returns are simulated without a model
+RETURN_MODEL_CLASSES = {
+    "bootstrap": BlockBootstrap,
+    "student_t": StudentT,
+    "garch": Garch,
+    "regime": RegimeSwitching,
+}
+RETURN_MODELS = ["normal", *RETURN_MODEL_CLASSES]
+
+
+def get_return_model(name: str, changes: np.ndarray) -> ReturnModel:
+    """Fits the return model `name` to historical monthly changes.
+
+    Args:
+        name (str): One of `RETURN_MODELS`
+        changes (np.ndarray): Historical monthly changes (1 + return), one column per symbol
+
+    Returns:
+        ReturnModel: Fitted model, `None` for normal returns
+    """
+    if name not in RETURN_MODELS:
+        raise ValueError(f"Unknown return model '{name}', expected one of {RETURN_MODELS}")
+    if name == "normal":
+        return None
+    return RETURN_MODEL_CLASSES[name](changes)
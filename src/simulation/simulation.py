@@ -3,20 +3,82 @@ import pandas as pd
 
 import historical_data_analysis as hda
 
+from .array_simulation import (
+    RISK_LEVELS,
+    DrawdownTracker,
+    get_contribution_schedule,
+    get_fan_months,
+    get_fan_summary,
+    get_risk_summary,
+    has_withdrawals,
+    simulate_outcome_array,
+)
+from .parallel import simulate_outcome_parallel
+from .streaming import simulate_outcome_streaming
+
+SIMULATION_ENGINES = ["array", "streaming", "parallel", "dataframe"]
+
+
+def simulate_outcome(
+    stock_config,
+    monthly_change_mean,
+    monthly_change_std,
+    iterations=100,
+    engine="array",
+    seed=None,
+    workers=None,
+    return_model=None,
+    risk_levels=RISK_LEVELS,
+):
+    if engine == "parallel":
+        return simulate_outcome_parallel(
+            stock_config,
+            monthly_change_mean,
+            monthly_change_std,
+            iterations,
+            seed,
+            workers,
+            return_model=return_model,
+            risk_levels=risk_levels,
+        )
 
-def simulate_outcome(stock_config, monthly_change_mean, monthly_change_std, iterations=100):
+    rng = None if seed is None else np.random.default_rng(seed)
+    if engine == "array":
+        return simulate_outcome_array(
+            stock_config, monthly_change_mean, monthly_change_std, iterations, rng, return_model, risk_levels
+        )
+    if engine == "streaming":
+        return simulate_outcome_streaming(
+            stock_config,
+            monthly_change_mean,
+            monthly_change_std,
+            iterations,
+            rng=rng,
+            return_model=return_model,
+            risk_levels=risk_levels,
+        )
+    if engine != "dataframe":
+        raise ValueError(f"Unknown simulation engine '{engine}', expected one of {SIMULATION_ENGINES}")
+    if return_model is not None:
+        raise ValueError("The dataframe engine only simulates normal returns")
+
+    # reference implementation based on one DataFrame per iteration, drawing from the global random state
+    if seed is not None:
+        np.random.seed(np.random.default_rng(seed).integers(2**32))
     number_of_months = stock_config["investment_time"] * 12
 
     df_dict_simulated = simulate_data(
         stock_config, monthly_change_mean, monthly_change_std, number_of_months, iterations
     )
     df_dict_calc = calculate_outcome(df_dict_simulated, number_of_months, iterations)
-    summary = summarize_simulation_outcome(df_dict_simulated, df_dict_calc, number_of_months, iterations)
+    summary = summarize_simulation_outcome(df_dict_simulated, df_dict_calc, number_of_months, iterations, risk_levels)
 
     return summary
 
 
-def summarize_simulation_outcome(df_dict_simulated, df_dict_calc, number_of_months, iterations):
+def summarize_simulation_outcome(
+    df_dict_simulated, df_dict_calc, number_of_months, iterations, risk_levels=RISK_LEVELS
+):
     # summarize each iteration
     df_result = pd.DataFrame(
         columns=[
@@ -26,10 +88,12 @@ def summarize_simulation_outcome(df_dict_simulated, df_dict_calc, number_of_mont
             "total_yield_percent",
             "total_dividends",
             "annual_return",
+            "max_drawdown",
+            "time_under_water",
         ],
         index=list(range(iterations)),
     )
-    df_result.loc[:, "input_amount"] = df_dict_simulated["input"][-1]
+    df_result.loc[:, "input_amount"] = df_dict_simulated["input"][-1] + df_dict_calc["withdrawal_shortfall"]
     df_result.loc[:, "final_amount"] = df_dict_calc["df_total"].loc[:, number_of_months - 1]
     df_result.loc[:, "total_dividends"] = df_dict_simulated["df_dividend_gain"].transpose().sum()
     df_result.loc[:, "annual_return"] = 100 * (
@@ -39,6 +103,11 @@ def summarize_simulation_outcome(df_dict_simulated, df_dict_calc, number_of_mont
     df_result.loc[:, "total_yield_percent"] = 100 * (
         df_result.loc[:, "total_yield_amount"] / df_result.loc[:, "final_amount"]
     )
+    drawdown = df_dict_calc["drawdown"]
+    df_result.loc[:, "max_drawdown"] = 100 * drawdown.max_drawdown
+    df_result.loc[:, "time_under_water"] = drawdown.time_under_water
+    if has_withdrawals(np.diff(df_dict_simulated["input"], prepend=0)):
+        df_result.loc[:, "withdrawal_shortfall"] = df_dict_calc["withdrawal_shortfall"]
 
     # summarize summary of all interations
     simulation_summary = {}
@@ -51,18 +120,19 @@ def summarize_simulation_outcome(df_dict_simulated, df_dict_calc, number_of_mont
         simulation_summary[col]["quantile_75"] = df_result.loc[:, col].quantile(0.75)
         simulation_summary[col]["min"] = df_result.loc[:, col].min()
         simulation_summary[col]["max"] = df_result.loc[:, col].max()
+    simulation_summary["risk"] = get_risk_summary(
+        df_result["total_yield_amount"].to_numpy(dtype=np.float64), risk_levels
+    )
+    fan_months = get_fan_months(number_of_months)
+    simulation_summary["fan"] = get_fan_summary(
+        df_dict_calc["df_total"].loc[:, fan_months].to_numpy(dtype=np.float64), fan_months, df_dict_simulated["input"]
+    )
 
     return simulation_summary
 
 
 def simulate_data(stock_config, monthly_change_mean, monthly_change_std, number_of_months, iterations):
-    static_cols = [
-        "monthly_money",
-        "quarterly_money",
-        "bi_annual_money",
-        "annual_money",
-        "input",
-    ]
+    static_cols = [*hda.CASHFLOW_COLUMNS, "input"]
     simulated_cols = ["simulated_change", "dividend_gain"]
 
     df_dict_simulated = {
@@ -93,41 +163,14 @@ def get_simulated_df(stock_config, monthly_change_mean, monthly_change_std):
     random_return_values = np.random.normal(monthly_change_mean, monthly_change_std, number_of_months)
     df_simulation.loc[:, "simulated_change"] = random_return_values + 1
 
-    df_simulation.loc[1:, "monthly_money"] = stock_config["monthly_investment"]
-    df_simulation.loc[1::3, "quarterly_money"] = stock_config["quarter_investment"]
-    df_simulation.loc[1::6, "bi_annual_money"] = stock_config["bi_annual_investment"]
-    df_simulation.loc[1::12, "annual_money"] = stock_config["annual_investment"]
-    df_simulation.fillna(0, inplace=True)
+    # regular investments, lump sums and cumulative input of the cached cashflows
+    cashflows = get_contribution_schedule(stock_config, number_of_months)
+    for col in [*hda.CASHFLOW_COLUMNS, "input"]:
+        df_simulation.loc[:, col] = cashflows[col]
 
     df_simulation.reset_index(inplace=True)
     df_simulation.rename(columns={"index": "month_number"}, inplace=True)
 
-    df_simulation.loc[:, "input"] = stock_config["initial_investment"]
-    df_simulation = hda.calculate_input_for_interval(
-        df_simulation,
-        12,
-        stock_config["annual_investment"],
-        stock_config["initial_investment"],
-    )
-    df_simulation = hda.calculate_input_for_interval(
-        df_simulation,
-        6,
-        stock_config["bi_annual_investment"],
-        stock_config["initial_investment"],
-    )
-    df_simulation = hda.calculate_input_for_interval(
-        df_simulation,
-        3,
-        stock_config["quarter_investment"],
-        stock_config["initial_investment"],
-    )
-    df_simulation = hda.calculate_input_for_interval(
-        df_simulation,
-        1,
-        stock_config["monthly_investment"],
-        stock_config["initial_investment"],
-    )
-
     df_simulation.loc[:, "dividend_gain"] = 0
 
     return df_simulation
@@ -143,20 +186,26 @@ def calculate_outcome(df_dict_simulated, number_of_months, iterations):
     df_dict_calc["df_total"].loc[:, 0] = (
         df_dict_simulated["input"][0] * df_dict_simulated["df_simulated_change"].loc[:, 0]
     )
+    # withdrawals are limited to the total of each path, the part which could not be withdrawn is the shortfall
+    df_dict_calc["withdrawal_shortfall"] = pd.Series(0.0, index=list(range(iterations)))
+    # the drawdown is updated with the return of every month, without a second pass over the returns
+    df_dict_calc["drawdown"] = DrawdownTracker(iterations)
     for month in range(1, number_of_months):
-        df_dict_calc["df_total"].loc[:, month] = (
-            df_dict_calc["df_total"].loc[:, month - 1] * df_dict_simulated["df_simulated_change"].loc[:, month]
-            + df_dict_simulated["monthly_money"][month] * df_dict_simulated["df_simulated_change"].loc[:, month]
-            + df_dict_simulated["quarterly_money"][month] * df_dict_simulated["df_simulated_change"].loc[:, month]
-            + df_dict_simulated["bi_annual_money"][month] * df_dict_simulated["df_simulated_change"].loc[:, month]
-            + df_dict_simulated["annual_money"][month] * df_dict_simulated["df_simulated_change"].loc[:, month]
-        )
-        df_dict_calc["df_return"].loc[:, month] = df_dict_calc["df_total"].loc[:, month] / (
-            df_dict_calc["df_total"].loc[:, month - 1]
-            + df_dict_simulated["monthly_money"][month]
+        contribution = (
+            df_dict_simulated["monthly_money"][month]
             + df_dict_simulated["quarterly_money"][month]
             + df_dict_simulated["bi_annual_money"][month]
             + df_dict_simulated["annual_money"][month]
+            + df_dict_simulated["lump_sum"][month]
         )
+        invested = (df_dict_calc["df_total"].loc[:, month - 1] + contribution).astype(np.float64)
+        df_dict_calc["withdrawal_shortfall"] += (-invested).clip(lower=0)
+        invested = invested.clip(lower=0)
+        total = (invested * df_dict_simulated["df_simulated_change"].loc[:, month]).astype(np.float64)
+        df_dict_calc["df_total"].loc[:, month] = total
+        # paths without money keep a return of 1
+        monthly_return = (total / invested.where(invested > 0, 1)).where(invested > 0, 1)
+        df_dict_calc["df_return"].loc[:, month] = monthly_return
+        df_dict_calc["drawdown"].update(monthly_return.to_numpy(dtype=np.float64))
 
     return df_dict_calc
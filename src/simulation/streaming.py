@@ -0,0 +1,292 @@
+import math
+
+import numpy as np
+
+import project_helpers as hp
+
+from .array_simulation import (
+    FAN_QUANTILES,
+    RISK_LEVELS,
+    DrawdownTracker,
+    FanTracker,
+    get_contribution_schedule,
+    get_iteration_results,
+    get_level_name,
+    has_withdrawals,
+    limit_withdrawals,
+    simulate_changes,
+)
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+def simulate_outcome_streaming(
+    stock_config,
+    monthly_change_mean,
+    monthly_change_std,
+    iterations=100,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    rng=None,
+    return_model=None,
+    risk_levels=RISK_LEVELS,
+):
+    """Simulation with bounded memory. Paths are generated in chunks of `chunk_size`, folded into running
+    accumulators and discarded, so the peak memory does not depend on `iterations`.
+
+    Mean, std, min, max and the loss probability are exact, the quartiles, the value at risk and the fan chart bands
+    come from a `QuantileSketch` with a relative error of at most `QuantileSketch.relative_accuracy`.
+
+    Args:
+        stock_config (dict): Stock configuration of the portfolio
+        monthly_change_mean (float): Mean of the monthly return
+        monthly_change_std (float): Standard deviation of the monthly return
+        iterations (int): Number of simulated paths
+        chunk_size (int): Number of paths held in memory at once
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+        return_model (ReturnModel, optional): Model of the monthly changes, normal returns if not given
+        risk_levels (list): Confidence levels of the value at risk
+
+    Returns:
+        dict: Summary statistics of all iterations, same schema as `simulate_outcome`
+    """
+    number_of_months = int(stock_config["investment_time"] * 12)
+    schedule = get_contribution_schedule(stock_config, number_of_months)
+
+    accumulator = SimulationAccumulator()
+    for start in range(0, iterations, chunk_size):
+        size = min(chunk_size, iterations - start)
+        changes = simulate_changes(monthly_change_mean, monthly_change_std, number_of_months, size, rng, return_model)
+        fan = FanTracker(number_of_months, size)
+        accumulator.update(get_chunk_results(changes, schedule, fan))
+        accumulator.update_fan(fan, schedule["input"])
+
+    return accumulator.summary(risk_levels)
+
+
+def get_chunk_results(changes: np.ndarray, schedule: dict, fan=None) -> dict:
+    drawdown = DrawdownTracker(changes.shape[0])
+    shortfall = np.zeros(changes.shape[0]) if has_withdrawals(schedule["flow"]) else None
+    final_amount, return_product = accumulate_paths(changes, schedule["flow"], drawdown, fan, shortfall)
+    number_of_months = changes.shape[1]
+    return get_iteration_results(
+        schedule["input"][-1],
+        final_amount,
+        return_product,
+        number_of_months,
+        max_drawdown=drawdown.max_drawdown,
+        time_under_water=drawdown.time_under_water,
+        withdrawal_shortfall=shortfall,
+    )
+
+
+def accumulate_paths(changes: np.ndarray, flow: np.ndarray, drawdown=None, fan=None, shortfall=None) -> tuple:
+    # same recurrence as `calculate_outcome_array`, but only the current month of every path is kept
+    changes = np.asfortranarray(changes, dtype=np.float64)
+    withdrawals = has_withdrawals(flow)
+    if withdrawals and shortfall is None:
+        shortfall = np.zeros(changes.shape[0])
+    total = flow[0] * changes[:, 0]
+    return_product = np.ones(changes.shape[0])
+    if fan is not None:
+        fan.update(0, total)
+    for month in range(1, changes.shape[1]):
+        previous_total = total + flow[month]
+        if withdrawals:
+            limit_withdrawals(previous_total, shortfall)
+        total = previous_total * changes[:, month]
+        if withdrawals:
+            monthly_return = np.divide(total, previous_total, out=np.ones_like(total), where=previous_total > 0)
+        else:
+            monthly_return = total / previous_total
+        return_product *= monthly_return
+        if drawdown is not None:
+            drawdown.update(monthly_return)
+        if fan is not None:
+            fan.update(month, total)
+
+    return total, return_product
+
+
+class SimulationAccumulator:
+    """Running statistics of every column of the per iteration simulation results."""
+
+    def __init__(self):
+        self.statistics = {}
+        # running statistics and input amount of the total value per fan chart month
+        self.fan = {}
+        self.fan_input = {}
+
+    def update(self, result: dict):
+        for col, values in result.items():
+            self.statistics.setdefault(col, RunningStatistics()).update(values)
+
+    def update_fan(self, fan: FanTracker, input_amount: np.ndarray):
+        for i, month in enumerate(fan.months.tolist()):
+            self.fan.setdefault(month, RunningStatistics()).update(fan.total[:, i])
+            self.fan_input[month] = float(input_amount[month])
+
+    def merge(self, other: "SimulationAccumulator"):
+        for col, statistics in other.statistics.items():
+            self.statistics.setdefault(col, RunningStatistics()).merge(statistics)
+        for month, statistics in other.fan.items():
+            self.fan.setdefault(month, RunningStatistics()).merge(statistics)
+        self.fan_input.update(other.fan_input)
+
+    def summary(self, risk_levels=RISK_LEVELS) -> dict:
+        summary = {col: statistics.summary() for col, statistics in self.statistics.items()}
+        if "total_yield_amount" in self.statistics:
+            summary["risk"] = self.get_risk_summary(risk_levels)
+        if len(self.fan) > 0:
+            summary["fan"] = self.get_fan_summary()
+        return summary
+
+    def get_fan_summary(self) -> dict:
+        # counterpart of `get_fan_summary` based on the sketches of the total value
+        months = sorted(self.fan.keys())
+        fan = {"months": months, "input": [self.fan_input[month] for month in months]}
+        for name, quantile in FAN_QUANTILES.items():
+            fan[name] = [self.fan[month].quantile(quantile) for month in months]
+        return fan
+
+    def get_risk_summary(self, risk_levels=RISK_LEVELS) -> dict:
+        # counterpart of `get_risk_summary` based on the sketch of the yield, losses are its negative values
+        sketch = self.statistics["total_yield_amount"].sketch
+        risk = {"loss_probability": sum(sketch.negative.values()) / sketch.count}
+        for level in risk_levels:
+            risk[f"value_at_risk_{get_level_name(level)}"] = -sketch.quantile(1 - level)
+            risk[f"conditional_value_at_risk_{get_level_name(level)}"] = -sketch.tail_mean(1 - level)
+        return risk
+
+
+class RunningStatistics:
+    """Mergeable count, mean, variance (Welford / Chan et al.), min, max and quantile sketch of a stream of values."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+
+        chunk = RunningStatistics()
+        chunk.count = values.size
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        chunk.sketch.add(values)
+        self.merge(chunk)
+
+    def merge(self, other: "RunningStatistics"):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def summary(self) -> dict:
+        summary = {"mean": self.mean}
+        summary["std"] = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float("nan")
+        for name, quantile in hp.SUMMARY_QUANTILES.items():
+            summary[name] = self.quantile(quantile)
+        summary["min"] = self.min
+        summary["max"] = self.max
+        return summary
+
+    def quantile(self, quantile: float) -> float:
+        # the exact extremes are known, the sketch only approximates values in between
+        return min(max(self.sketch.quantile(quantile), self.min), self.max)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with logarithmic buckets (DDSketch).
+
+    A value `x > 0` is counted in bucket `ceil(log(x) / log(gamma))`, negative values in a separate store, so every
+    quantile is returned with a relative error of at most `relative_accuracy`. The number of buckets only depends on
+    the range of the values, and merging two sketches adds up their bucket counts.
+    """
+
+    relative_accuracy = 0.005
+    min_value = 1e-9
+
+    def __init__(self):
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += values.size
+        self.zero_count += int((np.abs(values) < self.min_value).sum())
+        self.add_to_store(self.positive, values[values >= self.min_value])
+        self.add_to_store(self.negative, -values[values <= -self.min_value])
+
+    def add_to_store(self, store: dict, values: np.ndarray):
+        buckets, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64), return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            store[bucket] = store.get(bucket, 0) + count
+
+    def merge(self, other: "QuantileSketch"):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for store, other_store in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for bucket, count in other_store.items():
+                store[bucket] = store.get(bucket, 0) + count
+
+    def quantile(self, quantile: float) -> float:
+        if self.count == 0:
+            return float("nan")
+
+        rank = quantile * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.negative.keys(), reverse=True):
+            seen += self.negative[bucket]
+            if seen > rank:
+                return -self.get_bucket_value(bucket)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for bucket in sorted(self.positive.keys()):
+            seen += self.positive[bucket]
+            if seen > rank:
+                return self.get_bucket_value(bucket)
+        return self.get_bucket_value(max(self.positive.keys()))
+
+    def tail_mean(self, quantile: float) -> float:
+        # mean of the lowest `quantile` share of the values
+        tail_count = max(quantile * self.count, 1)
+        buckets = [
+            (-self.get_bucket_value(bucket), self.negative[bucket]) for bucket in sorted(self.negative, reverse=True)
+        ]
+        buckets.append((0.0, self.zero_count))
+        buckets += [(self.get_bucket_value(bucket), self.positive[bucket]) for bucket in sorted(self.positive)]
+
+        total = 0.0
+        seen = 0
+        for value, count in buckets:
+            count = min(count, tail_count - seen)
+            total += value * count
+            seen += count
+            if seen >= tail_count:
+                break
+        return total / seen
+
+    def get_bucket_value(self, bucket: int) -> float:
+        # value with the lowest relative error to all values of the bucket (gamma^(i-1), gamma^i]
+        return 2 * self.gamma**bucket / (self.gamma + 1)
@@ -0,0 +1,211 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import historical_data_analysis as hda
+import project_helpers as hp
+
+from .array_simulation import (
+    CONTRIBUTION_INTERVALS,
+    get_contribution_schedule,
+    get_iteration_results,
+)
+from .portfolio_simulation import (
+    MAX_CHUNK_VALUES,
+    estimate_return_parameters,
+    get_aligned_returns,
+    simulate_correlated_changes,
+)
+
+# portfolio level amounts of a scenario, split between the symbols by its allocation
+SCENARIO_AMOUNTS = ["initial_investment"] + [config_key for config_key, _ in CONTRIBUTION_INTERVALS.values()]
+SCENARIO_PARAMETERS = ["investment_time"] + SCENARIO_AMOUNTS + ["allocation"]
+SWEEP_METRICS = ["final_amount", "total_yield_amount", "total_yield_percent", "annual_return"]
+
+
+def sweep_portfolio(stock_configs: list, histories: dict, grid: dict, iterations=1000, rng=None) -> pd.DataFrame:
+    """Scenario sweep with the return parameters estimated from the aligned historical returns, like
+    `simulate_portfolio`.
+
+    Args:
+        stock_configs (list): Stock configurations of the portfolio
+        histories (dict): Cleaned monthly series per symbol
+        grid (dict): Values per scenario parameter, see `sweep_scenarios`
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+
+    Returns:
+        pd.DataFrame: One row of summary statistics per scenario
+    """
+    symbols = [stock_config["symbol"] for stock_config in stock_configs]
+    mean, cov = estimate_return_parameters(get_aligned_returns({symbol: histories[symbol] for symbol in symbols}))
+    return sweep_scenarios(stock_configs, mean, cov, grid, iterations, rng)
+
+
+def sweep_scenarios(stock_configs, mean, cov, grid: dict, iterations=1000, rng=None) -> pd.DataFrame:
+    """Evaluates every combination of the `grid` values against one shared set of return paths.
+
+    All scenarios see the same random paths (common random numbers), so differences between scenarios are not
+    swamped by sampling noise. The final amount is linear in the invested amounts, so every path is reduced to one
+    growth factor per symbol and contribution cadence, and all scenarios of an investment time are evaluated by a
+    single matrix product.
+
+    Supported grid keys are `investment_time`, `initial_investment`, the contribution amounts of the stock config
+    (`monthly_investment`, ...) and `allocation`. Amounts are portfolio totals which are split between the symbols
+    by the allocation weights (one weight per symbol, summing up to 1). Parameters missing from the grid default to
+    the sum of the stock configs, the longest investment time and the share of each symbol in the total input.
+
+    Args:
+        stock_configs (list | dict): Stock configuration(s) of the portfolio
+        mean (float | np.ndarray): Mean monthly return per symbol
+        cov (float | np.ndarray): Covariance matrix of the monthly returns (the variance for a single symbol)
+        grid (dict): Values per scenario parameter
+        iterations (int): Number of simulated paths
+        rng (np.random.Generator, optional): Random generator, defaults to the global `np.random` state
+
+    Returns:
+        pd.DataFrame: One row per scenario with its parameters, the input amount and the summary statistics
+    """
+    stock_configs = [stock_configs] if isinstance(stock_configs, dict) else stock_configs
+    mean = np.atleast_1d(np.asarray(mean, dtype=np.float64))
+    df_scenarios = get_scenarios(stock_configs, grid)
+
+    months = (df_scenarios["investment_time"] * 12).astype(int).to_numpy()
+    changes = simulate_correlated_changes(mean, cov, int(months.max()), iterations, rng)
+
+    df_summary = evaluate_scenarios(changes, df_scenarios)
+    if len(stock_configs) > 1:
+        allocation = pd.DataFrame(
+            df_scenarios["allocation"].tolist(),
+            columns=[f"allocation_{stock_config['symbol']}" for stock_config in stock_configs],
+        )
+        df_scenarios = pd.concat([df_scenarios.drop(columns="allocation"), allocation], axis=1)
+    else:
+        df_scenarios = df_scenarios.drop(columns="allocation")
+
+    return pd.concat([df_scenarios, df_summary], axis=1)
+
+
+def get_scenarios(stock_configs: list, grid: dict) -> pd.DataFrame:
+    check_regular_investments(stock_configs, "scenario sweep")
+    unknown = set(grid.keys()) - set(SCENARIO_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown scenario parameters {sorted(unknown)}, expected some of {SCENARIO_PARAMETERS}")
+
+    # defaults of all parameters missing from the grid
+    defaults = {"investment_time": max(stock_config["investment_time"] for stock_config in stock_configs)}
+    for amount in SCENARIO_AMOUNTS:
+        defaults[amount] = sum(stock_config.get(amount, 0) for stock_config in stock_configs)
+    symbol_input = np.array([get_input_amount(stock_config) for stock_config in stock_configs], dtype=np.float64)
+    if symbol_input.sum() > 0:
+        defaults["allocation"] = tuple(symbol_input / symbol_input.sum())
+    else:
+        defaults["allocation"] = tuple(np.full(len(stock_configs), 1 / len(stock_configs)))
+
+    values = {key: list(grid.get(key, [defaults[key]])) for key in SCENARIO_PARAMETERS}
+    for allocation in values["allocation"]:
+        if len(allocation) != len(stock_configs) or not np.isclose(sum(allocation), 1):
+            raise ValueError(f"Allocation {allocation} needs one weight per symbol, summing up to 1")
+    values["allocation"] = [tuple(float(weight) for weight in allocation) for allocation in values["allocation"]]
+
+    return pd.DataFrame(list(itertools.product(*values.values())), columns=list(values.keys()))
+
+
+def get_input_amount(stock_config: dict) -> float:
+    number_of_months = int(stock_config["investment_time"] * 12)
+    return float(get_contribution_schedule(stock_config, number_of_months)["input"][-1])
+
+
+def check_regular_investments(stock_configs: list, name: str):
+    # portfolio level amounts cannot express the cashflow events of a single stock config
+    for stock_config in stock_configs:
+        events = hda.get_cashflow_events(stock_config)
+        if events:
+            raise ValueError(
+                f"The {name} only supports regular investments, '{stock_config['symbol']}' has {sorted(events)}"
+            )
+
+
+def get_contribution_counts(number_of_months: int) -> dict:
+    # contributions are made in the months 1, 1 + interval, ... like in `get_contribution_schedule`
+    return {
+        config_key: len(range(1, number_of_months, interval))
+        for config_key, interval in CONTRIBUTION_INTERVALS.values()
+    }
+
+
+def evaluate_scenarios(changes: np.ndarray, df_scenarios: pd.DataFrame) -> pd.DataFrame:
+    changes = changes[:, :, None] if changes.ndim == 2 else changes
+    iterations = changes.shape[0]
+    months = (df_scenarios["investment_time"] * 12).astype(int).to_numpy()
+    amounts = df_scenarios[SCENARIO_AMOUNTS].to_numpy(dtype=np.float64)
+    allocation = np.array(df_scenarios["allocation"].tolist(), dtype=np.float64)
+
+    # value of 1 at the end of every month, invested at the start of the first month
+    growth = np.cumprod(changes, axis=1)
+
+    columns = {}
+    chunk_size = max(1, MAX_CHUNK_VALUES // (iterations * changes.shape[2]))
+    for number_of_months in np.unique(months):
+        scenarios = np.flatnonzero(months == number_of_months)
+        factors = get_growth_factors(growth, number_of_months)
+        contributions = get_contribution_counts(number_of_months)
+        input_amount = amounts @ np.array([1] + list(contributions.values()), dtype=np.float64)
+
+        for chunk in np.array_split(scenarios, range(chunk_size, len(scenarios), chunk_size)):
+            # (iterations x symbols * amounts) @ (symbols * amounts x scenarios)
+            weights = (allocation[chunk, :, None] * amounts[chunk, None, :]).reshape(len(chunk), -1)
+            final_amount = factors.reshape(iterations, -1) @ weights.T
+
+            if changes.shape[2] == 1:
+                # the monthly returns of a single symbol do not depend on the invested amounts
+                return_product = np.broadcast_to(
+                    (growth[:, number_of_months - 1, 0] / growth[:, 0, 0])[:, None], final_amount.shape
+                )
+            else:
+                return_product = get_combined_return_product(growth[:, :number_of_months], weights, amounts[chunk])
+
+            result = get_iteration_results(input_amount[chunk][None, :], final_amount, return_product, number_of_months)
+            for metric in SWEEP_METRICS:
+                for stat, values in hp.summarize_columns(result[metric]).items():
+                    columns.setdefault(f"{metric}_{stat}", np.full(len(months), np.nan))[chunk] = values
+        columns.setdefault("input_amount", np.full(len(months), np.nan))[scenarios] = input_amount[scenarios]
+
+    return pd.DataFrame(columns, columns=["input_amount"] + [col for col in columns.keys() if col != "input_amount"])
+
+
+def get_growth_factors(growth: np.ndarray, number_of_months: int) -> np.ndarray:
+    # final value of 1 invested once at the start (first column) or at every contribution of each cadence
+    final_growth = growth[:, number_of_months - 1, :]
+    previous_growth = np.concatenate([np.ones_like(growth[:, :1, :]), growth[:, : number_of_months - 1, :]], axis=1)
+
+    factors = [final_growth]
+    for _, interval in CONTRIBUTION_INTERVALS.values():
+        factors.append(final_growth * (1 / previous_growth[:, 1:number_of_months:interval, :]).sum(axis=1))
+
+    return np.stack(factors, axis=2)
+
+
+def get_combined_return_product(growth: np.ndarray, weights: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    # time weighted return of the combined portfolio, same recurrence as `calculate_portfolio_outcome`. The
+    # portfolio value is linear in the amounts, so it is tracked as units of 1 per symbol and amount (iterations x
+    # symbols x amounts) which are valued for all scenarios at once.
+    iterations, number_of_months, number_of_symbols = growth.shape
+    flow = np.zeros((number_of_months, amounts.shape[0]))
+    for i, (_, interval) in enumerate(CONTRIBUTION_INTERVALS.values()):
+        flow[1::interval] += amounts[:, i + 1]
+
+    units = np.zeros((iterations, number_of_symbols, len(SCENARIO_AMOUNTS)))
+    units[:, :, 0] = 1
+    total = (growth[:, 0, :, None] * units).reshape(iterations, -1) @ weights.T
+    return_product = np.ones_like(total)
+    for month in range(1, number_of_months):
+        for i, (_, interval) in enumerate(CONTRIBUTION_INTERVALS.values()):
+            if (month - 1) % interval == 0:
+                units[:, :, i + 1] += 1 / growth[:, month - 1, :]
+        previous_total = total + flow[month]
+        total = (growth[:, month, :, None] * units).reshape(iterations, -1) @ weights.T
+        return_product *= total / previous_total
+
+    return return_product
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+import simulation
+from simulation import simulate_outcome
+
+STOCK_CONFIG = {
+    "symbol": "URTH",
+    "investment_time": 2,
+    "initial_investment": 1000,
+    "monthly_investment": 100,
+    "quarter_investment": 50,
+    "bi_annual_investment": 20,
+    "annual_investment": 200,
+    "dividend_reinvestment": True,
+}
+
+
+@pytest.mark.parametrize(
+    "stock_config",
+    [
+        STOCK_CONFIG,
+        {
+            **STOCK_CONFIG,
+            "contribution_growth": 0.05,
+            "lump_sums": [{"month": 5, "amount": 2000}, {"month": 18, "amount": -500}],
+            "pauses": [{"start": 8, "end": 11}],
+        },
+    ],
+)
+def test_array_engine_matches_dataframe_engine(stock_config):
+    np.random.seed(42)
+    reference = simulate_outcome(stock_config, 0.007, 0.04, iterations=20, engine="dataframe")
+    np.random.seed(42)
+    summary = simulate_outcome(stock_config, 0.007, 0.04, iterations=20, engine="array")
+
+    assert list(summary.keys()) == list(reference.keys())
+    for col, stats in reference.items():
+        assert list(summary[col].keys()) == list(stats.keys())
+        for stat, value in stats.items():
+            assert summary[col][stat] == pytest.approx(value, rel=1e-9, abs=1e-9), (col, stat)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        simulate_outcome(STOCK_CONFIG, 0.007, 0.04, engine="unknown")
+
+
+def test_drawdown_tracker():
+    drawdown = simulation.DrawdownTracker(2)
+    for monthly_return in [[1.1, 0.9], [0.5, 1.0], [1.5, 1.0], [1.2, 1.2], [0.9, 1.0]]:
+        drawdown.update(np.array(monthly_return))
+
+    # value path 1.1, 0.55, 0.825, 0.99, 0.891 and 0.9, 0.9, 0.9, 1.08, 1.08
+    np.testing.assert_allclose(drawdown.max_drawdown, [0.5, 0.1])
+    np.testing.assert_array_equal(drawdown.time_under_water, [4, 3])
+
+
+def test_risk_summary():
+    total_yield_amount = np.arange(-50, 150, dtype=np.float64)
+    risk = simulation.get_risk_summary(total_yield_amount, [0.9, 0.975])
+
+    assert risk["loss_probability"] == 0.25
+    assert risk["value_at_risk_90"] == pytest.approx(-np.quantile(total_yield_amount, 0.1))
+    assert risk["conditional_value_at_risk_90"] == pytest.approx(-total_yield_amount[:20].mean())
+    assert set(risk.keys()) == {
+        "loss_probability",
+        "value_at_risk_90",
+        "conditional_value_at_risk_90",
+        "value_at_risk_97.5",
+        "conditional_value_at_risk_97.5",
+    }
+
+
+def test_risk_metrics_in_simulation_result():
+    summary = simulate_outcome(STOCK_CONFIG, -0.01, 0.05, iterations=500, seed=3)
+
+    assert 0 < summary["risk"]["loss_probability"] <= 1
+    assert summary["risk"]["conditional_value_at_risk_99"] >= summary["risk"]["value_at_risk_99"]
+    assert summary["risk"]["value_at_risk_99"] >= summary["risk"]["value_at_risk_95"]
+    assert 0 <= summary["max_drawdown"]["min"] <= summary["max_drawdown"]["max"] <= 100
+    assert summary["time_under_water"]["max"] <= STOCK_CONFIG["investment_time"] * 12 - 1
+
+
+def test_fan_chart_bands():
+    assert simulation.get_fan_months(24).tolist() == [0, 11, 23]
+    assert simulation.get_fan_months(30).tolist() == [0, 5, 17, 29]
+    assert simulation.get_fan_months(1).tolist() == [0]
+
+    summary = simulate_outcome(STOCK_CONFIG, 0.007, 0.04, iterations=2000, seed=3)
+    fan = summary["fan"]
+    assert fan["months"] == [0, 11, 23]
+    assert fan["input"] == [1000, 1000 + 11 * 100 + 4 * 50 + 2 * 20 + 200, 1000 + 23 * 100 + 8 * 50 + 4 * 20 + 400]
+    bands = np.array([fan[name] for name in simulation.FAN_QUANTILES.keys()])
+    assert (np.diff(bands, axis=0) >= 0).all()
+    # the last point of the fan is the distribution of the final amount
+    assert fan["quantile_50"][-1] == pytest.approx(summary["final_amount"]["quantile_50"])
+
+
+def test_fan_tracker_keeps_fan_months():
+    fan = simulation.FanTracker(24, (3, 2))
+    for month in range(24):
+        fan.update(month, np.full((3, 2), month))
+    assert fan.total.shape == (3, 3, 2)
+    np.testing.assert_array_equal(fan.total[0, :, 1], [0, 11, 23])
+
+
+@pytest.mark.parametrize("engine", ["array", "streaming", "parallel", "dataframe"])
+def test_withdrawals_are_limited_to_the_total(engine):
+    stock_config = {
+        "symbol": "URTH",
+        "investment_time": 5,
+        "initial_investment": 1000,
+        "monthly_investment": 100,
+        "lump_sums": [{"month": 12, "amount": -5000}],
+    }
+    np.random.seed(7)
+    summary = simulate_outcome(stock_config, 0.005, 0.04, iterations=50, engine=engine, seed=7, workers=1)
+
+    # the withdrawal empties every path, the rest of it is the shortfall and stays part of the input
+    assert summary["final_amount"]["min"] >= 0
+    assert summary["withdrawal_shortfall"]["min"] > 0
+    schedule = simulation.get_contribution_schedule(stock_config, 60)
+    shortfall = summary["withdrawal_shortfall"]["mean"]
+    assert summary["input_amount"]["mean"] == pytest.approx(schedule["input"][-1] + shortfall)
+    # the time weighted return is the return of the months with money
+    assert summary["annual_return"]["mean"] == pytest.approx(100 * (1.005**12 - 1), abs=3)
+
+    assert "withdrawal_shortfall" not in simulate_outcome(STOCK_CONFIG, 0.005, 0.04, iterations=10, engine=engine)
+
+
+def test_dataframe_engine_tracks_drawdown_in_the_monthly_loop():
+    np.random.seed(3)
+    df_dict_simulated = simulation.simulate_data(STOCK_CONFIG, 0.0, 0.05, 24, 10)
+    df_dict_calc = simulation.calculate_outcome(df_dict_simulated, 24, 10)
+
+    reference = simulation.DrawdownTracker(10)
+    for month in range(1, 24):
+        reference.update(df_dict_calc["df_return"].loc[:, month].to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(df_dict_calc["drawdown"].max_drawdown, reference.max_drawdown)
+    np.testing.assert_array_equal(df_dict_calc["drawdown"].time_under_water, reference.time_under_water)
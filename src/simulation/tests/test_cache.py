@@ -0,0 +1,130 @@
+import os
+import time
+from datetime import timedelta
+
+from simulation import SimulationCache, get_simulation_key
+
+STOCK_CONFIG = {"symbol": "URTH", "initial_investment": 1000, "monthly_investment": 100, "investment_time": 5}
+MODEL = {"returns": "normal", "engine": "array"}
+
+
+def get_key(**kwargs):
+    params = {
+        "stock_config": STOCK_CONFIG,
+        "monthly_mean": 0.01,
+        "monthly_std": 0.04,
+        "iterations": 100,
+        "model": MODEL,
+        "seed": 1,
+    }
+    params.update(kwargs)
+    return get_simulation_key(**params)
+
+
+def test_key_depends_on_every_parameter():
+    changed = [
+        get_key(stock_config={**STOCK_CONFIG, "monthly_investment": 200}),
+        get_key(monthly_mean=0.011),
+        get_key(monthly_std=0.05),
+        get_key(iterations=200),
+        get_key(model={**MODEL, "engine": "streaming"}),
+        get_key(seed=2),
+    ]
+    assert get_key() == get_key()
+    assert len(set(changed + [get_key()])) == len(changed) + 1
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = SimulationCache(str(tmp_path))
+    key = get_key()
+    assert cache.get(key) is None
+
+    cache.put(key, {"final_amount": {"mean": 1.0}})
+    assert cache.get(key) == {"final_amount": {"mean": 1.0}}
+    assert cache.stats["memory_hits"] == 1
+
+    # a new session only has the disk tier
+    other_cache = SimulationCache(str(tmp_path))
+    assert other_cache.get(key) == {"final_amount": {"mean": 1.0}}
+    assert other_cache.stats["disk_hits"] == 1
+    assert other_cache.get(key) is not None
+    assert other_cache.stats["memory_hits"] == 1
+    assert cache.hit_rate == 0.5
+
+
+def test_get_or_compute(tmp_path):
+    cache = SimulationCache(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"value": len(calls)}
+
+    assert cache.get_or_compute(get_key(), compute) == {"value": 1}
+    assert cache.get_or_compute(get_key(), compute) == {"value": 1}
+    assert len(calls) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SimulationCache(str(tmp_path), max_entries=2)
+    keys = [get_key(iterations=i) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, {"value": i})
+        os.utime(cache.get_path(key), (time.time() - 100 + i, time.time() - 100 + i))
+
+    # the first entry is used again, so the second one is the least recently used
+    cache.memory.clear()
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], {"value": 2})
+
+    assert os.path.exists(cache.get_path(keys[0]))
+    assert not os.path.exists(cache.get_path(keys[1]))
+    assert os.path.exists(cache.get_path(keys[2]))
+    assert cache.stats["evictions"] == 1
+
+
+def test_memory_hits_mark_the_file_as_used(tmp_path):
+    cache = SimulationCache(str(tmp_path), max_entries=2)
+    keys = [get_key(iterations=i) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, {"value": i})
+        os.utime(cache.get_path(key), (time.time() - 100 + i, time.time() - 100 + i))
+
+    # served from the in-process tier without touching the file, the last use is written before the eviction
+    old_mtime = os.path.getmtime(cache.get_path(keys[0]))
+    assert cache.get(keys[0]) is not None
+    assert cache.stats["memory_hits"] == 1
+    assert os.path.getmtime(cache.get_path(keys[0])) == old_mtime
+    cache.put(keys[2], {"value": 2})
+
+    assert os.path.exists(cache.get_path(keys[0]))
+    assert not os.path.exists(cache.get_path(keys[1]))
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    cache = SimulationCache(str(tmp_path), max_age=timedelta(days=1))
+    key = get_key()
+    cache.put(key, {"value": 1})
+    two_days_ago = time.time() - 2 * 24 * 3600
+    os.utime(cache.get_path(key), (two_days_ago, two_days_ago))
+
+    assert SimulationCache(str(tmp_path), max_age=timedelta(days=1)).get(key) is None
+
+
+def test_expired_and_evicted_entries_leave_the_memory(tmp_path):
+    cache = SimulationCache(str(tmp_path), max_age=timedelta(days=1))
+    keys = [get_key(iterations=i) for i in range(3)]
+    for key in keys[:2]:
+        cache.put(key, {"value": 1})
+
+    # unused for two days in a long session, the file is expired as well
+    two_days_ago = time.time() - 2 * 24 * 3600
+    cache.last_used[keys[0]] = two_days_ago
+    os.utime(cache.get_path(keys[0]), (two_days_ago, two_days_ago))
+    assert cache.get(keys[0]) is None
+    assert keys[0] not in cache.memory
+
+    # another process sharing the directory evicts a result, the next eviction drops it from the memory
+    os.remove(cache.get_path(keys[1]))
+    cache.put(keys[2], {"value": 2})
+    assert cache.get(keys[1]) is None
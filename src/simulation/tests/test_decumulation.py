@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import simulation
+
+STOCK_CONFIG = {"symbol": "AAA", "investment_time": 10, "initial_investment": 10_000, "monthly_investment": 200}
+
+
+def get_outcome(changes: np.ndarray, withdrawal: dict = None) -> dict:
+    flow = simulation.get_contribution_schedule(STOCK_CONFIG, 120)["flow"]
+    return simulation.calculate_decumulation_outcome(changes, flow, simulation.get_withdrawal(withdrawal))
+
+
+def test_accumulation_matches_array_engine():
+    changes = simulation.simulate_changes(0.006, 0.04, 120 + 360, 300, np.random.default_rng(0))
+    outcome = get_outcome(changes)
+
+    schedule = simulation.get_contribution_schedule(STOCK_CONFIG, 120)
+    drawdown = simulation.DrawdownTracker(300)
+    total, returns = simulation.calculate_outcome_array(changes[:, :120], schedule["flow"], drawdown)
+    np.testing.assert_allclose(outcome["retirement_amount"], total[:, -1])
+    np.testing.assert_allclose(outcome["return_product"], np.prod(returns[:, 1:], axis=1))
+    np.testing.assert_allclose(outcome["max_drawdown"], drawdown.max_drawdown)
+    np.testing.assert_allclose(outcome["fan_total"][:, 0], total[:, 0])
+
+
+def test_fixed_withdrawals_without_returns():
+    # 5% a year lasts 20 years without any growth, 1/30 a year exactly lasts the 30 years of withdrawals
+    changes = np.ones((2, 120 + 360))
+    outcome = get_outcome(changes, {"rule": "fixed", "rate": 0.05})
+    retirement_amount = 10_000 + 200 * 119
+    np.testing.assert_allclose(outcome["retirement_amount"], retirement_amount)
+    np.testing.assert_array_equal(outcome["depletion_month"], 240)
+    np.testing.assert_allclose(outcome["total_withdrawn"], retirement_amount)
+    np.testing.assert_allclose(outcome["sustainable_rate"], 1 / 30)
+
+    # a fixed amount of 3000 a year grows with 10% inflation: 3000, 3300, 3630 ... are covered for 9 years
+    outcome = get_outcome(changes, {"rule": "fixed", "amount": 3000, "inflation": 0.1})
+    assert outcome["depletion_month"][0] // 12 == 7
+
+
+def test_sustainable_rate_matches_simulated_depletion():
+    changes = simulation.simulate_changes(0.004, 0.045, 120 + 360, 1000, np.random.default_rng(1))
+    sustainable_rate = get_outcome(changes)["sustainable_rate"]
+    rate = simulation.get_sustainable_value(sustainable_rate, 0.9)
+
+    # a slightly lower rate is sustained by 90% of the paths, a slightly higher rate depletes more than 10% of them
+    depleted = get_outcome(changes, {"rate": rate * 0.999})["depletion_month"] >= 0
+    assert depleted.mean() <= 0.1
+    depleted = get_outcome(changes, {"rate": rate * 1.001})["depletion_month"] >= 0
+    assert depleted.mean() > 0.1
+
+
+def test_withdrawal_rules():
+    changes = simulation.simulate_changes(0.004, 0.045, 120 + 360, 500, np.random.default_rng(2))
+    fixed = get_outcome(changes, {"rule": "fixed", "rate": 0.06})
+    percentage = get_outcome(changes, {"rule": "percentage", "rate": 0.06})
+    guardrails = get_outcome(changes, {"rule": "guardrails", "rate": 0.06})
+
+    # a share of the current wealth never depletes, the guardrails cut the withdrawals of falling paths
+    assert (percentage["depletion_month"] < 0).all()
+    assert (guardrails["depletion_month"] >= 0).mean() < (fixed["depletion_month"] >= 0).mean()
+    np.testing.assert_allclose(fixed["retirement_amount"], guardrails["retirement_amount"])
+
+
+def test_simulate_decumulation():
+    summary = simulation.simulate_decumulation(
+        STOCK_CONFIG, 0.005, 0.04, {"rule": "fixed", "rate": 0.05, "years": 25}, 400, np.random.default_rng(3)
+    )
+
+    assert summary["accumulation"]["input_amount"]["mean"] == 10_000 + 200 * 119
+    decumulation = summary["decumulation"]
+    assert 0 < decumulation["depletion_probability"] < 1
+    assert 0 < decumulation["years_until_depletion_of_depleted_paths"]["quantile_50"] < 25
+    sustainable_rate = decumulation["sustainable_withdrawal_rate_fixed_rule"]
+    assert sustainable_rate["95"] < sustainable_rate["90"]
+    assert summary["fan"]["months"][-1] == 12 * 35 - 1
+    assert summary["fan"]["input"][-1] == summary["accumulation"]["input_amount"]["mean"]
+
+
+def test_median_years_until_depletion_covers_all_paths():
+    schedule = simulation.get_contribution_schedule(STOCK_CONFIG, 120)
+    changes = np.ones((4, 120 + 360))
+    outcome = simulation.calculate_decumulation_outcome(changes, schedule["flow"], simulation.get_withdrawal())
+
+    # three of four paths are depleted after 10, 20 and 30 years, the median path after 25 years
+    outcome["depletion_month"] = np.array([120, 240, 360, -1])
+    summary = simulation.summarize_decumulation_outcome(schedule, outcome, {})["decumulation"]
+    assert summary["median_years_until_depletion"] == 25
+    assert summary["years_until_depletion_of_depleted_paths"]["quantile_50"] == 20
+
+    # the median path of only two depleted paths lasts beyond the horizon
+    outcome["depletion_month"] = np.array([120, 240, -1, -1])
+    summary = simulation.summarize_decumulation_outcome(schedule, outcome, {})["decumulation"]
+    assert summary["median_years_until_depletion"] is None
+
+
+@pytest.mark.parametrize(
+    "withdrawal",
+    [{"rule": "annuity"}, {"years": 0}, {"rule": "percentage", "amount": 1000}, {"adjustment": 1.5}],
+)
+def test_invalid_withdrawal(withdrawal):
+    with pytest.raises(ValueError):
+        simulation.get_withdrawal(withdrawal)
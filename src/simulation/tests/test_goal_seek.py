@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+import simulation
+
+STOCK_CONFIG = {
+    "symbol": "AAA",
+    "investment_time": 10,
+    "initial_investment": 1000,
+    "monthly_investment": 50,
+    "quarter_investment": 25,
+    "bi_annual_investment": 0,
+    "annual_investment": 200,
+}
+
+
+def get_final_amount(changes: np.ndarray, stock_config: dict) -> np.ndarray:
+    # reference final amounts of the array engine
+    number_of_months = int(stock_config["investment_time"] * 12)
+    schedule = simulation.get_contribution_schedule(stock_config, number_of_months)
+    total, _ = simulation.calculate_outcome_array(changes[:, :number_of_months], schedule["flow"])
+    return total[:, -1]
+
+
+@pytest.mark.parametrize("solve_for", ["initial_investment", "monthly_investment"])
+def test_solved_amount_reaches_the_target(solve_for):
+    changes = simulation.simulate_changes(0.006, 0.04, 120, 400, np.random.default_rng(0))
+    scenario = simulation.get_scenarios([STOCK_CONFIG], {}).iloc[0].to_dict()
+    goal = simulation.solve_goal(changes, scenario, 60_000, solve_for, [0.75, 0.9])
+
+    assert goal["current_confidence"] == (get_final_amount(changes, STOCK_CONFIG) >= 60_000).mean()
+    assert goal["solutions"]["90"]["value"] > goal["solutions"]["75"]["value"]
+    for level, solution in goal["solutions"].items():
+        # the final amounts of the solved config re-simulated on the same paths
+        final_amount = get_final_amount(changes, {**STOCK_CONFIG, solve_for: solution["value"]})
+        np.testing.assert_allclose(solution["final_amount"]["mean"], final_amount.mean())
+        assert solution["achieved_confidence"] == (final_amount >= 60_000).mean() >= solution["confidence"]
+
+        # one cent less misses the confidence level
+        final_amount = get_final_amount(changes, {**STOCK_CONFIG, solve_for: solution["value"] - 0.01})
+        assert (final_amount >= 60_000).mean() < solution["confidence"]
+
+        input_amount = simulation.get_input_amount({**STOCK_CONFIG, solve_for: solution["value"]})
+        assert solution["input_amount"] == pytest.approx(input_amount)
+
+
+def test_solved_investment_time():
+    changes = simulation.simulate_changes(0.006, 0.04, 600, 400, np.random.default_rng(1))
+    scenario = simulation.get_scenarios([STOCK_CONFIG], {}).iloc[0].to_dict()
+    goal = simulation.solve_goal(changes, scenario, 60_000, "investment_time", [0.5, 0.9, 0.999])
+
+    assert goal["solutions"]["50"]["investment_time"] < goal["solutions"]["90"]["investment_time"]
+    for level in ["50", "90"]:
+        solution = goal["solutions"][level]
+        final_amount = get_final_amount(changes, {**STOCK_CONFIG, "investment_time": solution["value"]})
+        assert solution["achieved_confidence"] == (final_amount >= 60_000).mean() >= solution["confidence"]
+        shorter = get_final_amount(changes, {**STOCK_CONFIG, "investment_time": solution["value"] - 1 / 12})
+        assert (shorter >= 60_000).mean() < solution["confidence"]
+
+    # the target is already reached, or not within the simulated 50 years
+    assert simulation.solve_goal(changes, scenario, 0, "investment_time")["solutions"]["90"]["value"] == 1 / 12
+    assert simulation.solve_goal(changes, scenario, 1e12, "investment_time")["solutions"]["90"]["value"] is None
+
+
+def test_portfolio_goal_seek():
+    stock_configs = [
+        {"symbol": "AAA", "investment_time": 10, "initial_investment": 700, "monthly_investment": 70},
+        {"symbol": "BBB", "investment_time": 10, "initial_investment": 300, "monthly_investment": 30},
+    ]
+    cov = np.array([[0.0016, 0.0008], [0.0008, 0.0025]])
+    mean = np.array([0.006, 0.004])
+    goal = simulation.goal_seek(
+        stock_configs, mean, cov, 50_000, "monthly_investment", [0.9], 300, np.random.default_rng(2)
+    )
+    assert goal["scenario"]["allocation"] == pytest.approx([0.7, 0.3])
+
+    # the solved monthly total split 70 / 30 reaches the target on 90% of the same paths
+    monthly_investment = goal["solutions"]["90"]["value"]
+    solved = [
+        {**stock_config, "monthly_investment": monthly_investment * weight}
+        for stock_config, weight in zip(stock_configs, [0.7, 0.3])
+    ]
+    changes = simulation.simulate_correlated_changes(mean, cov, 120, 300, np.random.default_rng(2))
+    outcome = simulation.calculate_portfolio_outcome(changes, simulation.get_flow_matrix(solved, 120))
+    assert (outcome["combined_final_amount"] >= 50_000).mean() == goal["solutions"]["90"]["achieved_confidence"] >= 0.9
+
+
+def test_invalid_goal():
+    changes = np.ones((10, 12))
+    scenario = simulation.get_scenarios([STOCK_CONFIG], {}).iloc[0].to_dict()
+    with pytest.raises(ValueError):
+        simulation.solve_goal(changes, scenario, 1000, "dividend_reinvestment")
+    with pytest.raises(ValueError):
+        simulation.solve_goal(changes, scenario, 1000, "monthly_investment", [90])
+    with pytest.raises(ValueError):
+        simulation.solve_goal(changes, scenario, 1000, "monthly_investment")
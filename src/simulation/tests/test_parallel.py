@@ -0,0 +1,50 @@
+import numpy as np
+
+import project_helpers as hp
+import simulation
+
+STOCK_CONFIG = {
+    "symbol": "EEM",
+    "investment_time": 5,
+    "initial_investment": 1000,
+    "monthly_investment": 50,
+    "quarter_investment": 0,
+    "bi_annual_investment": 0,
+    "annual_investment": 0,
+}
+
+
+def test_results_independent_of_worker_count():
+    summaries = [
+        simulation.simulate_outcome_parallel(STOCK_CONFIG, 0.005, 0.05, 2500, seed=123, workers=workers, chunk_size=300)
+        for workers in [1, 2, 3]
+    ]
+
+    assert summaries[0] == summaries[1] == summaries[2]
+
+
+def test_worker_pool_is_traced_as_one_span():
+    with hp.tracing(memory=False) as tracer:
+        simulation.simulate_outcome_parallel(STOCK_CONFIG, 0.005, 0.05, 600, seed=1, workers=2, chunk_size=300)
+
+    pool_spans = [record for record in tracer.spans if record["name"] == "simulation_pool"]
+    assert len(pool_spans) == 1
+    assert pool_spans[0]["labels"] == {"workers": 2, "chunks": 2}
+    assert pool_spans[0]["wall_time"] > 0
+
+
+def test_seed_controls_results():
+    first = simulation.simulate_outcome(STOCK_CONFIG, 0.005, 0.05, 500, engine="parallel", seed=1, workers=1)
+    second = simulation.simulate_outcome(STOCK_CONFIG, 0.005, 0.05, 500, engine="parallel", seed=1, workers=1)
+    other = simulation.simulate_outcome(STOCK_CONFIG, 0.005, 0.05, 500, engine="parallel", seed=2, workers=1)
+
+    assert first == second
+    assert first != other
+
+
+def test_seeded_array_engine_is_reproducible():
+    seed_sequence = np.random.SeedSequence(5)
+    first = simulation.simulate_outcome(STOCK_CONFIG, 0.005, 0.05, 200, seed=seed_sequence)
+    second = simulation.simulate_outcome(STOCK_CONFIG, 0.005, 0.05, 200, seed=5)
+
+    assert first == second
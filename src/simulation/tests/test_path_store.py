@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import simulation
+
+STOCK_CONFIG = {
+    "symbol": "URTH",
+    "investment_time": 5,
+    "initial_investment": 1000,
+    "monthly_investment": 100,
+    "annual_investment": 500,
+}
+
+
+def test_float64_paths_reproduce_array_engine(tmp_path):
+    reference = simulation.simulate_outcome_array(STOCK_CONFIG, 0.006, 0.045, 3000, np.random.default_rng(7))
+    paths = simulation.simulate_paths(
+        STOCK_CONFIG, 0.006, 0.045, 3000, str(tmp_path), np.random.default_rng(7), dtype="float64", chunk_size=700
+    )
+
+    # memory mapped without copies
+    assert isinstance(paths.total, np.memmap) and not paths.total.flags.writeable
+    assert paths.total.shape == paths.returns.shape == (3000, 60)
+    assert np.isnan(paths.returns[:, 0]).all()
+    assert json.dumps(paths.summary(chunk_size=400)) == json.dumps(reference)
+
+
+def test_float32_paths_and_reload(tmp_path):
+    path_dir = str(tmp_path / "paths")
+    simulation.simulate_paths(STOCK_CONFIG, 0.006, 0.045, 1000, path_dir, np.random.default_rng(8))
+
+    paths = simulation.SimulationPaths(path_dir)
+    assert paths.total.dtype == np.float32
+    assert paths.meta["stock_config"] == STOCK_CONFIG and paths.meta["iterations"] == 1000
+    # .npy header and 4 bytes per value
+    assert os.path.getsize(os.path.join(path_dir, "total.npy")) < 1000 * 60 * 4 + 200
+
+    # statistics of the stored paths without re-simulating
+    chunks = list(paths.iter_chunks(chunk_size=300))
+    assert [len(total) for _, total in chunks] == [300, 300, 300, 100]
+    np.testing.assert_array_equal(np.concatenate([total for _, total in chunks]), paths.total)
+
+    reference = simulation.simulate_outcome_array(STOCK_CONFIG, 0.006, 0.045, 1000, np.random.default_rng(8))
+    summary = paths.summary()
+    for col in ["final_amount", "annual_return", "max_drawdown"]:
+        for stat, value in reference[col].items():
+            assert summary[col][stat] == pytest.approx(value, rel=1e-4, abs=1e-4), (col, stat)
+
+
+def test_incomplete_paths_are_not_loaded(tmp_path):
+    simulation.simulate_paths(STOCK_CONFIG, 0.006, 0.045, 10, str(tmp_path), np.random.default_rng(9))
+    os.remove(tmp_path / "meta.json")
+    with pytest.raises(FileNotFoundError):
+        simulation.SimulationPaths(str(tmp_path))
+    with pytest.raises(ValueError):
+        simulation.simulate_paths(STOCK_CONFIG, 0.006, 0.045, 10, str(tmp_path), dtype="float16")
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import simulation
+
+
+def get_history(returns: np.ndarray, start: str = "2005-01-31") -> pd.DataFrame:
+    close = 100 * np.cumprod(np.concatenate([[1], 1 + returns]))
+    return pd.DataFrame({"date": pd.date_range(start, periods=len(close), freq="ME"), "close": close})
+
+
+def get_stock_config(symbol: str, investment_time: int = 10, initial_investment: int = 1000) -> dict:
+    return {
+        "symbol": symbol,
+        "investment_time": investment_time,
+        "initial_investment": initial_investment,
+        "monthly_investment": 50,
+        "quarter_investment": 0,
+        "bi_annual_investment": 100,
+        "annual_investment": 0,
+    }
+
+
+@pytest.fixture
+def histories() -> dict:
+    rng = np.random.default_rng(1)
+    market = rng.normal(0.006, 0.04, 240)
+    return {
+        "AAA": get_history(market + rng.normal(0.0, 0.01, 240)),
+        "BBB": get_history(0.8 * market + rng.normal(0.002, 0.03, 240)),
+        # shorter history, only the common months are used for the estimation
+        "CCC": get_history(rng.normal(0.004, 0.05, 120), start="2015-01-31"),
+    }
+
+
+def test_aligned_returns(histories):
+    returns = simulation.get_aligned_returns(histories)
+
+    assert list(returns.columns) == ["AAA", "BBB", "CCC"]
+    assert len(returns) == 120
+    assert not returns.isna().any().any()
+
+
+def test_correlated_changes_follow_covariance():
+    mean = np.array([0.01, 0.0, -0.005])
+    cov = np.array([[0.0016, 0.0012, 0.0], [0.0012, 0.0025, -0.0005], [0.0, -0.0005, 0.0009]])
+    changes = simulation.simulate_correlated_changes(mean, cov, 10, 20_000, np.random.default_rng(0))
+
+    samples = changes.reshape(-1, 3) - 1
+    np.testing.assert_allclose(samples.mean(axis=0), mean, atol=2e-4)
+    np.testing.assert_allclose(np.cov(samples, rowvar=False), cov, atol=5e-5)
+
+
+def test_single_symbol_matches_array_engine(histories):
+    stock_config = get_stock_config("AAA")
+    summary = simulation.simulate_portfolio([stock_config], histories, 500, np.random.default_rng(3))
+
+    returns = histories["AAA"]["close"].pct_change()
+    reference = simulation.simulate_outcome_array(
+        stock_config, returns.mean(), returns.std(), 500, np.random.default_rng(3)
+    )
+    for name in ["AAA", "combined"]:
+        for col, stats in reference.items():
+            for stat, value in stats.items():
+                assert summary[name][col][stat] == pytest.approx(value, rel=1e-9, abs=1e-9), (name, col, stat)
+
+
+def test_combined_result_from_same_paths(histories):
+    stock_configs = [get_stock_config("AAA", 10, 700), get_stock_config("BBB", 10, 300), get_stock_config("CCC", 5)]
+    summary = simulation.simulate_portfolio(stock_configs, histories, 2000, np.random.default_rng(4))
+
+    assert list(summary.keys()) == ["AAA", "BBB", "CCC", "combined"]
+    # the combined final amount is the per path sum of the symbols
+    assert summary["combined"]["final_amount"]["mean"] == pytest.approx(
+        sum(summary[symbol]["final_amount"]["mean"] for symbol in ["AAA", "BBB", "CCC"])
+    )
+    assert summary["combined"]["input_amount"]["mean"] == pytest.approx(
+        sum(summary[symbol]["input_amount"]["mean"] for symbol in ["AAA", "BBB", "CCC"])
+    )
+    # the shorter investment only starts in the second half of the simulation
+    assert summary["CCC"]["input_amount"]["mean"] == 1000 + 59 * 50 + 10 * 100
+    # fan charts of every symbol and the portfolio share the months of the longest investment
+    fan_months = [0] + list(range(11, 120, 12))
+    assert summary["combined"]["fan"]["months"] == summary["CCC"]["fan"]["months"] == fan_months
+    assert summary["CCC"]["fan"]["input"][:6] == [0] * 6
+    assert summary["combined"]["fan"]["input"][-1] == summary["combined"]["input_amount"]["mean"]
+
+
+def test_portfolio_withdrawals_are_limited_to_the_total():
+    stock_configs = [
+        {"symbol": "AAA", "investment_time": 2, "initial_investment": 1000, "monthly_investment": 100},
+        {
+            "symbol": "BBB",
+            "investment_time": 2,
+            "initial_investment": 1000,
+            "monthly_investment": 100,
+            "lump_sums": [{"month": 6, "amount": -10_000}],
+        },
+    ]
+    flow = simulation.get_flow_matrix(stock_configs, 24)
+    changes = simulation.simulate_correlated_changes(
+        np.array([0.005, 0.005]), np.diag([0.0016, 0.0016]), 24, 100, np.random.default_rng(0)
+    )
+    outcome = simulation.calculate_portfolio_outcome(changes, flow)
+    summary = simulation.summarize_portfolio_outcome(["AAA", "BBB"], flow, outcome, [24, 24])
+
+    assert outcome["final_amount"].min() >= 0
+    assert summary["AAA"]["withdrawal_shortfall"]["max"] == 0
+    assert summary["BBB"]["withdrawal_shortfall"]["min"] > 0
+    assert summary["combined"]["withdrawal_shortfall"] == summary["BBB"]["withdrawal_shortfall"]
+    assert summary["BBB"]["input_amount"]["min"] > 0
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import simulation
+
+WEIGHTS = [0.7, 0.3]
+
+
+def get_changes(iterations: int = 50, number_of_months: int = 60, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return simulation.simulate_correlated_changes(
+        np.array([0.008, 0.004]), np.array([[0.0025, 0.001], [0.001, 0.0016]]), number_of_months, iterations, rng
+    )
+
+
+def get_flow(number_of_months: int = 60) -> np.ndarray:
+    flow = np.full(number_of_months, 100.0)
+    flow[0] = 1000
+    return flow
+
+
+def get_history(returns: np.ndarray, dividend: float = 0.0) -> pd.DataFrame:
+    close = 100 * np.cumprod(1 + returns)
+    dates = pd.date_range("2010-01-31", periods=len(close), freq="ME")
+    dividends = np.where(np.arange(len(close)) % 3 == 2, dividend, 0.0)
+    return pd.DataFrame({"date": dates, "open": close / (1 + returns), "close": close, "dividend": dividends})
+
+
+def get_stock_config(symbol: str, initial_investment: float, monthly_investment: float) -> dict:
+    return {
+        "symbol": symbol,
+        "investment_time": 5,
+        "initial_investment": initial_investment,
+        "monthly_investment": monthly_investment,
+        "dividend_reinvestment": True,
+    }
+
+
+@pytest.mark.parametrize("policy", simulation.REBALANCING_POLICIES)
+def test_single_pass_trajectories(policy):
+    changes = get_changes()
+    flow = get_flow()
+    outcome = simulation.calculate_rebalanced_outcome(changes, flow, WEIGHTS, policy, band=0.02, keep_paths=True)
+
+    # per asset and combined values come from the same paths, trades only move money between the assets
+    np.testing.assert_allclose(outcome["final_amount"].sum(axis=1), outcome["combined_final_amount"])
+    np.testing.assert_allclose(outcome["input_amount"].sum(axis=1), flow.sum())
+    np.testing.assert_allclose(outcome["total_paths"][:, -1], outcome["final_amount"])
+    assert np.all(outcome["turnover"] >= -1e-9)
+
+    # every path is independent of the others in the batch
+    single = simulation.calculate_rebalanced_outcome(changes[3:4], flow, WEIGHTS, policy, band=0.02)
+    np.testing.assert_allclose(single["final_amount"][0], outcome["final_amount"][3])
+    np.testing.assert_array_equal(single["rebalances"][0], outcome["rebalances"][3])
+
+
+def test_calendar_rebalancing_restores_target_weights():
+    changes = np.ones((1, 36, 2))
+    changes[:, :, 0] = 1.05
+    flow = np.zeros(36)
+    flow[0] = 1000
+    outcome = simulation.calculate_rebalanced_outcome(changes, flow, WEIGHTS, "calendar", interval=12, keep_paths=True)
+
+    total = outcome["total_paths"][0]
+    for month in [12, 24]:
+        # the weights are reset at the start of the month, before the assets grow
+        expected = np.array(WEIGHTS) * [1.05, 1]
+        np.testing.assert_allclose(total[month] / total[month].sum(), expected / expected.sum())
+    assert outcome["rebalances"][0] == 2
+    assert outcome["turnover"][0] > 0
+
+
+def test_threshold_and_contribution_policies():
+    changes = get_changes()
+    flow = get_flow()
+    drift = simulation.calculate_rebalanced_outcome(changes, flow, WEIGHTS, "none")
+    wide_band = simulation.calculate_rebalanced_outcome(changes, flow, WEIGHTS, "threshold", band=1)
+    narrow_band = simulation.calculate_rebalanced_outcome(changes, flow, WEIGHTS, "threshold", band=0.01)
+    contributions = simulation.calculate_rebalanced_outcome(changes, flow, WEIGHTS, "contributions", keep_paths=True)
+
+    np.testing.assert_array_equal(wide_band["final_amount"], drift["final_amount"])
+    assert wide_band["rebalances"].sum() == 0 and drift["turnover"].max() == 0
+    assert narrow_band["rebalances"].min() > 0
+
+    # contributions pull the weights back to the targets without selling
+    np.testing.assert_allclose(contributions["turnover"], 0, atol=1e-9)
+    assert np.all(np.diff(contributions["input_paths"], axis=1) >= 0)
+    drift_weights = drift["final_amount"] / drift["final_amount"].sum(axis=1, keepdims=True)
+    contribution_weights = contributions["final_amount"] / contributions["final_amount"].sum(axis=1, keepdims=True)
+    assert np.abs(contribution_weights - WEIGHTS).mean() < np.abs(drift_weights - WEIGHTS).mean()
+
+
+def test_rebalancing_config():
+    stock_configs = [get_stock_config("AAA", 700, 70), get_stock_config("BBB", 300, 30)]
+
+    rebalancing = simulation.get_rebalancing(stock_configs, {"policy": "threshold"})
+    assert rebalancing["weights"] == pytest.approx({"AAA": 0.7, "BBB": 0.3})
+    assert rebalancing["band"] == 0.05
+
+    for invalid in [{"policy": "daily"}, {"weights": {"AAA": 0.5, "BBB": 0.3}}, {"weights": {"AAA": 1.0}}]:
+        with pytest.raises(ValueError):
+            simulation.get_rebalancing(stock_configs, invalid)
+
+
+def test_rebalanced_past_outcome():
+    rng = np.random.default_rng(2)
+    histories = {
+        "AAA": get_history(rng.normal(0.01, 0.04, 90), dividend=0.01),
+        "BBB": get_history(rng.normal(0.0, 0.02, 90)),
+    }
+    stock_configs = [get_stock_config("AAA", 700, 0), get_stock_config("BBB", 300, 0)]
+    outcome = simulation.rebalanced_past_outcome(stock_configs, histories, {"policy": "none"})
+
+    # without contributions and rebalancing the portfolio is bought and held over the last five years
+    data = outcome["data"]
+    assert len(data) == 60
+    growth = {
+        symbol: history["close"].iloc[-1] / history["open"].iloc[-60] * np.prod(1 + history["dividend"].iloc[-60:])
+        for symbol, history in histories.items()
+    }
+    assert data["total_AAA"].iloc[-1] == pytest.approx(700 * growth["AAA"])
+    assert data["total_BBB"].iloc[-1] == pytest.approx(300 * growth["BBB"])
+    assert outcome["summary"]["combined"]["final_amount"] == round(data["total_combined"].iloc[-1], 2)
+    assert outcome["summary"]["combined"]["total_dividends"] > 0
+    assert outcome["summary"]["combined"]["rebalances"] == 0
+
+    rebalanced = simulation.rebalanced_past_outcome(stock_configs, histories, {"policy": "calendar"})
+    assert rebalanced["summary"]["combined"]["rebalances"] == 4
+
+
+def test_simulate_rebalanced_portfolio():
+    rng = np.random.default_rng(3)
+    histories = {"AAA": get_history(rng.normal(0.01, 0.04, 90)), "BBB": get_history(rng.normal(0.0, 0.02, 90))}
+    stock_configs = [get_stock_config("AAA", 700, 70), get_stock_config("BBB", 300, 30)]
+
+    summary = simulation.simulate_rebalanced_portfolio(
+        stock_configs, histories, {"policy": "threshold"}, 200, np.random.default_rng(1)
+    )
+
+    assert set(summary.keys()) == {"AAA", "BBB", "combined"}
+    assert summary["combined"]["input_amount"]["mean"] == pytest.approx(1000 + 100 * 59)
+    assert summary["AAA"]["input_amount"]["mean"] + summary["BBB"]["input_amount"]["mean"] == pytest.approx(6900)
+    assert summary["combined"]["fan"]["months"][-1] == 59
+    assert summary["combined"]["rebalances"]["mean"] > 0
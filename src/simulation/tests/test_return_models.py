@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import simulation
+
+
+def test_bootstrap_draws_contiguous_blocks():
+    history = 1 + np.arange(60) / 1000
+    model = simulation.BlockBootstrap(history, block_size=6)
+    changes = model.simulate(40, 500, np.random.default_rng(0))
+
+    assert changes.shape == (500, 40)
+    months = np.round((changes - 1) * 1000).astype(int)
+    # within a block, the months follow each other (wrapping around the end of the history)
+    steps = (months[:, 1:] - months[:, :-1]) % 60
+    assert (steps[:, [i for i in range(39) if (i + 1) % 6 != 0]] == 1).all()
+    # every month of the history is drawn
+    assert set(np.unique(months)) == set(range(60))
+
+
+def test_bootstrap_keeps_cross_asset_alignment():
+    history = np.column_stack([1 + np.arange(30) / 1000, 1 - np.arange(30) / 1000, [np.nan] + [1.0] * 29])
+    model = simulation.BlockBootstrap(history, block_size=4)
+    changes = model.simulate(24, 200, np.random.default_rng(1))
+
+    assert changes.shape == (200, 24, 3)
+    # months with missing values are dropped, all symbols are drawn from the same month
+    np.testing.assert_allclose(changes[:, :, 0] - 1, 1 - changes[:, :, 1])
+    assert changes[:, :, 0].min() > 1
+
+
+def test_bootstrap_is_reproducible_and_uses_global_state():
+    model = simulation.BlockBootstrap(1 + np.random.default_rng(2).normal(0.005, 0.04, 100))
+    np.testing.assert_array_equal(
+        model.simulate(36, 10, np.random.default_rng(3)), model.simulate(36, 10, np.random.default_rng(3))
+    )
+
+    np.random.seed(4)
+    first = model.simulate(36, 10)
+    np.random.seed(4)
+    np.testing.assert_array_equal(first, model.simulate(36, 10))
+
+
+@pytest.mark.parametrize("engine", ["array", "streaming", "parallel"])
+def test_engines_with_constant_history(engine):
+    stock_config = {"symbol": "AAA", "investment_time": 2, "initial_investment": 1000, "monthly_investment": 100}
+    model = simulation.BlockBootstrap(np.full(50, 1.01), block_size=12)
+    summary = simulation.simulate_outcome(stock_config, 0, 0, 100, engine, seed=5, workers=1, return_model=model)
+
+    expected = 1000 * 1.01**24 + sum(100 * 1.01 ** (24 - month) for month in range(1, 24))
+    assert summary["final_amount"]["min"] == pytest.approx(expected)
+    assert summary["final_amount"]["max"] == pytest.approx(expected)
+    # the return of the first month is not part of the annual return
+    assert summary["annual_return"]["mean"] == pytest.approx(100 * (1.01 ** (23 / 2) - 1))
+
+
+def test_portfolio_bootstrap_from_histories():
+    dates = pd.date_range("2010-01-31", periods=61, freq="ME")
+    histories = {
+        "AAA": pd.DataFrame({"date": dates, "close": 100 * 1.01 ** np.arange(61)}),
+        "BBB": pd.DataFrame({"date": dates, "close": 100 * 1.02 ** np.arange(61)}),
+    }
+    model = simulation.BlockBootstrap.from_histories(histories)
+    stock_configs = [
+        {"symbol": symbol, "investment_time": 1, "initial_investment": 100, "monthly_investment": 0}
+        for symbol in histories.keys()
+    ]
+    summary = simulation.simulate_portfolio(stock_configs, histories, 20, np.random.default_rng(6), model)
+
+    assert summary["AAA"]["final_amount"]["mean"] == pytest.approx(100 * 1.01**12)
+    assert summary["BBB"]["final_amount"]["mean"] == pytest.approx(100 * 1.02**12)
+
+
+def get_garch_history(number_of_months: int, alpha: float, beta: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    variance = np.full(2, 0.0016)
+    omega = variance * (1 - alpha - beta)
+    returns = np.empty((number_of_months, 2))
+    for month in range(number_of_months):
+        # correlated innovations of two symbols
+        innovation = rng.standard_normal(2)
+        innovation[1] = 0.6 * innovation[0] + 0.8 * innovation[1]
+        returns[month] = np.sqrt(variance) * innovation
+        variance = omega + alpha * returns[month] ** 2 + beta * variance
+    return 1 + 0.005 + returns
+
+
+def get_regime_history(number_of_months: int, seed: int) -> tuple:
+    rng = np.random.default_rng(seed)
+    turbulent = np.zeros(number_of_months, dtype=bool)
+    for month in range(1, number_of_months):
+        switch = rng.random() < (0.1 if turbulent[month - 1] else 0.02)
+        turbulent[month] = turbulent[month - 1] != switch
+    returns = np.where(turbulent, rng.normal(-0.01, 0.08, number_of_months), rng.normal(0.01, 0.03, number_of_months))
+    return 1 + returns, turbulent
+
+
+@pytest.mark.parametrize("name", ["student_t", "garch", "regime"])
+def test_fitted_models_match_history(name):
+    history = get_garch_history(600, 0.1, 0.8, seed=7)
+    model = simulation.get_return_model(name, history)
+    changes = model.simulate(120, 4000, np.random.default_rng(8))
+
+    # mean, volatility and correlation of the history are kept
+    assert changes.shape == (4000, 120, 2)
+    np.testing.assert_allclose((changes - 1).mean(axis=(0, 1)), (history - 1).mean(axis=0), atol=0.0015)
+    np.testing.assert_allclose(changes.std(axis=(0, 1)), history.std(axis=0), rtol=0.1)
+    simulated_correlation = np.corrcoef(changes[:, :, 0].ravel(), changes[:, :, 1].ravel())[0, 1]
+    assert simulated_correlation == pytest.approx(np.corrcoef(history.T)[0, 1], abs=0.05)
+
+    # one symbol has no symbol axis, the same generator gives the same paths, the global state is used without one
+    model = simulation.get_return_model(name, history[:, 0])
+    np.testing.assert_array_equal(
+        model.simulate(24, 10, np.random.default_rng(9)), model.simulate(24, 10, np.random.default_rng(9))
+    )
+    np.random.seed(10)
+    first = model.simulate(24, 10)
+    np.random.seed(10)
+    np.testing.assert_array_equal(first, model.simulate(24, 10))
+    assert first.shape == (10, 24)
+    assert model.params["returns"] == name
+
+
+def test_student_t_has_fat_tails():
+    history = 1 + 0.005 + 0.04 * np.random.default_rng(11).standard_t(5, 5000) / np.sqrt(5 / 3)
+    model = simulation.StudentT(history)
+    assert model.dof == pytest.approx(5, abs=1.5)
+
+    returns = model.simulate(100, 2000, np.random.default_rng(12)).ravel() - 1
+    standardized = (returns - returns.mean()) / returns.std()
+    assert (standardized**4).mean() - 3 > 1
+    assert returns.std() == pytest.approx(0.04, rel=0.05)
+
+    # normal history is close to normal returns
+    assert simulation.StudentT(1 + np.random.default_rng(13).normal(0, 0.04, 5000)).dof > 30
+
+
+def test_garch_recovers_volatility_clusters():
+    history = get_garch_history(3000, 0.15, 0.8, seed=14)
+    model = simulation.Garch(history)
+    np.testing.assert_allclose(model.alpha, 0.15, atol=0.05)
+    np.testing.assert_allclose(model.beta, 0.8, atol=0.07)
+    np.testing.assert_allclose(model.correlation[0, 1], 0.6, atol=0.05)
+
+    # large moves follow large moves, unlike for independent returns
+    squared = (model.simulate(240, 500, np.random.default_rng(15))[:, :, 0] - 1 - model.mean[0]) ** 2
+    assert np.corrcoef(squared[:, 1:].ravel(), squared[:, :-1].ravel())[0, 1] > 0.1
+
+
+def test_regime_switching_recovers_regimes():
+    history, turbulent = get_regime_history(3000, seed=16)
+    model = simulation.RegimeSwitching(history)
+    np.testing.assert_allclose(model.means[:, 0], [0.01, -0.01], atol=0.01)
+    np.testing.assert_allclose(np.sqrt(model.covs[:, 0, 0]), [0.03, 0.08], rtol=0.1)
+    np.testing.assert_allclose(model.transition[[0, 1], [1, 0]], [0.02, 0.1], atol=0.03)
+    assert model.turbulent_probability == pytest.approx(turbulent.mean(), abs=0.05)
+
+    # turbulent months cluster in the simulated paths
+    squared = (model.simulate(240, 500, np.random.default_rng(17)) - 1) ** 2
+    assert np.corrcoef(squared[:, 1:].ravel(), squared[:, :-1].ravel())[0, 1] > 0.05
+
+
+def test_invalid_return_models():
+    with pytest.raises(ValueError):
+        simulation.get_return_model("cauchy", np.full(50, 1.01))
+    assert simulation.get_return_model("normal", np.full(50, 1.01)) is None
+    # the fitted models need enough months with varying returns
+    for name in ["student_t", "garch", "regime"]:
+        with pytest.raises(ValueError):
+            simulation.get_return_model(name, 1 + np.random.default_rng(18).normal(0, 0.04, 12))
+        with pytest.raises(ValueError):
+            simulation.get_return_model(name, np.full(50, 1.01))
+
+
+def test_models_implement_simulate():
+    class Incomplete(simulation.ReturnModel):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete(np.full(50, 1.01))
@@ -0,0 +1,73 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import simulation
+
+STOCK_CONFIG = {
+    "symbol": "URTH",
+    "investment_time": 10,
+    "initial_investment": 1000,
+    "monthly_investment": 100,
+    "quarter_investment": 0,
+    "bi_annual_investment": 0,
+    "annual_investment": 500,
+}
+
+
+def test_streaming_matches_array_engine():
+    reference = simulation.simulate_outcome_array(STOCK_CONFIG, 0.006, 0.045, 5000, np.random.default_rng(7))
+    summary = simulation.simulate_outcome_streaming(
+        STOCK_CONFIG, 0.006, 0.045, 5000, chunk_size=700, rng=np.random.default_rng(7)
+    )
+
+    assert list(summary.keys()) == list(reference.keys())
+    for col, stats in reference.items():
+        assert list(summary[col].keys()) == list(stats.keys())
+        if col == "risk":
+            # the value at risk comes from the sketch, the loss probability is exact
+            for stat, value in stats.items():
+                assert summary[col][stat] == pytest.approx(value, rel=0.01, abs=1.0), (col, stat)
+            continue
+        if col == "fan":
+            # the bands come from the sketch, months and input are exact
+            assert summary[col]["months"] == stats["months"]
+            assert summary[col]["input"] == pytest.approx(stats["input"], rel=1e-12)
+            for stat in simulation.FAN_QUANTILES.keys():
+                assert summary[col][stat] == pytest.approx(stats[stat], rel=0.01), (col, stat)
+            continue
+        for stat in ["mean", "std", "min", "max"]:
+            assert summary[col][stat] == pytest.approx(stats[stat], rel=1e-9, abs=1e-6), (col, stat)
+        for stat in ["quantile_25", "quantile_50", "quantile_75"]:
+            assert summary[col][stat] == pytest.approx(stats[stat], rel=0.01, abs=1e-6), (col, stat)
+
+
+def test_sketch_merge_equals_sketch_of_all_values():
+    values = np.random.default_rng(0).normal(0, 50, 10_000)
+    sketch = simulation.QuantileSketch()
+    sketch.add(values)
+    merged = simulation.QuantileSketch()
+    for part in np.array_split(values, 7):
+        part_sketch = simulation.QuantileSketch()
+        part_sketch.add(part)
+        merged.merge(part_sketch)
+
+    assert merged.positive == sketch.positive
+    assert merged.negative == sketch.negative
+    for quantile in [0.01, 0.25, 0.5, 0.75, 0.99]:
+        exact = np.quantile(values, quantile)
+        assert merged.quantile(quantile) == pytest.approx(exact, rel=0.01, abs=0.05)
+
+
+def test_peak_memory_independent_of_iterations():
+    peaks = []
+    for iterations in [4_000, 40_000]:
+        tracemalloc.start()
+        simulation.simulate_outcome_streaming(
+            STOCK_CONFIG, 0.006, 0.045, iterations, chunk_size=2_000, rng=np.random.default_rng(0)
+        )
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    assert peaks[1] < 1.5 * peaks[0]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import simulation
+
+STOCK_CONFIG = {
+    "symbol": "AAA",
+    "investment_time": 10,
+    "initial_investment": 1000,
+    "monthly_investment": 50,
+    "quarter_investment": 25,
+    "bi_annual_investment": 100,
+    "annual_investment": 20,
+}
+
+
+def test_scenario_matches_array_engine():
+    changes = simulation.simulate_changes(0.006, 0.04, 120, 300, np.random.default_rng(0))
+    schedule = simulation.get_contribution_schedule(STOCK_CONFIG, 120)
+    total, returns = simulation.calculate_outcome_array(changes, schedule["flow"])
+    reference = simulation.summarize_outcome_array(schedule, total, returns)
+
+    df_summary = simulation.evaluate_scenarios(changes, simulation.get_scenarios([STOCK_CONFIG], {}))
+
+    assert df_summary.loc[0, "input_amount"] == reference["input_amount"]["mean"]
+    for metric in simulation.SWEEP_METRICS:
+        for stat, value in reference[metric].items():
+            assert df_summary.loc[0, f"{metric}_{stat}"] == pytest.approx(value, rel=1e-10)
+
+
+def test_allocation_matches_portfolio_outcome():
+    # every amount is split 70 / 30
+    stock_configs = [
+        {"symbol": "AAA", "investment_time": 10, "initial_investment": 700, "monthly_investment": 35},
+        {"symbol": "BBB", "investment_time": 10, "initial_investment": 300, "monthly_investment": 15},
+    ]
+    cov = np.array([[0.0016, 0.0008], [0.0008, 0.0025]])
+    changes = simulation.simulate_correlated_changes(np.array([0.006, 0.004]), cov, 120, 300, np.random.default_rng(1))
+    flow = simulation.get_flow_matrix(stock_configs, 120)
+    outcome = simulation.calculate_portfolio_outcome(changes, flow)
+    reference = simulation.summarize_portfolio_outcome(["AAA", "BBB"], flow, outcome, [120, 120])["combined"]
+
+    df_scenarios = simulation.get_scenarios(stock_configs, {})
+    assert df_scenarios.loc[0, "allocation"] == pytest.approx((0.7, 0.3))
+    df_summary = simulation.evaluate_scenarios(changes, df_scenarios)
+
+    for metric in ["final_amount", "annual_return"]:
+        for stat, value in reference[metric].items():
+            assert df_summary.loc[0, f"{metric}_{stat}"] == pytest.approx(value, rel=1e-10)
+
+
+def test_sweep_grid_with_common_random_numbers():
+    grid = {"monthly_investment": [0, 50, 100, 200], "investment_time": [5, 10], "initial_investment": [0, 1000]}
+    df_sweep = simulation.sweep_scenarios(STOCK_CONFIG, 0.006, 0.04**2, grid, 500, np.random.default_rng(2))
+
+    assert len(df_sweep) == 16
+    assert "allocation" not in df_sweep.columns
+
+    # all scenarios share their paths, so more money gives a higher final amount on every path
+    for _, df_group in df_sweep.groupby(["investment_time", "initial_investment"]):
+        for stat in ["min", "quantile_25", "quantile_50", "max"]:
+            assert df_group[f"final_amount_{stat}"].is_monotonic_increasing
+        assert df_group["annual_return_mean"].nunique() == 1
+
+
+def test_invalid_grid():
+    with pytest.raises(ValueError):
+        simulation.get_scenarios([STOCK_CONFIG], {"dividend_reinvestment": [True]})
+    with pytest.raises(ValueError):
+        simulation.get_scenarios([STOCK_CONFIG], {"allocation": [(0.5, 0.5)]})
+    with pytest.raises(ValueError):
+        simulation.get_scenarios([{**STOCK_CONFIG, "lump_sums": [{"month": 3, "amount": 100}]}], {})